@@ -0,0 +1,45 @@
+"""
+Framing of the messages exchanged by ProbeAgents and the
+Aggregator. Each frame is a 4 byte big endian length
+followed by that many bytes of compact JSON.
+
+    hello: {"type": "hello", "agent_id", "session", "sites"}
+           sent by an agent on each connection. sites is a
+           list of [url, check_interval].
+    batch: {"type": "batch", "seq", "rows"} where rows are
+           [url, age_ns, response_time, response_code, phase_times,
+           weight] and age_ns is how long before sending the
+           datapoint was received, so clocks needn't agree.
+    ack:   {"type": "ack", "seq"} sent by the aggregator once
+           every batch up to seq has been applied.
+"""
+
+import asyncio
+import json
+import struct
+
+HEADER = struct.Struct("!I")
+
+# Guards against reading garbage as a huge length
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+async def write_frame(writer: asyncio.StreamWriter, message: dict):
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    writer.write(HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    """
+    RETURNS: message dict
+    RAISES: asyncio.IncompleteReadError if the connection
+            closes, ValueError if the frame is too large
+            or not JSON
+    """
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes is too large")
+
+    return json.loads(await reader.readexactly(size))
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import sys
+from agent_protocol import read_frame, write_frame
+from datapoint_store import PHASES
+from scheduler import Scheduler
+from website import Website
+from website_monitoring_app import App
+
+
+class AgentSession:
+    """
+    What the aggregator remembers of an agent between
+    connections, to skip batches sent again after a reconnect.
+    """
+
+    def __init__(self, session: str):
+        self.session = session
+        self.applied_seq = 0
+        self.duplicate_count = 0
+
+
+class Aggregator(App):
+    """
+    App reporting on datapoints pushed by ProbeAgents rather
+    than probing itself. Datapoints are merged per url, so
+    a website probed by several agents gets one dashboard
+    covering the whole fleet.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 8700, path: str = None, **kwargs
+    ):
+        """
+        PARAMETERS: host, port: Address to listen on
+                    path: Unix socket path to listen on.
+                    Used instead of host and port if given.
+                    kwargs: Passed on to App
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+
+        # url -> Website, created when an agent first mentions it
+        self.websites_by_url = {}
+
+        # agent_id -> AgentSession
+        self.agent_sessions = {}
+        self.connections = set()
+
+        # Connections dropped for sending malformed frames
+        self.rejected_count = 0
+
+        kwargs.setdefault("websites", [])
+        super().__init__(**kwargs)
+
+        for website in self.websites_to_monitor:
+            self.websites_by_url[website.url] = website
+
+    async def monitor_websites(self):
+        """
+        Listens for agents and reports on what they
+        send until cancelled.
+        """
+        self.scheduler = Scheduler()
+
+        for website in self.websites_to_monitor:
+            self.schedule_reports(website)
+
+        if self.path:
+            self.server = await asyncio.start_unix_server(
+                self.handle_agent, path=self.path
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_agent, self.host, self.port
+            )
+
+        coros = [self.scheduler.run(), self.console_writer.render_loop()]
+
+        print(f"Waiting for probe agents...")
+
+        if "linux" in sys.platform:
+            coros.append(self.attach_shutdown_signals())
+
+        try:
+            await asyncio.gather(*coros)
+        finally:
+            self.server.close()
+
+            for writer in self.connections:
+                writer.close()
+
+    def schedule_reports(self, website: Website):
+        website.schedule_tasks(
+            self.scheduler, self.schedules, self.console_writer, probe=False
+        )
+
+    def add_website(self, url: str, check_interval: int) -> Website:
+        website = self.websites_by_url.get(url)
+
+        if website is None:
+            website = Website(url, check_interval, validate=False)
+            self.websites_by_url[url] = website
+            self.websites_to_monitor.append(website)
+            self.console_writer.add_dashboard(website.dashboard)
+
+            if self.scheduler is not None:
+                self.schedule_reports(website)
+
+        return website
+
+    async def handle_agent(self, reader, writer):
+        self.connections.add(writer)
+
+        try:
+            hello = await read_frame(reader)
+            agent_session = self.get_agent_session(hello)
+
+            # All checked before any website is added
+            sites = [self.parse_site(site) for site in hello["sites"]]
+            for url, check_interval in sites:
+                self.add_website(url, check_interval)
+
+            while True:
+                batch = await read_frame(reader)
+                self.apply_batch(agent_session, batch)
+                await write_frame(writer, {"type": "ack", "seq": batch["seq"]})
+
+        except (OSError, asyncio.IncompleteReadError):
+            # Agents reconnect and send unacked batches again
+            pass
+        except (ValueError, KeyError, TypeError):
+            # Bad JSON, oversized frame, missing keys, unknown url
+            # or malformed row. Only this connection is dropped.
+            self.rejected_count += 1
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def parse_site(site) -> tuple:
+        """
+        RETURNS: (url, check_interval) of a hello's site
+        RAISES: ValueError if either is invalid
+        """
+        url, check_interval = site
+
+        if not isinstance(url, str) or not isinstance(check_interval, int):
+            raise ValueError(f"Invalid site {site!r}")
+
+        if check_interval < 1:
+            raise ValueError("check_interval must be a positive integer")
+
+        return url, check_interval
+
+    def parse_row(self, row) -> tuple:
+        """
+        Converts a batch row to the types the stats store.
+
+        RETURNS: (website, age_ns, response_time,
+                 response_code, phase_times, weight) tuple
+        RAISES: KeyError for a url no hello mentioned,
+                ValueError or TypeError for a malformed row
+        """
+        url, age_ns, response_time, response_code, phase_times, weight = row
+
+        if not isinstance(phase_times, dict):
+            raise TypeError(f"Invalid phase_times {phase_times!r}")
+
+        age_ns = int(age_ns)
+        response_code = int(response_code)
+        weight = int(weight)
+
+        # Older than any store, would overflow received_at
+        if age_ns >= 2**62:
+            raise ValueError(f"Invalid age_ns {age_ns}")
+
+        # Status codes, PROBE_TIMEOUT or PROBE_ERROR
+        if not -2 <= response_code <= 999:
+            raise ValueError(f"Invalid response_code {response_code}")
+
+        if weight < 1:
+            raise ValueError(f"Invalid weight {weight}")
+
+        return (
+            self.websites_by_url[url],
+            max(age_ns, 0),
+            float(response_time),
+            response_code,
+            {phase: float(t) for phase, t in phase_times.items() if phase in PHASES},
+            weight,
+        )
+
+    def get_agent_session(self, hello: dict) -> AgentSession:
+        agent_session = self.agent_sessions.get(hello["agent_id"])
+
+        # A restarted agent numbers its batches from 1 again
+        if agent_session is None or agent_session.session != hello["session"]:
+            agent_session = AgentSession(hello["session"])
+            self.agent_sessions[hello["agent_id"]] = agent_session
+
+        return agent_session
+
+    def get_probe_stats(self) -> dict:
+        """
+        RETURNS: dict of the number of agents seen, of
+                 connections dropped for malformed frames and
+                 of batches sent again which were skipped
+        """
+        return {
+            "agents": len(self.agent_sessions),
+            "rejected_connections": self.rejected_count,
+            "duplicate_batches": sum(
+                s.duplicate_count for s in self.agent_sessions.values()
+            ),
+        }
+
+    def apply_batch(self, agent_session: AgentSession, batch: dict):
+        """
+        Adds the datapoints of a batch to the stats of their
+        websites, unless the batch was applied already.
+
+        RAISES: As parse_row, before any datapoint is added
+        """
+        if batch["seq"] <= agent_session.applied_seq:
+            agent_session.duplicate_count += 1
+            return
+
+        rows = [self.parse_row(row) for row in batch["rows"]]
+
+        for website, age_ns, response_time, response_code, phase_times, weight in rows:
+            store = website.stats.data_points
+            received_at = website.clock.monotonic_ns() - age_ns
+
+            # Agents' batches interleave, the store must stay in time order
+            if len(store):
+                received_at = max(
+                    received_at, store.received_at_position(store.end - 1)
+                )
+
+            website.stats.update(
+                {
+                    "response_code": response_code,
+                    "response_time": response_time,
+                    "phase_times": phase_times,
+                    "weight": weight,
+                },
+                received_at=received_at,
+            )
+
+        agent_session.applied_seq = batch["seq"]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Reports on the datapoints pushed by probe agents."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    # Same schedules as website_monitoring_app.py
+    schedule1 = {"frequency": 10, "timeframe": -600}
+    schedule2 = {"frequency": 60, "timeframe": -60 * 60}
+    schedules = [schedule1, schedule2]
+
+    aggregator = Aggregator(host=args.host, port=args.port, path=args.path)
+    aggregator.start_app(schedules=schedules)
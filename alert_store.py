@@ -0,0 +1,143 @@
+import bisect
+import json
+from clock import Clock
+
+
+class Alert(str):
+    """
+    Alert message as yielded by WebStat.alert_generator.
+    Reads as the message, with the details it was made
+    from kept as attributes.
+    """
+
+    def __new__(cls, message: str, timestamp=None, kind: str = None, availability=None):
+        alert = super().__new__(cls, message)
+        alert.timestamp = timestamp
+        alert.kind = kind
+        alert.availability = availability
+        return alert
+
+    def to_dict(self) -> dict:
+        timestamp = self.timestamp
+        if timestamp is not None:
+            timestamp = timestamp.isoformat()
+
+        return {
+            "timestamp": timestamp,
+            "kind": self.kind,
+            "availability": self.availability,
+            "message": str(self),
+        }
+
+
+class AlertStore:
+    """
+    Bounded alert history of a website, oldest first. Only
+    the latest max_size alerts are kept, so a flapping site
+    doesn't grow it forever. Older alerts are appended to
+    spill_path as JSON lines if given, or dropped. They are
+    written spill_batch_size at a time, and by flush().
+
+    Alerts are added in time order, so the timestamps are
+    kept sorted and since() finds its start with bisect.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 100,
+        spill_path: str = None,
+        clock=None,
+        spill_batch_size: int = 100,
+    ):
+        """
+        PARAMETERS: max_size: Max alerts kept in memory
+                    spill_path: Optional file older alerts are appended to
+                    spill_batch_size: Evicted alerts buffered before
+                    being appended to spill_path at once
+                    clock: Clock instance timestamping plain string
+                    messages. Defaults to the real time.
+        """
+        if max_size < 1:
+            raise Exception("An alert store must hold at least 1 alert")
+
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self.clock = clock or Clock()
+        self.spill_batch_size = spill_batch_size
+        self.spill_buffer = []
+
+        # Evicted alerts stay in the lists until
+        # start reaches max_size, then are deleted at once
+        self.alerts = []
+        self.timestamps = []
+        self.start = 0
+
+        self.total_count = 0
+        self.spilled_count = 0
+
+    def __len__(self) -> int:
+        return len(self.alerts) - self.start
+
+    def __iter__(self):
+        for i in range(self.start, len(self.alerts)):
+            yield self.alerts[i]
+
+    def __getitem__(self, index):
+        return self.alerts[self.start :][index]
+
+    def append(self, alert: str):
+        """
+        Adds an alert, evicting the oldest if full.
+        Plain strings are stored as Alerts timestamped now.
+        """
+        if not isinstance(alert, Alert):
+            alert = Alert(alert, timestamp=self.clock.now())
+
+        self.alerts.append(alert)
+        self.timestamps.append(alert.timestamp)
+        self.total_count += 1
+
+        if len(self) > self.max_size:
+            self.evict()
+
+    def evict(self):
+        alert = self.alerts[self.start]
+        self.alerts[self.start] = None
+        self.start += 1
+
+        if self.spill_path is not None:
+            self.spill(alert)
+
+        if self.start >= self.max_size:
+            del self.alerts[: self.start]
+            del self.timestamps[: self.start]
+            self.start = 0
+
+    def spill(self, alert: Alert):
+        self.spill_buffer.append(alert)
+
+        if len(self.spill_buffer) >= self.spill_batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the evicted alerts still buffered to spill_path,
+        one per line.
+        """
+        if not self.spill_buffer:
+            return
+
+        text = "".join(json.dumps(a.to_dict()) + "\n" for a in self.spill_buffer)
+        with open(self.spill_path, "a") as f:
+            f.write(text)
+
+        self.spilled_count += len(self.spill_buffer)
+        self.spill_buffer = []
+
+    def since(self, timestamp) -> list:
+        """
+        RETURNS: list of the alerts kept which were
+                 raised at timestamp or later
+        """
+        i = bisect.bisect_left(self.timestamps, timestamp, lo=self.start)
+        return self.alerts[i:]
@@ -0,0 +1,105 @@
+import datetime
+import json
+import pytest
+from alert_store import Alert, AlertStore
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def make_alerts(count: int) -> list:
+    start = datetime.datetime(2020, 1, 22, 12, 25, 0)
+    alerts = []
+
+    for i in range(count):
+        timestamp = start + datetime.timedelta(minutes=i)
+        kind = "down" if i % 2 == 0 else "back"
+        alerts.append(
+            Alert(f"Site is {kind} {timestamp}", timestamp, kind, availability=0.5)
+        )
+
+    return alerts
+
+
+def test_alert_reads_as_its_message():
+    alert = make_alerts(1)[0]
+
+    assert alert.startswith("Site is down")
+    assert alert.kind == "down"
+    assert alert.availability == 0.5
+
+
+def test_store_keeps_latest_alerts_only():
+    alerts = make_alerts(25)
+    store = AlertStore(max_size=10)
+
+    for alert in alerts:
+        store.append(alert)
+
+    assert len(store) == 10
+    assert list(store) == alerts[-10:]
+    assert store[0] is alerts[15]
+    assert store.total_count == 25
+    # Evicted alerts aren't held on to
+    assert len(store.alerts) < 20
+
+
+def test_since_returns_alerts_from_timestamp():
+    alerts = make_alerts(25)
+    store = AlertStore(max_size=10)
+
+    for alert in alerts:
+        store.append(alert)
+
+    assert store.since(alerts[20].timestamp) == alerts[20:]
+    assert store.since(alerts[0].timestamp) == alerts[15:]
+    assert store.since(alerts[-1].timestamp + datetime.timedelta(seconds=1)) == []
+
+
+def test_evicted_alerts_spill_to_file(tmp_path):
+    spill_path = tmp_path / "alerts.jsonl"
+    alerts = make_alerts(5)
+    store = AlertStore(max_size=2, spill_path=str(spill_path))
+
+    for alert in alerts:
+        store.append(alert)
+
+    # Buffered until a batch is full
+    assert not spill_path.exists()
+    store.flush()
+
+    spilled = [json.loads(line) for line in spill_path.read_text().splitlines()]
+
+    assert store.spilled_count == 3
+    assert [record["message"] for record in spilled] == alerts[:3]
+    assert spilled[1]["kind"] == "back"
+
+
+def test_spilled_alerts_are_written_in_batches(tmp_path):
+    spill_path = tmp_path / "alerts.jsonl"
+    store = AlertStore(max_size=2, spill_path=str(spill_path), spill_batch_size=2)
+
+    for alert in make_alerts(5):
+        store.append(alert)
+
+    # Third evicted alert waits for the next batch
+    assert len(spill_path.read_text().splitlines()) == 2
+    assert store.spilled_count == 2
+    assert len(store.spill_buffer) == 1
+
+
+def test_alert_without_timestamp_to_dict():
+    assert Alert("site is down", kind="down").to_dict()["timestamp"] is None
+
+
+def test_plain_messages_are_timestamped(virtual_clock):
+    store = AlertStore(clock=virtual_clock)
+    store.append("Maintenance")
+
+    assert store[0].timestamp == virtual_clock.now()
+
+
+def test_store_must_hold_an_alert():
+    with pytest.raises(Exception):
+        AlertStore(max_size=0)
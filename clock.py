@@ -0,0 +1,56 @@
+import datetime
+import math
+import time
+
+
+class Clock:
+    """
+    Source of time for WebStat and Website instances.
+
+    now() gives the local datetime used in alerts and report
+    timestamps. monotonic_ns() gives the timestamps held in
+    a DatapointStore.
+    """
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+    def monotonic_ns(self) -> int:
+        return time.monotonic_ns()
+
+
+class VirtualClock(Clock):
+    """
+    A clock which only moves when advanced. Used with
+    simulation.VirtualTimeEventLoop so asyncio.sleep calls
+    complete as soon as nothing else is left to run.
+    """
+
+    def __init__(self, start: datetime.datetime = None):
+        """
+        PARAMETERS: start: datetime returned by now() before
+                    the clock is first advanced. Defaults to
+                    the current local time.
+        """
+        self.start = start or datetime.datetime.now()
+        self.elapsed_ns = 0
+
+    def now(self) -> datetime.datetime:
+        return self.start + datetime.timedelta(microseconds=self.elapsed_ns // 1000)
+
+    def monotonic_ns(self) -> int:
+        return self.elapsed_ns
+
+    def time(self) -> float:
+        """
+        RETURNS: Elapsed seconds as float, as asyncio loops expect
+        """
+        return self.elapsed_ns / 1e9
+
+    def advance(self, seconds: float):
+        if seconds < 0:
+            raise Exception("A clock can't go backwards")
+
+        # Rounding down could leave a due timer a fraction
+        # of a nanosecond in the future forever
+        self.elapsed_ns += math.ceil(seconds * 1e9)
@@ -1,10 +1,25 @@
+import asyncio
+import httpx
 import pytest
 import itertools
 from web_stats import WebStat
+from datapoint_store import DatapointStore
+from latency_histogram import LatencyHistogram
+from rollup import RollupTier
+from clock import VirtualClock
+from dns_cache import DNSCache
+import socket
+from simulation import build_simulated_app, VirtualTimeEventLoop, NullConsoleWriter
+from aggregator import Aggregator
 from console_writer import ConsoleWriter, WebPerformanceDashboard
 from website import Website
 from collections import deque
 import datetime
+import time
+import io
+from terminal_renderer import TerminalRenderer
+import http.server
+import threading
 
 """
 Fixtures
@@ -103,25 +118,19 @@ def WebStat_2mins_datapoints_25():
 
 
 @pytest.fixture
-def WebStat_10mins_balanced_datapoints(datetimes_dict):
+def WebStat_10mins_balanced_datapoints(monotonic_ns_dict):
     """Returns a 10 min max observation time webstat"""
     WebStat_2mins = WebStat(600)
 
     # Manually add to force average
-    for dt_key, response_time in [
-        ("minus_10", -10.5),
-        ("minus_2", -2.5),
-        ("plus_2", 2.5),
-        ("plus_10", 10.5),
+    for ns_key, response_time in [
+        ("now_minus_10", -10.5),
+        ("now_minus_2", -2.5),
+        ("now_plus_2", 2.5),
+        ("now_plus_10", 10.5),
     ]:
 
-        WebStat_2mins.data_points.append(
-            {
-                "response_code": 200,
-                "response_time": response_time,
-                "received_at": datetimes_dict[dt_key],
-            }
-        )
+        WebStat_2mins.data_points.append(monotonic_ns_dict[ns_key], response_time, 200)
 
     return WebStat_2mins
 
@@ -147,6 +156,24 @@ def datetimes_dict(year=2019, month=11, day=25, hour=23, minute=44, second=33):
     return d
 
 
+@pytest.fixture(scope="session")
+def monotonic_ns_dict():
+    """Monotonic timestamps as held in a DatapointStore"""
+
+    now = time.monotonic_ns()
+    minute = 60 * 10**9
+
+    d = {
+        "now_minus_10": now - 10 * minute,
+        "now_minus_2": now - 2 * minute,
+        "now": now,
+        "now_plus_2": now + 2 * minute,
+        "now_plus_10": now + 10 * minute,
+    }
+
+    return d
+
+
 @pytest.fixture(scope="function")
 def website():
     """Returns a an empty generator built from a deque obj"""
@@ -155,33 +182,168 @@ def website():
 
 
 @pytest.fixture
-def WebStat_10mins_recent_datapoints(datetimes_dict):
+def offline_website(monkeypatch):
+    """Returns a Website built without checking its url can be reached"""
+    monkeypatch.setattr(Website, "validate_url", lambda self, url: None)
+    return Website(url="http://example.com", check_interval=5)
+
+
+@pytest.fixture
+def mock_client():
+    """
+    Returns an httpx.AsyncClient answering without network access.
+    down.example refuses connections and slow.example takes half a second.
+    """
+
+    async def handler(request):
+        if request.url.host == "down.example":
+            raise httpx.ConnectError("Connection refused", request=request)
+
+        if request.url.host == "slow.example":
+            await asyncio.sleep(0.5)
+
+        return httpx.Response(200)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def WebStat_10mins_recent_datapoints(monotonic_ns_dict):
     """Returns 25 datapoints"""
     ws = WebStat(600)
 
-    for k in ["now_minus_2", "now_minus_10", "now_plus_2", "now_plus_10"]:
-
-        ws.data_points.append(
-            {
-                "response_code": 200,
-                "response_time": 0.05,
-                "received_at": datetimes_dict[k],
-            }
-        )
+    # The "now" datapoint increases avg
+    for k, response_time in [
+        ("now_minus_10", 0.05),
+        ("now_minus_2", 0.05),
+        ("now", 1.5),
+        ("now_plus_2", 0.05),
+        ("now_plus_10", 0.05),
+    ]:
 
-    # Last datapoint increases avg
-    ws.data_points.append(
-        {
-            "response_code": 200,
-            "response_time": 1.5,
-            "received_at": datetimes_dict["now"],
-        }
-    )
+        ws.data_points.append(monotonic_ns_dict[k], response_time, 200)
 
     return ws
 
 
+@pytest.fixture
+def datapoint_store():
+    """Returns a DatapointStore holding 10 datapoints, one per second"""
+    store = DatapointStore()
+
+    for i in range(10):
+        store.append(i * 10**9, i / 10, 200 if i % 2 else 500)
+
+    return store
+
+
+@pytest.fixture
+def latency_histogram():
+    """Returns a LatencyHistogram holding 1ms to 1s in 1ms steps"""
+    histogram = LatencyHistogram()
+
+    for i in range(1, 1001):
+        histogram.add(i / 1000)
+
+    return histogram
+
+
+@pytest.fixture
+def minute_rollup_tier():
+    """Returns a 1 minute RollupTier holding datapoints in 2 buckets"""
+    tier = RollupTier(60, 3600)
+
+    for second, response_time, response_code in [
+        (0, 0.1, 200),
+        (30, 0.2, 200),
+        (59, 0.3, 500),
+        (60, 0.9, 200),
+        (119, 2.0, 200),
+    ]:
+        tier.add(second * 10**9, response_time, response_code)
+
+    return tier
+
+
+@pytest.fixture
+def virtual_clock():
+    """Returns a VirtualClock starting at 12:25 on 22/01/2020"""
+    return VirtualClock(start=datetime.datetime(2020, 1, 22, 12, 25, 0))
+
+
+@pytest.fixture
+def dns_cache(virtual_clock):
+    """
+    Returns a DNSCache of 2 hosts resolving without network access.
+    Hosts ending in .invalid fail. Lookups are listed in dns_cache.lookups.
+    """
+    cache = DNSCache(ttl=60, negative_ttl=10, max_size=2, clock=virtual_clock)
+    cache.lookups = []
+
+    async def getaddrinfo(host):
+        cache.lookups.append(host)
+        await asyncio.sleep(0.01)
+
+        if host.endswith(".invalid"):
+            raise socket.gaierror("Name or service not known")
+
+        return ("192.0.2.1",)
+
+    cache.getaddrinfo = getaddrinfo
+    return cache
+
+
+@pytest.fixture
+def virtual_loop(virtual_clock):
+    """Returns a VirtualTimeEventLoop driven by virtual_clock"""
+    loop = VirtualTimeEventLoop(virtual_clock)
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def aggregator():
+    """Returns an Aggregator listening on a free local port"""
+    return Aggregator(port=0, console_writer=NullConsoleWriter())
+
+
+@pytest.fixture
+def simulated_app(virtual_clock):
+    """Returns an App monitoring 3 always available SimulatedWebsites"""
+    return build_simulated_app(3, 10, virtual_clock)
+
+
 @pytest.fixture
 def writer():
     w = ConsoleWriter()
     return w
+
+
+@pytest.fixture
+def renderer():
+    """Returns a TerminalRenderer writing to a StringIO"""
+    return TerminalRenderer(io.StringIO())
+
+
+@pytest.fixture
+def local_http_server():
+    """Yields the url of an http.server answering 200 on 127.0.0.1"""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+
+    server.shutdown()
+    server.server_close()
@@ -1,4 +1,8 @@
-import os
+import asyncio
+import bisect
+import math
+from alert_store import AlertStore
+from terminal_renderer import TerminalRenderer
 
 
 DASHBOARD_WIDTH = 50
@@ -11,10 +15,33 @@ class WebPerformanceDashboard:
     complex text formatting here.
     """
 
-    def __init__(self):
-
+    def __init__(self, alert_store: AlertStore = None):
+        """
+        PARAMETERS: alert_store: Holds the persisted messages.
+                    Defaults to an AlertStore of 100 alerts.
+        """
         self.data = {}
-        self.persisted_messages = []
+        self.persisted_messages = (
+            alert_store if alert_store is not None else AlertStore()
+        )
+
+        # Counts messages added, the store stops growing
+        self.persisted_message_count = 0
+
+        # Changed since last drawn
+        self.dirty = False
+
+        # key -> (value, line) of the fields last yielded,
+        # so only changed values are formatted again
+        self.field_lines = {}
+
+        # Formatted by ConsoleWriter, then kept until the
+        # data or the persisted messages change
+        self.body_block = None
+        self.body_cache = {}
+        self.alert_block = None
+        self.alert_cache = {}
+        self.alert_block_count = None
 
         # Convert seconds to minutes. Returns positive int.
         self.secToMin = lambda seconds: abs(int(seconds / 60))
@@ -39,6 +66,7 @@ class WebPerformanceDashboard:
 
     def add_persisted_message(self, msg: str):
         self.persisted_messages.append(msg)
+        self.persisted_message_count += 1
 
     def yield_dashboard_body_lines(self):
         """
@@ -57,17 +85,34 @@ class WebPerformanceDashboard:
             for k, v in self.data.items():
                 # Here I skip certain keys
                 if k not in ["url", "timestamp", "timeframe"]:
+                    yield self.format_field(k, v)
 
-                    if v is None:
-                        # If there is no value yet
-                        yield f"{k} -> Please wait"
-                    # Custom % formatting for availability
-                    elif k == "availability":
-                        yield f"{k} -> " + "{0:.0%}".format(v)
+    def format_field(self, k, v) -> str:
+        """
+        RETURNS: Text line of a data field, reused
+                 from the last report if v is unchanged
+        """
+        cached = self.field_lines.get(k)
+        if cached is not None and type(cached[0]) is type(v) and cached[0] == v:
+            return cached[1]
+
+        if v is None:
+            # If there is no value yet
+            line = f"{k} -> Please wait"
+        # Custom % formatting for availability
+        elif k == "availability":
+            line = f"{k} -> " + "{0:.0%}".format(v)
+
+        # Response times are floats in seconds
+        elif isinstance(v, float):
+            line = f"{k} -> " + "{0:.3f}s".format(v)
+
+        # Basic text format
+        else:
+            line = f"{k} -> {v}"
 
-                    # Basic text format
-                    else:
-                        yield f"{k} -> {v}"
+        self.field_lines[k] = (v, line)
+        return line
 
 
 class ConsoleWriter:
@@ -76,7 +121,23 @@ class ConsoleWriter:
     of multiple dashboards. It enforces text formatting.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        stream=None,
+        max_fps: float = 2,
+        page_size: int = 3,
+        page_seconds: float = 10,
+        worst_count: int = 10,
+    ):
+        """
+        PARAMETERS: stream: Text stream to write to.
+                    Defaults to sys.stdout.
+                    max_fps: Max frames drawn per second
+                    page_size: Dashboards shown side by side
+                    page_seconds: Seconds each page is shown
+                    before turning to the next
+                    worst_count: Rows of the worst availability table
+        """
         self.BOLD_LINE = "=" * 50
         self.SINGLE_LINE = "-" * 50
         self.WELCOME_MSG = "Website monitoring application"
@@ -84,14 +145,143 @@ class ConsoleWriter:
         self.APPLICATION_TITLE = "Web Monitoring Application"
         self.web_performance_dashboards = []
 
+        # Formatted header and what it was formatted for
+        self.header_lines = None
+        self.header_key = None
+
+        # Only redraws what changed between frames
+        self.renderer = TerminalRenderer(stream)
+
+        # Reports mark their dashboard dirty, render_loop draws.
+        # The event is made by render_loop, on the running loop,
+        # frames asked for before that are drawn when it starts.
+        self.max_fps = max_fps
+        self.frame_ready = None
+        self.frame_requested = False
+
+        # Only the dashboards of the current page are formatted
+        self.page_size = page_size
+        self.page_seconds = page_seconds
+        self.page = 0
+
+        # Sorted (availability, position) of the dashboards
+        # reported on, worst first. Kept up to date as
+        # reports come in rather than sorted each frame.
+        self.worst_count = worst_count
+        self.availability_ranking = []
+        self.ranking_keys = {}
+        self.dashboard_positions = {}
+
+        # Formatted table, None once its rows changed
+        self.worst_lines = None
+        self.worst_key = None
+
     def add_dashboard(self, wp_dashboard: WebPerformanceDashboard):
+        self.dashboard_positions[wp_dashboard] = len(self.web_performance_dashboards)
         self.web_performance_dashboards.append(wp_dashboard)
 
+    def mark_dirty(self, wp_dashboard: WebPerformanceDashboard):
+        """
+        Has the dashboard drawn with the next frame.
+        """
+        wp_dashboard.dirty = True
+        wp_dashboard.body_block = None
+        self.update_ranking(wp_dashboard)
+        self.request_frame()
+
+    def request_frame(self):
+        if self.frame_ready is None:
+            self.frame_requested = True
+        else:
+            self.frame_ready.set()
+
+    def update_ranking(self, wp_dashboard: WebPerformanceDashboard):
+        """
+        Moves the dashboard to its place in
+        self.availability_ranking, in O(log n) searches.
+        The worst availability table is formatted again
+        only if it moved in or out of its rows.
+        """
+        old_key = self.ranking_keys.pop(wp_dashboard, None)
+        if old_key is not None:
+            i = bisect.bisect_left(self.availability_ranking, old_key)
+            del self.availability_ranking[i]
+
+            if i < self.worst_count:
+                self.worst_lines = None
+
+        availability = wp_dashboard.data.get("availability")
+        if availability is not None:
+            key = (availability, self.dashboard_positions[wp_dashboard])
+            i = bisect.bisect_left(self.availability_ranking, key)
+            self.availability_ranking.insert(i, key)
+            self.ranking_keys[wp_dashboard] = key
+
+            if i < self.worst_count:
+                self.worst_lines = None
+
+    def get_page_count(self) -> int:
+        return max(1, math.ceil(len(self.web_performance_dashboards) / self.page_size))
+
+    def get_visible_dashboards(self) -> list:
+        start = self.page * self.page_size
+        return self.web_performance_dashboards[start : start + self.page_size]
+
+    def show_page(self, page: int):
+        """
+        Has the given page, counted from 0 and
+        wrapping around, drawn with the next frame.
+        """
+        self.page = page % self.get_page_count()
+        self.request_frame()
+
+    async def render_loop(self):
+        """
+        Draws a frame whenever dashboards were marked dirty,
+        at most max_fps times a second, until cancelled.
+        However many reports come in between frames,
+        each frame is drawn once.
+
+        Pages are turned every page_seconds.
+        """
+        loop = asyncio.get_running_loop()
+        next_page_at = loop.time() + self.page_seconds
+
+        self.frame_ready = asyncio.Event()
+        if self.frame_requested:
+            self.frame_ready.set()
+
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.frame_ready.wait(), max(next_page_at - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+            if loop.time() >= next_page_at:
+                next_page_at = loop.time() + self.page_seconds
+
+                if self.get_page_count() > 1:
+                    self.show_page(self.page + 1)
+
+            if not self.frame_ready.is_set():
+                continue
+
+            self.frame_ready.clear()
+
+            self.write_dashboards_to_console()
+
+            for wp_dashboard in self.web_performance_dashboards:
+                wp_dashboard.dirty = False
+
+            await asyncio.sleep(1 / self.max_fps)
+
     def clear_screen(self):
         """
         Clears the console screen.
         """
-        os.system("cls -y")
+        self.renderer.clear()
 
     def greet(self):
         """
@@ -99,13 +289,17 @@ class ConsoleWriter:
         """
         self.clear_screen()
         greeting = f"{self.BOLD_LINE}\n{self.WELCOME_MSG}\n{self.SINGLE_LINE}"
-        print(greeting)
+        print(greeting, file=self.renderer.stream)
 
     def goodbye(self):
         """
         Application outro
         """
-        print(f"{self.SINGLE_LINE}\n{self.GOODBYE_MSG}\n{self.BOLD_LINE}")
+        self.renderer.close()
+        print(
+            f"{self.SINGLE_LINE}\n{self.GOODBYE_MSG}\n{self.BOLD_LINE}",
+            file=self.renderer.stream,
+        )
 
     def yield_application_header_lines(self):
         """
@@ -113,8 +307,22 @@ class ConsoleWriter:
         while represent single or multiple dashboards
         text representation. 
         """
-        # The lenght of a header covering all dashboards
-        multi_dashboard_length = len(self.web_performance_dashboards) * DASHBOARD_WIDTH
+        # Only changes with the number of dashboards
+        header_key = (
+            len(self.get_visible_dashboards()),
+            self.page,
+            self.get_page_count(),
+        )
+
+        if header_key != self.header_key:
+            self.header_lines = list(self.format_application_header_lines())
+            self.header_key = header_key
+
+        yield from self.header_lines
+
+    def format_application_header_lines(self):
+        # The lenght of a header covering the page's dashboards
+        multi_dashboard_length = self.get_frame_width()
 
         yield "=" * multi_dashboard_length
 
@@ -125,32 +333,80 @@ class ConsoleWriter:
             max_length=multi_dashboard_length,
         )
 
+        page_count = self.get_page_count()
+        if page_count > 1:
+            yield self.format_line(
+                f"Page {self.page + 1} of {page_count}",
+                close_lines=True,
+                pad_lines=True,
+                max_length=multi_dashboard_length,
+            )
+
         yield "=" * multi_dashboard_length
 
-    def write_dashboards_to_console(self):
+    def get_frame_width(self) -> int:
+        return max(1, len(self.get_visible_dashboards())) * DASHBOARD_WIDTH
+
+    def yield_frame_lines(self):
         """
-        Yields console text strings one by one
-        while represent single or multiple dashboards
-        text representation. 
+        Yields every line of a frame: the header, the
+        dashboards of the current page and the table
+        of worst availabilities.
         """
+        yield from self.yield_application_header_lines()
+        yield from self.yield_dashboard_body_lines()
+        yield from self.yield_alert_history_lines()
+        yield from self.yield_worst_availability_lines()
 
-        # Clear screen before outputting
-        self.clear_screen()
+    def yield_worst_availability_lines(self):
+        """
+        Yields a table of the worst_count websites with the
+        lowest availability, one row each.
+        """
+        if len(self.web_performance_dashboards) <= 1:
+            return
 
-        # Print the multi dashboard header
-        for header_line in self.yield_application_header_lines():
-            print(header_line)
+        # The title counts every ranked website
+        worst_key = (len(self.availability_ranking), self.get_frame_width())
 
-        # Print dashboard bodies
-        for dashboard_body_line in self.yield_dashboard_body_lines():
-            print(dashboard_body_line)
+        if self.worst_lines is None or worst_key != self.worst_key:
+            self.worst_lines = list(self.format_worst_availability_lines())
+            self.worst_key = worst_key
 
-        # Print alert history
-        for alert in self.yield_alert_history_lines():
-            print(alert)
+        yield from self.worst_lines
 
-        # Avoid blinking cursor on the output
-        print("\n")
+    def format_worst_availability_lines(self):
+        width = self.get_frame_width()
+        worst = self.availability_ranking[: self.worst_count]
+
+        yield self.format_line(
+            f"Worst availability ({len(worst)} of {len(self.availability_ranking)})",
+            close_lines=True,
+            pad_lines=True,
+            max_length=width,
+        )
+        yield "-" * width
+
+        for availability, position in worst:
+            url = self.web_performance_dashboards[position].data["url"]
+            row = " {0:>5.0%}  {1}".format(availability, url)
+
+            # Left aligned, unlike the dashboards
+            row = self.format_line(
+                row, close_lines=False, pad_lines=False, max_length=width - 2
+            )
+            yield "|" + row.ljust(width - 2) + "|"
+
+        yield "=" * width
+
+    def write_dashboards_to_console(self):
+        """
+        Yields console text strings one by one
+        while represent single or multiple dashboards
+        text representation. 
+        """
+        # Drawn over the previous frame, no clearing
+        self.renderer.render(list(self.yield_frame_lines()))
 
     def yield_alert_history_lines(self):
         """
@@ -161,20 +417,14 @@ class ConsoleWriter:
         History of alerts yielded here.
         """
 
-        #  Concatenate the lienes from each dashboard
-        # and format before printing multi dashboard line
-        dashboard_persisted_msg_generators = [
-            db.yield_persisted_messages() for db in self.web_performance_dashboards
+        #  Concatenate the lienes from each dashboard,
+        # formatted already
+        alert_blocks = [
+            self.get_alert_block(db) for db in self.get_visible_dashboards()
         ]
 
-        for line_items in zip(*dashboard_persisted_msg_generators):
-            multi_db_body_line = ""
-            for line in line_items:
-                multi_db_body_line += self.format_line(
-                    line, close_lines=True, pad_lines=True
-                )
-
-            yield multi_db_body_line
+        for line_items in zip(*alert_blocks):
+            yield "".join(line_items)
 
     def yield_dashboard_body_lines(self):
         """
@@ -185,21 +435,60 @@ class ConsoleWriter:
         Main body lines yielded here.
         """
 
-        #  Concatenate the lienes from each dashboard
-        # and format before printing multi dashboard line
-        dashboard_body_generators = [
-            db.yield_dashboard_body_lines() for db in self.web_performance_dashboards
-        ]
+        #  Concatenate the lienes from each dashboard,
+        # formatted already
+        body_blocks = [self.get_body_block(db) for db in self.get_visible_dashboards()]
 
-        for line_items in zip(*dashboard_body_generators):
+        for line_items in zip(*body_blocks):
+            yield "".join(line_items)
 
-            multi_db_body_line = ""
-            for line in line_items:
-                multi_db_body_line += self.format_line(
-                    line, close_lines=True, pad_lines=True
-                )
+    def get_body_block(self, db: WebPerformanceDashboard) -> list:
+        """
+        RETURNS: Formatted body lines of db, formatted
+                 again only after it was marked dirty
+        """
+        if db.body_block is None:
+            db.body_block, db.body_cache = self.format_block(
+                db.yield_dashboard_body_lines(), db.body_cache
+            )
+
+        return db.body_block
+
+    def get_alert_block(self, db: WebPerformanceDashboard) -> list:
+        """
+        RETURNS: Formatted alert history lines of db, formatted
+                 again only when persisted messages were added
+        """
+        if db.alert_block_count != db.persisted_message_count:
+            db.alert_block, db.alert_cache = self.format_block(
+                db.yield_persisted_messages(), db.alert_cache
+            )
+            db.alert_block_count = db.persisted_message_count
+
+        return db.alert_block
+
+    def format_block(self, lines, cache: dict) -> tuple:
+        """
+        Formats lines of a dashboard, reusing those
+        formatted for the previous block.
+
+        PARAMETERS: lines: Iterable of text strings
+                    cache: dict of text string -> formatted
+                    line, as returned with the previous block
+        RETURNS: (list of formatted lines, cache of this block)
+        """
+        block = []
+        block_cache = {}
+
+        for line in lines:
+            formatted = cache.get(line)
+            if formatted is None:
+                formatted = self.format_line(line, close_lines=True, pad_lines=True)
+
+            block.append(formatted)
+            block_cache[line] = formatted
 
-            yield multi_db_body_line
+        return block, block_cache
 
     def truncate_lines(self, text_string, max_length):
         """
@@ -1,4 +1,8 @@
+import asyncio
+import io
 import pytest
+from console_writer import WebPerformanceDashboard
+from simulation import NullConsoleWriter
 
 DASHBOARD_WIDTH = 50
 
@@ -24,3 +28,164 @@ def test_console_writer_format_line_pads_and_closes_correctly(
 
     if close_lines:
         assert actual[0] == "|" and actual[-1] == "|"
+
+
+def test_console_writer_only_redraws_changed_lines(console_writer):
+    console_writer.renderer.stream = io.StringIO()
+    dashboard = console_writer.web_performance_dashboards[0]
+    dashboard.data.update({"timeframe": -600, "timestamp": "12:25:00"})
+
+    console_writer.write_dashboards_to_console()
+    first_frame = console_writer.renderer.stream.getvalue()
+
+    dashboard.add_persisted_message("Site is down")
+    console_writer.write_dashboards_to_console()
+    second_frame = console_writer.renderer.stream.getvalue()[len(first_frame) :]
+
+    assert "Site is down" in second_frame
+    assert "learning.oreilly.com" not in second_frame
+
+
+def test_render_loop_draws_reports_between_frames_once(virtual_loop):
+    writer = NullConsoleWriter()
+    dashboards = [WebPerformanceDashboard() for _ in range(3)]
+    for dashboard in dashboards:
+        writer.add_dashboard(dashboard)
+
+    async def report_twice():
+        render_loop = asyncio.ensure_future(writer.render_loop())
+
+        for _ in range(2):
+            for dashboard in dashboards:
+                writer.mark_dirty(dashboard)
+            await asyncio.sleep(0.1)
+
+        await asyncio.sleep(1)
+        render_loop.cancel()
+        await asyncio.gather(render_loop, return_exceptions=True)
+
+    virtual_loop.run_until_complete(report_twice())
+
+    # One frame for the first reports, one capped by max_fps
+    assert writer.frames_rendered == 2
+    assert not any(dashboard.dirty for dashboard in dashboards)
+
+
+def add_reported_dashboards(writer, availabilities):
+    dashboards = []
+
+    for i, availability in enumerate(availabilities):
+        dashboard = WebPerformanceDashboard()
+        dashboard.data = {
+            "url": f"http://site-{i}.com",
+            "timeframe": -600,
+            "timestamp": "12:25:00",
+            "availability": availability,
+        }
+        writer.add_dashboard(dashboard)
+        writer.mark_dirty(dashboard)
+        dashboards.append(dashboard)
+
+    return dashboards
+
+
+def test_worst_availability_ranking_follows_reports(writer):
+    dashboards = add_reported_dashboards(writer, [1.0, 0.5, 0.9])
+    assert writer.availability_ranking == [(0.5, 1), (0.9, 2), (1.0, 0)]
+
+    dashboards[0].data["availability"] = 0.2
+    writer.mark_dirty(dashboards[0])
+    assert writer.availability_ranking == [(0.2, 0), (0.5, 1), (0.9, 2)]
+
+    rows = list(writer.yield_worst_availability_lines())[2:-1]
+    assert "http://site-0.com" in rows[0]
+    assert "http://site-2.com" in rows[-1]
+
+
+def test_worst_availability_table_is_kept_until_its_rows_change(writer):
+    writer.worst_count = 2
+    dashboards = add_reported_dashboards(writer, [0.1, 0.2, 0.9, 1.0])
+    table = list(writer.yield_worst_availability_lines())
+
+    # Outside the worst rows
+    dashboards[3].data["availability"] = 0.95
+    writer.mark_dirty(dashboards[3])
+    assert writer.worst_lines is not None
+    assert list(writer.yield_worst_availability_lines()) == table
+
+    dashboards[3].data["availability"] = 0.0
+    writer.mark_dirty(dashboards[3])
+    assert writer.worst_lines is None
+
+    rows = list(writer.yield_worst_availability_lines())[2:-1]
+    assert "http://site-3.com" in rows[0]
+    assert "http://site-0.com" in rows[1]
+
+
+def test_only_dashboards_of_current_page_are_drawn(writer):
+    add_reported_dashboards(writer, [1.0] * 7)
+    writer.page_size = 3
+
+    writer.show_page(2)
+    body = "\n".join(writer.yield_dashboard_body_lines())
+
+    assert writer.get_page_count() == 3
+    assert "http://site-6.com" in body
+    assert "http://site-5.com" not in body
+    assert len(body.splitlines()[0]) == DASHBOARD_WIDTH
+
+
+def test_render_loop_turns_pages(virtual_loop):
+    writer = NullConsoleWriter()
+    writer.page_size = 2
+    add_reported_dashboards(writer, [1.0] * 5)
+
+    async def watch_pages():
+        render_loop = asyncio.ensure_future(writer.render_loop())
+        await asyncio.sleep(writer.page_seconds * 2 + 1)
+        render_loop.cancel()
+        await asyncio.gather(render_loop, return_exceptions=True)
+
+    virtual_loop.run_until_complete(watch_pages())
+
+    assert writer.page == 2
+    assert writer.frames_rendered == 3
+
+
+def test_dashboard_lines_are_formatted_again_only_when_changed(writer):
+    dashboard = add_reported_dashboards(writer, [1.0])[0]
+
+    first_block = writer.get_body_block(dashboard)
+    assert writer.get_body_block(dashboard) is first_block
+
+    dashboard.data = dict(dashboard.data, availability=0.5)
+    writer.mark_dirty(dashboard)
+    second_block = writer.get_body_block(dashboard)
+
+    assert second_block is not first_block
+    # Unchanged lines are reused
+    assert second_block[0] is first_block[0]
+    assert "50%" in second_block[-1]
+
+
+def test_alert_block_follows_persisted_messages(writer):
+    dashboard = add_reported_dashboards(writer, [1.0])[0]
+    first_block = writer.get_alert_block(dashboard)
+
+    dashboard.add_persisted_message("Site is down")
+
+    assert "Site is down" in writer.get_alert_block(dashboard)[3]
+    assert len(writer.get_alert_block(dashboard)) == len(first_block)
+
+
+def test_header_is_formatted_again_only_when_dashboards_change(writer):
+    add_reported_dashboards(writer, [1.0])
+    header_lines = list(writer.yield_application_header_lines())
+    assert writer.header_lines is not None
+    cached_lines = writer.header_lines
+
+    list(writer.yield_application_header_lines())
+    assert writer.header_lines is cached_lines
+
+    add_reported_dashboards(writer, [1.0])
+    assert list(writer.yield_application_header_lines()) != header_lines
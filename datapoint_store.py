@@ -0,0 +1,177 @@
+from array import array
+from bisect import bisect_left
+import math
+
+# Phases of a request timed by probes, each held in its own column
+PHASES = ("dns", "connect", "tls", "ttfb", "transfer")
+
+
+class DatapointStore:
+    """
+    DatapointStore holds probe results in parallel typed
+    columns rather than one dict per datapoint:
+
+        received_at:    monotonic timestamps in nanoseconds
+        response_times: response times in seconds
+        response_codes: HTTP status codes
+        phase_times:    one column of seconds per phase in PHASES,
+                        NaN where the probe didn't go through it,
+                        e.g. connect on a reused connection
+        weights:        seconds of probing each datapoint stands
+                        for, see TimeframeAggregate. 1 unless the
+                        check interval varies.
+
+    Datapoints are appended on the right in time order and
+    dropped from the left by moving self.head, so the
+    received_at column stays sorted and window boundaries
+    are found by binary search.
+
+    Positions are absolute: the position of a datapoint
+    never changes while it is held, even after the columns
+    are compacted.
+    """
+
+    def __init__(self):
+        self.received_at = array("q")
+        self.response_times = array("d")
+        self.response_codes = array("h")
+        self.phase_times = {phase: array("d") for phase in PHASES}
+        self.weights = array("q")
+
+        # Index into the columns of the oldest datapoint held
+        self.head = 0
+
+        # Number of datapoints compacted out of the columns
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.received_at) - self.head
+
+    def __iter__(self):
+        """
+        Yields (received_at, response_time, response_code)
+        tuples, oldest first.
+        """
+        for i in range(self.head, len(self.received_at)):
+            yield (self.received_at[i], self.response_times[i], self.response_codes[i])
+
+    @property
+    def start(self) -> int:
+        """
+        Position of the oldest datapoint held.
+        """
+        return self.offset + self.head
+
+    @property
+    def end(self) -> int:
+        """
+        Position the next appended datapoint will take.
+        """
+        return self.offset + len(self.received_at)
+
+    def append(
+        self,
+        received_at: int,
+        response_time: float,
+        response_code: int,
+        phase_times: dict = None,
+        weight: int = 1,
+    ):
+        """
+        PARAMETERS: received_at: monotonic timestamp in nanoseconds.
+                    Must not be older than the last appended datapoint.
+                    response_time: In seconds
+                    response_code: HTTP status code
+                    phase_times: Optional dict of seconds by phase
+                    weight: Positive integer, e.g. the check interval
+                    the datapoint was probed at
+        RAISES: TypeError or ValueError, before any column
+                is appended to so they stay aligned
+        """
+        phase_times = phase_times or {}
+        phase_values = [phase_times.get(phase, math.nan) for phase in PHASES]
+
+        if not (
+            isinstance(received_at, int)
+            and isinstance(response_code, int)
+            and isinstance(weight, int)
+            and all(isinstance(v, (int, float)) for v in (response_time, *phase_values))
+        ):
+            raise TypeError("Datapoint fields must be numbers")
+
+        # Range of the "h" column
+        if not -32768 <= response_code <= 32767:
+            raise ValueError(f"Invalid response_code {response_code}")
+
+        if weight < 1:
+            raise ValueError(f"Invalid weight {weight}")
+
+        self.received_at.append(received_at)
+        self.response_times.append(response_time)
+        self.response_codes.append(response_code)
+
+        for column, phase_time in zip(self.phase_times.values(), phase_values):
+            column.append(phase_time)
+
+        self.weights.append(weight)
+
+    def received_at_position(self, position: int) -> int:
+        return self.received_at[position - self.offset]
+
+    def response_time_at(self, position: int) -> float:
+        return self.response_times[position - self.offset]
+
+    def response_code_at(self, position: int) -> int:
+        return self.response_codes[position - self.offset]
+
+    def weight_at(self, position: int) -> int:
+        return self.weights[position - self.offset]
+
+    def phase_time_at(self, phase: str, position: int) -> float:
+        return self.phase_times[phase][position - self.offset]
+
+    def phase_times_at(self, position: int) -> dict:
+        """
+        RETURNS: dict of seconds by phase, without the
+                 phases the datapoint didn't go through
+        """
+        phase_times = {}
+
+        for phase, column in self.phase_times.items():
+            phase_time = column[position - self.offset]
+            if not math.isnan(phase_time):
+                phase_times[phase] = phase_time
+
+        return phase_times
+
+    def position_since(self, threshold_ns: int, lo: int = None) -> int:
+        """
+        Binary searches for the first datapoint received at
+        or after threshold_ns.
+
+        PARAMETERS: threshold_ns: monotonic timestamp in nanoseconds
+                    lo: Optional position to start the search from
+        RETURNS: Position as int. Equal to self.end if every
+                 datapoint is older than the threshold.
+        """
+        lo = self.head if lo is None else max(lo - self.offset, self.head)
+        return self.offset + bisect_left(self.received_at, threshold_ns, lo=lo)
+
+    def pop_older_than(self, threshold_ns: int):
+        """
+        Drops datapoints received before threshold_ns.
+        The columns are compacted once more than half of
+        them hold dropped datapoints, which keeps appends
+        and pops amortised O(1).
+        """
+        self.head = self.position_since(threshold_ns) - self.offset
+
+        if self.head > len(self.received_at) // 2:
+            del self.received_at[: self.head]
+            del self.response_times[: self.head]
+            del self.response_codes[: self.head]
+            for column in self.phase_times.values():
+                del column[: self.head]
+            del self.weights[: self.head]
+            self.offset += self.head
+            self.head = 0
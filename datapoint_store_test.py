@@ -0,0 +1,79 @@
+import pytest
+
+"""
+Fixtures in conftest.py
+"""
+
+
+position_since_params = [
+    (0, 0),
+    (3 * 10**9, 3),
+    (3 * 10**9 + 1, 4),
+    (20 * 10**9, 10),
+]
+
+
+@pytest.mark.parametrize("threshold_ns, expected", position_since_params)
+def test_position_since_finds_first_datapoint_in_window(
+    datapoint_store, threshold_ns, expected
+):
+    assert datapoint_store.position_since(threshold_ns) == expected
+
+
+def test_pop_older_than_drops_datapoints_from_the_left(datapoint_store):
+    datapoint_store.pop_older_than(4 * 10**9)
+
+    assert len(datapoint_store) == 6
+    assert datapoint_store.start == 4
+
+
+def test_positions_survive_compaction(datapoint_store):
+    datapoint_store.pop_older_than(8 * 10**9)
+    datapoint_store.append(10 * 10**9, 1.0, 200)
+
+    # More than half of the columns were dropped
+    assert datapoint_store.offset == 8
+
+    assert datapoint_store.response_time_at(9) == 0.9
+    assert datapoint_store.response_time_at(10) == 1.0
+    assert datapoint_store.position_since(9 * 10**9) == 9
+
+
+def test_iter_yields_tuples_oldest_first(datapoint_store):
+    datapoint_store.pop_older_than(8 * 10**9)
+
+    assert list(datapoint_store) == [(8 * 10**9, 0.8, 500), (9 * 10**9, 0.9, 200)]
+
+
+def test_phase_times_missing_phases_are_left_out(datapoint_store):
+    datapoint_store.append(10 * 10**9, 1.0, 200, {"ttfb": 0.8, "transfer": 0.2})
+    datapoint_store.pop_older_than(8 * 10**9)
+
+    assert datapoint_store.phase_times_at(10) == {"ttfb": 0.8, "transfer": 0.2}
+    assert datapoint_store.phase_times_at(9) == {}
+
+
+bad_datapoint_params = [
+    (10 * 10**9, "x", 200, None),
+    (10 * 10**9, 1.0, 200, {"ttfb": "x"}),
+    (10 * 10**9, 1.0, 10**6, None),
+]
+
+
+@pytest.mark.parametrize(
+    "received_at, response_time, code, phases", bad_datapoint_params
+)
+def test_bad_datapoints_leave_columns_aligned(
+    datapoint_store, received_at, response_time, code, phases
+):
+    with pytest.raises((TypeError, ValueError)):
+        datapoint_store.append(received_at, response_time, code, phases)
+
+    columns = [
+        datapoint_store.received_at,
+        datapoint_store.response_times,
+        datapoint_store.response_codes,
+        *datapoint_store.phase_times.values(),
+        datapoint_store.weights,
+    ]
+    assert {len(column) for column in columns} == {10}
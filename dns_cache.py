@@ -0,0 +1,221 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import ipaddress
+import socket
+import httpcore
+from clock import Clock
+
+# phase_times dict of the probe running in the current task,
+# set by Website.request so the backend can time DNS lookups
+probe_phase_times = contextvars.ContextVar("probe_phase_times", default=None)
+
+# addresses is None for a failed lookup, error holds its message
+DNSEntry = collections.namedtuple("DNSEntry", ["addresses", "error", "expires_at"])
+
+
+class DNSCache:
+    """
+    In-process cache of hostname lookups shared by every
+    probe, so the system resolver is asked about each host
+    once per TTL rather than on every new connection.
+
+    Entries are evicted least recently used first once
+    max_size is reached. Failed lookups are cached too, for
+    negative_ttl seconds, and concurrent lookups of the same
+    host wait on a single request to the resolver.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        max_size: int = 10000,
+        clock: Clock = None,
+    ):
+        """
+        PARAMETERS: ttl: Seconds a resolved address is kept.
+                    getaddrinfo doesn't report record TTLs so one
+                    value applies to every host.
+                    negative_ttl: Seconds a failed lookup is kept
+                    max_size: Max number of hosts held
+                    clock: Clock instance. Defaults to the real time.
+        """
+        self.ttl_ns = int(ttl * 10**9)
+        self.negative_ttl_ns = int(negative_ttl * 10**9)
+        self.max_size = max_size
+        self.clock = clock or Clock()
+
+        # host -> DNSEntry, least recently used first
+        self.entries = collections.OrderedDict()
+
+        # host -> Task of the lookup in progress
+        self.pending = {}
+
+        self.hit_count = 0
+        self.negative_hit_count = 0
+        self.miss_count = 0
+        self.coalesced_count = 0
+        self.eviction_count = 0
+
+    async def resolve(self, host: str) -> tuple:
+        """
+        RETURNS: tuple of the IP addresses of host as strings,
+                 in the resolver's order of preference
+        RAISES: socket.gaierror if host can't be resolved
+        """
+        entry = self.entries.get(host)
+
+        if entry is not None and entry.expires_at > self.clock.monotonic_ns():
+            self.entries.move_to_end(host)
+
+            if entry.addresses is None:
+                self.negative_hit_count += 1
+                raise socket.gaierror(entry.error)
+
+            self.hit_count += 1
+            return entry.addresses
+
+        lookup = self.pending.get(host)
+
+        if lookup is None:
+            self.miss_count += 1
+            lookup = asyncio.ensure_future(self.lookup(host))
+            self.pending[host] = lookup
+            lookup.add_done_callback(functools.partial(self.finish_lookup, host))
+        else:
+            self.coalesced_count += 1
+
+        # A probe giving up mustn't cancel the lookup for the others
+        return await asyncio.shield(lookup)
+
+    def finish_lookup(self, host: str, lookup: asyncio.Future):
+        del self.pending[host]
+
+        # Every waiter may have given up, leaving
+        # a failure unretrieved
+        if not lookup.cancelled():
+            lookup.exception()
+
+    async def lookup(self, host: str) -> tuple:
+        """
+        Asks the resolver for host and caches the answer.
+        """
+        try:
+            addresses = await self.getaddrinfo(host)
+        except socket.gaierror as e:
+            self.add_entry(host, DNSEntry(None, str(e), self.get_expiry(False)))
+            raise
+
+        self.add_entry(host, DNSEntry(addresses, None, self.get_expiry(True)))
+        return addresses
+
+    async def getaddrinfo(self, host: str) -> tuple:
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+
+        if not infos:
+            raise socket.gaierror(f"No address found for {host}")
+
+        # Every address, e.g. IPv6 and IPv4, without repeats
+        return tuple(dict.fromkeys(info[4][0] for info in infos))
+
+    def get_expiry(self, resolved: bool) -> int:
+        ttl_ns = self.ttl_ns if resolved else self.negative_ttl_ns
+        return self.clock.monotonic_ns() + ttl_ns
+
+    def add_entry(self, host: str, entry: DNSEntry):
+        self.entries[host] = entry
+        self.entries.move_to_end(host)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.eviction_count += 1
+
+    def get_stats(self) -> dict:
+        """
+        RETURNS: dict of counters since start and the cache size
+        """
+        return {
+            "hits": self.hit_count,
+            "negative_hits": self.negative_hit_count,
+            "misses": self.miss_count,
+            "coalesced": self.coalesced_count,
+            "evictions": self.eviction_count,
+            "size": len(self.entries),
+        }
+
+
+class CachingNetworkBackend:
+    """
+    httpcore network backend resolving hostnames through a
+    DNSCache, then connecting with the backend it wraps to
+    each address in turn until one accepts, as the wrapped
+    backend would. TLS still uses the hostname of the request.
+    """
+
+    def __init__(self, backend, dns_cache: DNSCache):
+        """
+        PARAMETERS: backend: httpcore network backend to connect with
+                    dns_cache: DNSCache instance, usually shared
+        """
+        self.backend = backend
+        self.dns_cache = dns_cache
+
+    async def connect_tcp(self, host: str, port: int, **kwargs):
+        if self.is_ip_address(host):
+            return await self.backend.connect_tcp(host, port, **kwargs)
+
+        started_ns = self.dns_cache.clock.monotonic_ns()
+
+        try:
+            addresses = await self.dns_cache.resolve(host)
+        except socket.gaierror as e:
+            # Mapped by httpx to httpx.ConnectError
+            raise httpcore.ConnectError(str(e)) from e
+
+        phase_times = probe_phase_times.get()
+        if phase_times is not None:
+            elapsed_ns = self.dns_cache.clock.monotonic_ns() - started_ns
+            phase_times["dns"] = elapsed_ns / 1e9
+
+        # Falls back e.g. from an unreachable IPv6 address to IPv4
+        for address in addresses[:-1]:
+            try:
+                return await self.backend.connect_tcp(address, port, **kwargs)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                pass
+
+        return await self.backend.connect_tcp(addresses[-1], port, **kwargs)
+
+    def __getattr__(self, name):
+        # connect_unix_socket, sleep...
+        return getattr(self.backend, name)
+
+    @staticmethod
+    def is_ip_address(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return False
+
+        return True
+
+
+def install_caching_backend(transport, dns_cache: DNSCache):
+    """
+    Has the connection pool of an httpx.AsyncHTTPTransport
+    resolve hostnames through dns_cache. httpx has no option
+    for the httpcore network backend, so the pool's is swapped.
+
+    RAISES: Exception if an httpx or httpcore upgrade moved
+            it, rather than silently probing without the cache
+    """
+    pool = getattr(transport, "_pool", None)
+    backend = getattr(pool, "_network_backend", None)
+
+    if backend is None:
+        raise Exception("Can't find the network backend of the httpx transport")
+
+    pool._network_backend = CachingNetworkBackend(backend, dns_cache)
@@ -0,0 +1,102 @@
+import asyncio
+import socket
+import httpcore
+import httpx
+import pytest
+from dns_cache import CachingNetworkBackend, DNSCache, install_caching_backend
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def test_resolve_caches_until_ttl(dns_cache, virtual_clock):
+
+    async def resolve_twice():
+        await dns_cache.resolve("a.example")
+        virtual_clock.advance(59)
+        await dns_cache.resolve("a.example")
+        virtual_clock.advance(2)
+        return await dns_cache.resolve("a.example")
+
+    assert asyncio.run(resolve_twice()) == ("192.0.2.1",)
+    assert dns_cache.lookups == ["a.example", "a.example"]
+    assert dns_cache.get_stats()["hits"] == 1
+
+
+def test_failed_lookups_are_cached(dns_cache):
+
+    async def resolve():
+        for _ in range(3):
+            with pytest.raises(socket.gaierror):
+                await dns_cache.resolve("down.invalid")
+
+    asyncio.run(resolve())
+
+    assert dns_cache.lookups == ["down.invalid"]
+    assert dns_cache.get_stats()["negative_hits"] == 2
+
+
+def test_concurrent_lookups_share_one_request(dns_cache):
+
+    async def resolve_all():
+        return await asyncio.gather(
+            *(dns_cache.resolve("a.example") for _ in range(10))
+        )
+
+    assert set(asyncio.run(resolve_all())) == {("192.0.2.1",)}
+    assert dns_cache.lookups == ["a.example"]
+    assert dns_cache.get_stats()["coalesced"] == 9
+
+
+def test_least_recently_used_host_is_evicted(dns_cache):
+
+    async def resolve(*hosts):
+        for host in hosts:
+            await dns_cache.resolve(host)
+
+    asyncio.run(resolve("a.example", "b.example", "a.example", "c.example"))
+
+    assert list(dns_cache.entries) == ["a.example", "c.example"]
+    assert dns_cache.get_stats()["evictions"] == 1
+
+
+def test_connect_falls_back_to_next_address(dns_cache):
+    connected = []
+
+    class Backend:
+        async def connect_tcp(self, host, port, **kwargs):
+            connected.append(host)
+            if host == "2001:db8::1":
+                raise httpcore.ConnectError("Network is unreachable")
+            return host
+
+    async def getaddrinfo(host):
+        return ("2001:db8::1", "192.0.2.1")
+
+    dns_cache.getaddrinfo = getaddrinfo
+    backend = CachingNetworkBackend(Backend(), dns_cache)
+
+    assert asyncio.run(backend.connect_tcp("a.example", 80)) == "192.0.2.1"
+    assert connected == ["2001:db8::1", "192.0.2.1"]
+
+
+def test_transport_resolves_through_cache(local_http_server):
+    # Fails loudly if httpx or httpcore moved the network backend
+    dns_cache = DNSCache()
+
+    async def getaddrinfo(host):
+        return ("127.0.0.1",)
+
+    dns_cache.getaddrinfo = getaddrinfo
+
+    transport = httpx.AsyncHTTPTransport()
+    install_caching_backend(transport, dns_cache)
+    url = local_http_server.replace("127.0.0.1", "cached.invalid")
+
+    async def get():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get(url)
+
+    assert asyncio.run(get()).status_code == 200
+    assert dns_cache.get_stats()["misses"] == 1
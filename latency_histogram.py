@@ -0,0 +1,108 @@
+from bisect import bisect_left, insort
+import math
+
+
+class LatencyHistogram:
+    """
+    Streaming quantile sketch over response times.
+
+    Values are counted in logarithmically sized buckets, so
+    any quantile is estimated to within relative_accuracy of
+    the true value while memory is bounded by the number of
+    distinct buckets in use rather than the number of values.
+
+    Values can be removed as well as added, which lets the
+    histogram follow a sliding window, and two histograms
+    with the same accuracy can be merged.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6):
+        """
+        PARAMETERS: relative_accuracy: float between 0 and 1
+                    min_value: Values at or below this (in seconds)
+                    are counted together in a single bucket
+        """
+        if not 0 < relative_accuracy < 1:
+            raise Exception("relative_accuracy must be between 0 and 1")
+
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        # Bucket index -> count, plus the indexes kept sorted
+        self.bucket_counts = {}
+        self.bucket_indexes = []
+        self.count = 0
+
+    def get_bucket_index(self, value: float) -> int:
+        if value <= self.min_value:
+            return math.ceil(math.log(self.min_value) / self.log_gamma)
+
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def get_bucket_value(self, index: int) -> float:
+        """
+        Returns the value in the middle of a bucket, in
+        the sense that minimises relative error.
+        """
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        index = self.get_bucket_index(value)
+        bucket_count = self.bucket_counts.get(index, 0)
+
+        if not bucket_count:
+            insort(self.bucket_indexes, index)
+
+        self.bucket_counts[index] = bucket_count + count
+        self.count += count
+
+    def remove(self, value: float, count: int = 1):
+        """
+        Removes a value previously added to the histogram.
+        """
+        index = self.get_bucket_index(value)
+        bucket_count = self.bucket_counts[index] - count
+
+        if bucket_count > 0:
+            self.bucket_counts[index] = bucket_count
+        else:
+            del self.bucket_counts[index]
+            del self.bucket_indexes[bisect_left(self.bucket_indexes, index)]
+
+        self.count -= count
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+        Adds the counts of other into this histogram.
+        """
+        if other.gamma != self.gamma:
+            raise Exception("Only histograms of equal accuracy can be merged")
+
+        for index, bucket_count in other.bucket_counts.items():
+            if index not in self.bucket_counts:
+                insort(self.bucket_indexes, index)
+                self.bucket_counts[index] = 0
+
+            self.bucket_counts[index] += bucket_count
+
+        self.count += other.count
+
+    def get_quantile(self, quantile: float) -> float:
+        """
+        PARAMETERS: quantile: float between 0 and 1, e.g. 0.95
+        RETURNS: Estimated value as float or None if empty
+        """
+        if not self.count:
+            return None
+
+        rank = quantile * (self.count - 1)
+        seen = 0
+
+        for index in self.bucket_indexes:
+            seen += self.bucket_counts[index]
+            if seen > rank:
+                break
+
+        return self.get_bucket_value(index)
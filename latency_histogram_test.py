@@ -0,0 +1,38 @@
+import pytest
+from latency_histogram import LatencyHistogram
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def test_get_quantile_with_no_values_returns_None():
+    assert LatencyHistogram().get_quantile(0.5) is None
+
+
+@pytest.mark.parametrize("quantile", [0.0, 0.5, 0.95, 0.99, 1.0])
+def test_get_quantile_within_relative_accuracy(latency_histogram, quantile):
+    values = [i / 1000 for i in range(1, 1001)]
+    expected = values[int(quantile * (len(values) - 1))]
+
+    actual = latency_histogram.get_quantile(quantile)
+
+    assert actual == pytest.approx(expected, rel=latency_histogram.relative_accuracy)
+
+
+def test_removed_values_no_longer_count(latency_histogram):
+    for i in range(1, 501):
+        latency_histogram.remove(i / 1000)
+
+    assert latency_histogram.count == 500
+    assert latency_histogram.get_quantile(0.0) == pytest.approx(0.501, rel=0.01)
+
+
+def test_merge_adds_counts(latency_histogram):
+    other = LatencyHistogram()
+    other.add(10.0, count=1000)
+
+    latency_histogram.merge(other)
+
+    assert latency_histogram.count == 2000
+    assert latency_histogram.get_quantile(0.99) == pytest.approx(10.0, rel=0.01)
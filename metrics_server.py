@@ -0,0 +1,240 @@
+import asyncio
+import math
+
+# Report keys which aren't figures
+LABEL_KEYS = ("url", "timestamp", "timeframe", "probe_mode")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+
+    pairs = ",".join(f'{k}="{escape_label(str(v))}"' for k, v in labels.items())
+    return "{" + pairs + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(value)
+
+
+def get_metric_name(key: str) -> str:
+    """
+    RETURNS: Prometheus name of a report key, in base units
+    """
+    name = "website_" + key
+
+    # Response and phase times are in seconds
+    if key.endswith("_time"):
+        name += "_seconds"
+
+    return name
+
+
+class MetricsServer:
+    """
+    Stands in for the ConsoleWriter of a headless App. Rather
+    than being drawn, reports are served at /metrics in the
+    Prometheus text format, along with alert states and
+    the App's probe stats.
+
+    Each sample line is formatted when its report comes in
+    and kept. The body is joined again only after reports
+    changed something, so scrapes stay cheap with many sites.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, probe_stats=None):
+        """
+        PARAMETERS: host, port: Address to listen on
+                    probe_stats: Optional function returning the
+                    App's probe stats, e.g. App.get_probe_stats
+        """
+        self.host = host
+        self.port = port
+        self.probe_stats = probe_stats
+        self.server = None
+
+        # Same attribute as ConsoleWriter, set by App
+        self.web_performance_dashboards = []
+
+        # metric name -> {(dashboard, timeframe): sample line}.
+        # Prometheus wants the samples of a metric together.
+        self.samples = {}
+
+        # Joined samples, None once a report changed them
+        self.blocks = {}
+        self.body = None
+
+        self.scrape_count = 0
+
+    def add_dashboard(self, wp_dashboard):
+        self.web_performance_dashboards.append(wp_dashboard)
+
+    def mark_dirty(self, wp_dashboard):
+        """
+        Formats the samples of the dashboard's latest report.
+        Reports of each timeframe are kept apart.
+        """
+        data = wp_dashboard.data
+        timeframe = abs(data["timeframe"])
+        key = (wp_dashboard, timeframe)
+        labels = {"url": data["url"], "timeframe": timeframe}
+        if "probe_mode" in data:
+            labels["probe_mode"] = data["probe_mode"]
+        labels = format_labels(labels)
+
+        for k, v in data.items():
+            if k in LABEL_KEYS:
+                continue
+
+            name = get_metric_name(k)
+
+            if v is None:
+                # No datapoints yet
+                line = None
+            else:
+                line = f"{name}{labels} {format_value(v)}"
+
+            self.set_sample(name, key, line)
+
+        # Alert state from the latest alert
+        alerts = wp_dashboard.persisted_messages
+        down = bool(alerts) and getattr(alerts[-1], "kind", None) == "down"
+        self.set_sample(
+            "website_down",
+            (wp_dashboard, None),
+            f"website_down{format_labels({'url': data['url']})} {int(down)}",
+        )
+
+    def set_sample(self, name: str, key, line: str):
+        samples = self.samples.setdefault(name, {})
+
+        if samples.get(key) == line:
+            return
+
+        if line is None:
+            del samples[key]
+        else:
+            samples[key] = line
+
+        self.blocks[name] = None
+        self.body = None
+
+    def get_body(self) -> str:
+        """
+        RETURNS: The exposition text. Only metrics whose
+                 samples changed since the last scrape are joined
+                 again, and probe stats are added fresh.
+        """
+        if self.body is None:
+            for name, samples in self.samples.items():
+                if not samples:
+                    self.blocks[name] = ""
+                elif self.blocks.get(name) is None:
+                    lines = [f"# TYPE {name} gauge"]
+                    lines.extend(samples.values())
+                    self.blocks[name] = "\n".join(lines) + "\n"
+
+            self.body = "".join(self.blocks.values())
+
+        if self.probe_stats is None:
+            return self.body
+
+        return self.body + "".join(self.yield_probe_stat_lines())
+
+    def yield_probe_stat_lines(self):
+        # Each name is only seen once, types go with the samples
+        samples = {}
+
+        for name, labels, value in self.flatten(self.probe_stats(), "monitor", {}):
+            samples.setdefault(name, []).append(
+                f"{name}{format_labels(labels)} {format_value(value)}"
+            )
+
+        for name, lines in samples.items():
+            yield f"# TYPE {name} gauge\n"
+            yield "\n".join(lines) + "\n"
+
+    def flatten(self, stats: dict, prefix: str, labels: dict):
+        """
+        Yields (name, labels, value) tuples of nested stats dicts.
+        Integer keys, as ShardedApp's shard indexes, become labels.
+        """
+        for k, v in stats.items():
+            if isinstance(k, int):
+                name, sub_labels = prefix, dict(labels, shard=k)
+            else:
+                name, sub_labels = f"{prefix}_{k}", labels
+
+            if isinstance(v, dict):
+                yield from self.flatten(v, name, sub_labels)
+            elif v is not None:
+                yield name, sub_labels, v
+
+    async def render_loop(self):
+        """
+        Serves /metrics until cancelled. Named after
+        ConsoleWriter.render_loop, which it replaces.
+        """
+        self.server = await asyncio.start_server(
+            self.handle_request, self.host, self.port
+        )
+
+        try:
+            await self.server.serve_forever()
+        finally:
+            self.server.close()
+            self.server = None
+
+    async def handle_request(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+
+            # Headers are skipped
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                self.scrape_count += 1
+                status, body = "200 OK", self.get_body().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    # Nothing to draw in a headless App
+    def greet(self):
+        pass
+
+    def goodbye(self):
+        pass
+
+    def clear_screen(self):
+        pass
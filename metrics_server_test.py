@@ -0,0 +1,124 @@
+import asyncio
+from alert_store import Alert
+from console_writer import WebPerformanceDashboard
+from metrics_server import MetricsServer
+from simulation import SimulatedWebsite
+from website_monitoring_app import App
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def report(server, dashboard, timeframe=-600, **stats):
+    dashboard.data = {
+        "url": "http://site.com",
+        "timestamp": "12:25:00",
+        "timeframe": timeframe,
+        **stats,
+    }
+    server.mark_dirty(dashboard)
+
+
+def test_reports_become_samples():
+    server = MetricsServer()
+    dashboard = WebPerformanceDashboard()
+    server.add_dashboard(dashboard)
+
+    report(server, dashboard, availability=0.5, avg_response_time=0.25, timeouts=None)
+    report(server, dashboard, timeframe=-3600, availability=0.75)
+    body = server.get_body()
+
+    assert "# TYPE website_availability gauge\n" in body
+    assert 'website_availability{url="http://site.com",timeframe="600"} 0.5' in body
+    assert 'website_availability{url="http://site.com",timeframe="3600"} 0.75' in body
+    assert "website_avg_response_time_seconds{" in body
+    assert "website_timeouts" not in body
+    assert 'website_down{url="http://site.com"} 0' in body
+
+
+def test_probe_mode_is_a_label():
+    server = MetricsServer()
+    dashboard = WebPerformanceDashboard()
+
+    report(server, dashboard, availability=1.0, probe_mode="head")
+    body = server.get_body()
+
+    assert (
+        'website_availability{url="http://site.com",timeframe="600",probe_mode="head"} 1.0'
+        in body
+    )
+    assert "website_probe_mode" not in body
+
+
+def test_latest_alert_sets_down_state(virtual_clock):
+    server = MetricsServer()
+    dashboard = WebPerformanceDashboard()
+
+    dashboard.add_persisted_message(
+        Alert("Site is down", virtual_clock.now(), "down", availability=0.1)
+    )
+    report(server, dashboard, availability=0.1)
+
+    assert 'website_down{url="http://site.com"} 1' in server.get_body()
+
+
+def test_body_is_only_joined_again_after_changes():
+    server = MetricsServer()
+    dashboard = WebPerformanceDashboard()
+
+    report(server, dashboard, availability=1.0)
+    body = server.get_body()
+
+    report(server, dashboard, availability=1.0)
+    assert server.get_body() is body
+
+    report(server, dashboard, availability=0.5)
+    assert server.get_body() is not body
+
+
+def test_probe_stats_are_flattened():
+    stats = {"in_flight": 2, "avg_queue_wait": None, "dns": {"hits": 5}}
+    server = MetricsServer(probe_stats=lambda: {0: stats, 1: stats})
+    body = server.get_body()
+
+    assert 'monitor_in_flight{shard="0"} 2' in body
+    assert 'monitor_dns_hits{shard="1"} 5' in body
+    assert body.count("# TYPE monitor_in_flight gauge") == 1
+    assert "avg_queue_wait" not in body
+
+
+def test_metrics_are_served_over_http():
+    server = MetricsServer(port=0)
+    dashboard = WebPerformanceDashboard()
+    report(server, dashboard, availability=1.0)
+
+    async def scrape(path):
+        serving = asyncio.ensure_future(server.render_loop())
+        while server.server is None:
+            await asyncio.sleep(0)
+
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return response.decode()
+
+    response = asyncio.run(scrape("/metrics"))
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert response.endswith(server.get_body())
+    assert server.scrape_count == 1
+
+    assert asyncio.run(scrape("/")).startswith("HTTP/1.1 404")
+
+
+def test_app_runs_headless_with_metrics_port(virtual_clock):
+    website = SimulatedWebsite("http://site.com", 10, clock=virtual_clock)
+    app = App(websites=[website], metrics_port=0)
+
+    assert isinstance(app.console_writer, MetricsServer)
+    assert app.console_writer.web_performance_dashboards == [website.dashboard]
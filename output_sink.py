@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+SINK_FORMATS = ("jsonl", "csv")
+
+# Tells the writer thread to write what's left and stop
+STOP = object()
+
+
+class OutputSink:
+    """
+    Streams records, e.g. datapoints or reports, as JSON lines
+    or CSV to a file or stdout. Records are queued by write()
+    and written from a thread in batches, so a slow disk never
+    holds up the event loop. Files can be rotated by size
+    or age, the full file being renamed <path>.1, <path>.2...
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        format: str = None,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        max_bytes: int = None,
+        max_age: float = None,
+        max_queue: int = 100000,
+    ):
+        """
+        PARAMETERS: path: File to write to. Defaults to stdout.
+                    format: One of SINK_FORMATS. Defaults to csv for
+                    paths ending in .csv, else jsonl.
+                    batch_size: Max records written at once
+                    flush_interval: Max seconds a record waits
+                    to be written and flushed
+                    max_bytes: Rotate the file once this large
+                    max_age: Rotate the file once this many seconds old
+                    max_queue: Max records waiting. Records written
+                    beyond it are dropped and counted.
+        """
+        if format is None:
+            format = "csv" if path and path.endswith(".csv") else "jsonl"
+
+        if format not in SINK_FORMATS:
+            raise Exception(f"Sink format must be one of {', '.join(SINK_FORMATS)}")
+
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped_count = 0
+        self.error_count = 0
+        self.written_count = 0
+        self.rotation_count = 0
+
+        # Only touched by the writer thread
+        self.file = None
+        self.file_opened_at = None
+        self.file_size = 0
+        self.fieldnames = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, record: dict):
+        """
+        Queues a record without blocking.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def close(self):
+        """
+        Writes the records still queued and stops the thread.
+        Blocks until done.
+        """
+        # Only waits for room while the thread takes records off
+        while self.thread.is_alive():
+            try:
+                self.queue.put(STOP, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+        self.thread.join()
+
+    def run(self):
+        batch = []
+        flush_at = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                record = self.queue.get(timeout=max(flush_at - time.monotonic(), 0))
+            except queue.Empty:
+                record = None
+
+            if record is STOP:
+                self.write_batch(batch)
+                self.close_file()
+                return
+
+            if record is not None:
+                batch.append(record)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= flush_at:
+                self.write_batch(batch)
+                batch = []
+                flush_at = time.monotonic() + self.flush_interval
+
+    def write_batch(self, batch: list):
+        """
+        Writes and flushes batch. On an I/O error the batch is
+        dropped and counted, and the file opened again next time.
+        """
+        if not batch:
+            return
+
+        try:
+            self.write_to_file(batch)
+        except (OSError, ValueError):
+            self.error_count += 1
+            self.dropped_count += len(batch)
+            self.close_file()
+
+    def write_to_file(self, batch: list):
+        if self.file is None:
+            self.open_file()
+        elif self.needs_rotating():
+            self.rotate_file()
+
+        text = self.format_batch(batch)
+        self.file.write(text)
+        self.file.flush()
+
+        self.file_size += len(text)
+        self.written_count += len(batch)
+
+    def format_batch(self, batch: list) -> str:
+        if self.format == "jsonl":
+            return "".join(json.dumps(record, default=str) + "\n" for record in batch)
+
+        buffer = io.StringIO()
+
+        # Columns are those of the first record of each file.
+        # A file appended to has its header already.
+        header = self.fieldnames is None and self.file_size == 0
+        if self.fieldnames is None:
+            self.fieldnames = list(batch[0])
+
+        writer = csv.DictWriter(buffer, self.fieldnames, extrasaction="ignore")
+        if header:
+            writer.writeheader()
+        writer.writerows(batch)
+
+        return buffer.getvalue()
+
+    def needs_rotating(self) -> bool:
+        if self.path is None:
+            return False
+
+        too_large = self.max_bytes is not None and self.file_size >= self.max_bytes
+        too_old = (
+            self.max_age is not None
+            and time.monotonic() - self.file_opened_at >= self.max_age
+        )
+        return too_large or too_old
+
+    def open_file(self):
+        if self.path is None:
+            self.file = sys.stdout
+        else:
+            self.file = open(self.path, "a", newline="")
+
+        self.file_opened_at = time.monotonic()
+        self.file_size = self.file.tell() if self.path else 0
+        self.fieldnames = None
+
+    def rotate_file(self):
+        self.close_file()
+
+        # Files rotated by earlier runs are kept
+        suffix = 1
+        while os.path.exists(f"{self.path}.{suffix}"):
+            suffix += 1
+
+        os.replace(self.path, f"{self.path}.{suffix}")
+        self.rotation_count += 1
+        self.open_file()
+
+    def close_file(self):
+        try:
+            if self.file is not None and self.file is not sys.stdout:
+                self.file.close()
+        except OSError:
+            # Nothing more to do with a broken file
+            pass
+        finally:
+            self.file = None
@@ -0,0 +1,146 @@
+import csv
+import json
+import pytest
+import time
+from output_sink import OutputSink
+from simulation import build_simulated_app, run_simulation
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def make_records(count: int) -> list:
+    return [
+        {"url": f"http://site-{i}.com", "response_time": i / 10} for i in range(count)
+    ]
+
+
+def test_jsonl_sink_writes_every_record(tmp_path):
+    path = tmp_path / "datapoints.jsonl"
+    sink = OutputSink(str(path), batch_size=3)
+
+    for record in make_records(10):
+        sink.write(record)
+    sink.close()
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == make_records(10)
+    assert sink.written_count == 10
+
+
+def test_csv_sink_writes_one_header(tmp_path):
+    path = tmp_path / "datapoints.csv"
+    sink = OutputSink(str(path), batch_size=3)
+
+    for record in make_records(10):
+        sink.write(record)
+    sink.close()
+
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+
+    assert sink.format == "csv"
+    assert len(rows) == 10
+    assert rows[9] == {"url": "http://site-9.com", "response_time": "0.9"}
+
+
+def test_sink_flushes_on_interval(tmp_path):
+    path = tmp_path / "datapoints.jsonl"
+    sink = OutputSink(str(path), flush_interval=0.01)
+    sink.write({"url": "http://site.com"})
+
+    # Written without closing or filling a batch
+    deadline = time.monotonic() + 5
+    while sink.written_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert path.read_text() == '{"url": "http://site.com"}\n'
+
+    sink.close()
+
+
+def test_sink_rotates_by_size(tmp_path):
+    path = tmp_path / "datapoints.jsonl"
+    sink = OutputSink(str(path), batch_size=1, max_bytes=100)
+
+    for record in make_records(10):
+        sink.write(record)
+    sink.close()
+
+    rotated = sorted(tmp_path.glob("datapoints.jsonl.*"))
+    lines = []
+    for rotated_path in rotated + [path]:
+        lines.extend(rotated_path.read_text().splitlines())
+
+    assert sink.rotation_count == len(rotated) > 0
+    assert [json.loads(line) for line in lines] == make_records(10)
+
+
+def test_full_queue_drops_records(tmp_path):
+    sink = OutputSink(str(tmp_path / "datapoints.jsonl"), max_queue=1)
+
+    # Stopped, nothing takes records off the queue
+    sink.close()
+
+    for record in make_records(3):
+        sink.write(record)
+
+    assert sink.dropped_count == 2
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(Exception):
+        OutputSink(format="xml")
+
+
+def test_app_streams_datapoints_and_reports(virtual_clock, tmp_path):
+    datapoint_sink = OutputSink(str(tmp_path / "datapoints.csv"))
+    report_sink = OutputSink(str(tmp_path / "reports.jsonl"))
+
+    app = build_simulated_app(2, 10, virtual_clock)
+    app.datapoint_sink = datapoint_sink
+    app.report_sink = report_sink
+
+    run_simulation(app, [{"frequency": 60, "timeframe": -600}], 5 * 60, virtual_clock)
+
+    with open(tmp_path / "datapoints.csv") as f:
+        datapoints = list(csv.DictReader(f))
+    reports = (tmp_path / "reports.jsonl").read_text().splitlines()
+
+    assert len(datapoints) == sum(w.probe_count for w in app.websites_to_monitor)
+    assert datapoints[0]["response_code"] == "200"
+    assert "ttfb_time" in datapoints[0]
+    assert datapoints[0]["probe_mode"] == "get"
+    assert len(reports) >= 8
+    assert json.loads(reports[0])["timeframe"] == -600
+    assert json.loads(reports[0])["probe_mode"] == "get"
+
+
+def test_io_errors_drop_batch_and_keep_writing(tmp_path):
+    path = tmp_path / "datapoints.jsonl"
+    sink = OutputSink(str(path), batch_size=1)
+
+    # A directory can't be opened as the file
+    path.mkdir()
+    sink.write({"url": "http://site.com"})
+
+    deadline = time.monotonic() + 5
+    while sink.error_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    path.rmdir()
+    sink.write({"url": "http://other.com"})
+    sink.close()
+
+    assert sink.dropped_count == 1
+    assert path.read_text() == '{"url": "http://other.com"}\n'
+
+
+def test_close_returns_if_thread_died(tmp_path):
+    sink = OutputSink(str(tmp_path / "datapoints.jsonl"), max_queue=1)
+    sink.close()
+
+    # Full queue and no thread to empty it
+    sink.write({"url": "http://site.com"})
+    sink.close()
@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import uuid
+from agent_protocol import read_frame, write_frame
+from clock import Clock
+from scheduler import Scheduler
+from simulation import NullConsoleWriter
+from website_monitoring_app import App
+
+
+class ProbeAgent(App):
+    """
+    App probing its websites as usual and pushing the new
+    datapoints of each one to an Aggregator in batches,
+    rather than reporting on them itself.
+
+    Batches are numbered and kept until acknowledged. After
+    a reconnect every unacknowledged batch is sent again and
+    the aggregator skips those it already applied, so nothing
+    is lost or counted twice.
+    """
+
+    def __init__(
+        self,
+        agent_id: str,
+        host: str = "127.0.0.1",
+        port: int = 8700,
+        path: str = None,
+        flush_interval: float = 1.0,
+        max_unacked: int = 1000,
+        reconnect_delay: float = 1.0,
+        clock: Clock = None,
+        **kwargs,
+    ):
+        """
+        PARAMETERS: agent_id: Name of the agent, unique in the fleet
+                    host, port: Address of the aggregator
+                    path: Unix socket path of the aggregator.
+                    Used instead of host and port if given.
+                    flush_interval: Seconds between batches
+                    max_unacked: Max batches kept while the aggregator
+                    can't be reached. The oldest are dropped beyond it.
+                    reconnect_delay: Seconds between connection attempts
+                    clock: Clock instance the websites were built with.
+                    Defaults to the real time.
+                    kwargs: Passed on to App
+        """
+        self.agent_id = agent_id
+        self.host = host
+        self.port = port
+        self.path = path
+        self.flush_interval = flush_interval
+        self.reconnect_delay = reconnect_delay
+        self.clock = clock or Clock()
+
+        # Tells the aggregator a restarted agent's
+        # batch numbers start again
+        self.session = uuid.uuid4().hex
+        self.seqs = itertools.count(1)
+
+        # (seq, rows) tuples waiting for an ack, oldest first
+        self.unacked = collections.deque(maxlen=max_unacked)
+        self.batch_ready = None
+
+        # website -> position of its next datapoint to send
+        self.sent_positions = {}
+
+        self.dropped_batch_count = 0
+        self.reconnect_count = 0
+
+        kwargs.setdefault("console_writer", NullConsoleWriter())
+        super().__init__(**kwargs)
+
+    async def run_website_tasks(self):
+        self.scheduler = Scheduler()
+        self.batch_ready = asyncio.Event()
+
+        # Probing only, reports come from the aggregator
+        self.schedule_websites([])
+
+        for website in self.websites_to_monitor:
+            self.sent_positions[website] = website.stats.data_points.end
+
+        self.scheduler.schedule(self.flush, self.flush_interval)
+
+        await asyncio.gather(self.scheduler.run(), self.send_batches())
+
+    async def flush(self):
+        """
+        Queues the datapoints received since the last flush
+        as a new batch.
+        """
+        rows = []
+
+        for website in self.websites_to_monitor:
+            # Subscribers hold copies of their prober's datapoints
+            if not self.probe_registry.is_prober(website):
+                continue
+
+            store = website.stats.data_points
+            start = max(self.sent_positions[website], store.start)
+
+            for position in range(start, store.end):
+                rows.append(
+                    (
+                        website.url,
+                        store.received_at_position(position),
+                        store.response_time_at(position),
+                        store.response_code_at(position),
+                        store.phase_times_at(position),
+                        store.weight_at(position),
+                    )
+                )
+
+            self.sent_positions[website] = store.end
+
+        if rows:
+            if len(self.unacked) == self.unacked.maxlen:
+                self.dropped_batch_count += 1
+
+            self.unacked.append((next(self.seqs), rows))
+            self.batch_ready.set()
+
+    async def open_connection(self):
+        if self.path:
+            return await asyncio.open_unix_connection(self.path)
+
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def send_batches(self):
+        """
+        Keeps a connection to the aggregator open and sends it
+        every batch until cancelled, reconnecting when needed.
+        """
+        while True:
+            try:
+                reader, writer = await self.open_connection()
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            try:
+                await self.run_connection(reader, writer)
+            except (OSError, asyncio.IncompleteReadError):
+                self.reconnect_count += 1
+            finally:
+                writer.close()
+
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def run_connection(self, reader, writer):
+        sites = [[w.url, w.check_interval] for w in self.websites_to_monitor]
+        await write_frame(
+            writer,
+            {
+                "type": "hello",
+                "agent_id": self.agent_id,
+                "session": self.session,
+                "sites": sites,
+            },
+        )
+
+        ack_reader = asyncio.ensure_future(self.read_acks(reader))
+        batch_ready = None
+        sent_seq = 0
+
+        try:
+            while True:
+                self.batch_ready.clear()
+
+                # Batches not acked on a previous connection go again
+                for seq, rows in list(self.unacked):
+                    if seq > sent_seq:
+                        await self.send_batch(writer, seq, rows)
+                        sent_seq = seq
+
+                batch_ready = asyncio.ensure_future(self.batch_ready.wait())
+                await asyncio.wait(
+                    [ack_reader, batch_ready], return_when=asyncio.FIRST_COMPLETED
+                )
+
+                # Connection lost
+                if ack_reader.done():
+                    ack_reader.result()
+        finally:
+            ack_reader.cancel()
+
+            if batch_ready is not None:
+                batch_ready.cancel()
+
+    async def send_batch(self, writer, seq: int, rows: list):
+        now_ns = self.clock.monotonic_ns()
+
+        await write_frame(
+            writer,
+            {
+                "type": "batch",
+                "seq": seq,
+                "rows": [
+                    [url, now_ns - received_at, *datapoint]
+                    for url, received_at, *datapoint in rows
+                ],
+            },
+        )
+
+    async def read_acks(self, reader):
+        while True:
+            message = await read_frame(reader)
+
+            # Acks are cumulative
+            while self.unacked and self.unacked[0][0] <= message["seq"]:
+                self.unacked.popleft()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Probes the websites listed in a file"
+        + " and pushes the results to an aggregator."
+    )
+    parser.add_argument("websites_file")
+    parser.add_argument("--agent-id", default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    agent = ProbeAgent(
+        args.agent_id or uuid.uuid4().hex[:8],
+        host=args.host,
+        port=args.port,
+        path=args.path,
+        websites_file=args.websites_file,
+    )
+    agent.start_app(schedules=[])
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import pytest
+from agent_protocol import HEADER, MAX_FRAME_SIZE, read_frame, write_frame
+from probe_agent import ProbeAgent
+from simulation import SimulatedWebsite
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def test_frames_round_trip():
+    message = {"type": "batch", "seq": 1, "rows": [["http://a.example", 5, 0.1]]}
+
+    class Writer:
+        data = b""
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+    async def round_trip():
+        writer = Writer()
+        await write_frame(writer, message)
+
+        reader = asyncio.StreamReader()
+        reader.feed_data(writer.data)
+        return await read_frame(reader)
+
+    assert asyncio.run(round_trip()) == message
+
+
+def test_resent_batches_are_applied_once(aggregator):
+    aggregator.add_website("http://a.example", 5)
+    batch = {
+        "type": "batch",
+        "seq": 1,
+        "rows": [["http://a.example", 0, 0.1, 200, {}, 1]],
+    }
+
+    agent_session = aggregator.get_agent_session(
+        {"agent_id": "a1", "session": "s1", "sites": []}
+    )
+    aggregator.apply_batch(agent_session, batch)
+
+    # Reconnected, the ack of batch 1 was lost
+    agent_session = aggregator.get_agent_session(
+        {"agent_id": "a1", "session": "s1", "sites": []}
+    )
+    aggregator.apply_batch(agent_session, batch)
+
+    assert len(aggregator.websites_by_url["http://a.example"].stats.data_points) == 1
+    assert agent_session.duplicate_count == 1
+
+    # Restarted, numbering starts again
+    agent_session = aggregator.get_agent_session(
+        {"agent_id": "a1", "session": "s2", "sites": []}
+    )
+    aggregator.apply_batch(agent_session, batch)
+
+    assert len(aggregator.websites_by_url["http://a.example"].stats.data_points) == 2
+
+
+def frame(message) -> bytes:
+    payload = json.dumps(message).encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+hello = {"type": "hello", "agent_id": "a1", "session": "s1", "sites": []}
+
+malformed_params = [
+    HEADER.pack(5) + b"{oops",
+    HEADER.pack(MAX_FRAME_SIZE + 1),
+    frame({"type": "hello", "agent_id": "a1"}),
+    frame(dict(hello, sites=[["http://b.example", 0]])),
+    # Unknown url after a known one
+    frame(hello)
+    + frame(
+        {
+            "type": "batch",
+            "seq": 1,
+            "rows": [
+                ["http://a.example", 0, 0.1, 200, {}, 1],
+                ["http://b.example", 0, 0.1, 200, {}, 1],
+            ],
+        }
+    ),
+    # Malformed row after a good one
+    frame(hello)
+    + frame(
+        {
+            "type": "batch",
+            "seq": 1,
+            "rows": [
+                ["http://a.example", 0, 0.1, 200, {}, 1],
+                ["http://a.example", 0, "x", 200, {}, 1],
+            ],
+        }
+    ),
+]
+
+
+@pytest.mark.parametrize("data", malformed_params)
+def test_malformed_frames_drop_the_connection(aggregator, data):
+    aggregator.add_website("http://a.example", 5)
+
+    class Writer:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    async def handle():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+
+        writer = Writer()
+        await aggregator.handle_agent(reader, writer)
+        return writer
+
+    writer = asyncio.run(handle())
+
+    assert writer.closed
+    assert not aggregator.connections
+    assert aggregator.rejected_count == 1
+    assert len(aggregator.websites_by_url["http://a.example"].stats.data_points) == 0
+
+
+def test_agent_datapoints_reach_aggregator_across_reconnects(
+    aggregator, virtual_clock, virtual_loop
+):
+    aggregator.schedules = [{"frequency": 10, "timeframe": -60}]
+    websites = [
+        SimulatedWebsite(
+            url=f"http://site-{i}.simulated",
+            check_interval=5,
+            mean_response_time=0.01,
+            seed=i,
+            clock=virtual_clock,
+        )
+        for i in range(3)
+    ]
+
+    async def run():
+        aggregator_task = asyncio.ensure_future(aggregator.monitor_websites())
+        await asyncio.sleep(0.1)
+
+        agent = ProbeAgent(
+            "a1",
+            port=aggregator.server.sockets[0].getsockname()[1],
+            websites=websites,
+            clock=virtual_clock,
+            reconnect_delay=0.5,
+        )
+        agent_task = asyncio.ensure_future(agent.monitor_websites())
+
+        await asyncio.sleep(30)
+        for writer in list(aggregator.connections):
+            writer.close()
+        await asyncio.sleep(30)
+
+        agent_task.cancel()
+        aggregator_task.cancel()
+        await asyncio.gather(agent_task, aggregator_task, return_exceptions=True)
+
+        return agent
+
+    asyncio.set_event_loop(virtual_loop)
+    try:
+        agent = virtual_loop.run_until_complete(run())
+    finally:
+        asyncio.set_event_loop(None)
+
+    assert agent.reconnect_count == 1
+
+    # Nothing lost or counted twice, bar a batch in flight at the end
+    in_flight = [row[0] for _, rows in agent.unacked for row in rows]
+
+    for website in websites:
+        aggregated = aggregator.websites_by_url[website.url]
+        assert (
+            len(aggregated.stats.data_points) + in_flight.count(website.url)
+            == website.probe_count
+        )
+
+
+def test_coalesced_websites_are_sent_once(virtual_clock, virtual_loop):
+    websites = [
+        SimulatedWebsite(
+            url="http://site.simulated", check_interval=5, seed=0, clock=virtual_clock
+        )
+        for _ in range(2)
+    ]
+    agent = ProbeAgent("a1", port=0, websites=websites, clock=virtual_clock)
+
+    async def probe_then_flush():
+        run = asyncio.ensure_future(agent.run_website_tasks())
+        await asyncio.sleep(0)
+
+        # As a probe of the first website would
+        websites[0].record_datapoint({"response_code": 200, "response_time": 0.1})
+        await agent.flush()
+
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+
+    virtual_loop.run_until_complete(probe_then_flush())
+
+    ((seq, rows),) = agent.unacked
+    # Not again from the subscriber's copy
+    assert len(websites[1].stats.data_points) == 1
+    assert len(rows) == 1
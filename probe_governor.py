@@ -0,0 +1,116 @@
+import asyncio
+
+
+class ProbeGovernor:
+    """
+    Admission control for probes. Bounds how many probes
+    are in flight overall and per host, and how many may
+    queue waiting for a slot. Probes arriving to a full
+    queue are dropped rather than left to pile up.
+
+    Keeps counters to help size the process for a given
+    number of sites.
+    """
+
+    def __init__(self, max_in_flight: int = 100, max_per_host: int = 6, max_queue=1000):
+        """
+        PARAMETERS: max_in_flight: Max probes in flight overall
+                    max_per_host: Max probes in flight to one host
+                    max_queue: Max probes waiting for a slot
+        """
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.max_queue = max_queue
+
+        self.in_flight_semaphore = asyncio.Semaphore(max_in_flight)
+
+        # host -> [Semaphore, number of probes holding or waiting for it]
+        self.host_semaphores = {}
+
+        self.in_flight_count = 0
+        self.queued_count = 0
+        self.admitted_count = 0
+        self.dropped_count = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    async def acquire(self, host: str) -> bool:
+        """
+        Waits for a slot to probe host.
+
+        RETURNS: True once admitted, in which case release must
+                 be called when the probe is done. False if the
+                 probe was dropped because the queue is full.
+        """
+        if self.queued_count >= self.max_queue:
+            self.dropped_count += 1
+            return False
+
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        self.queued_count += 1
+
+        host_entry = self.host_semaphores.get(host)
+        if host_entry is None:
+            host_entry = [asyncio.Semaphore(self.max_per_host), 0]
+            self.host_semaphores[host] = host_entry
+
+        host_entry[1] += 1
+
+        try:
+            # Wait for the host first so a busy host doesn't
+            # hold global slots other hosts could use
+            await host_entry[0].acquire()
+            try:
+                await self.in_flight_semaphore.acquire()
+            except BaseException:
+                host_entry[0].release()
+                raise
+        except BaseException:
+            self.release_host(host)
+            raise
+        finally:
+            self.queued_count -= 1
+
+        queue_wait = loop.time() - queued_at
+        self.total_queue_wait += queue_wait
+        self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+        self.admitted_count += 1
+        self.in_flight_count += 1
+
+        return True
+
+    def release(self, host: str):
+        """
+        Frees the slot taken by a probe admitted by acquire.
+        """
+        self.in_flight_count -= 1
+        self.in_flight_semaphore.release()
+        self.host_semaphores[host][0].release()
+        self.release_host(host)
+
+    def release_host(self, host: str):
+        host_entry = self.host_semaphores[host]
+        host_entry[1] -= 1
+
+        # Hosts no longer probed don't keep a semaphore
+        if not host_entry[1]:
+            del self.host_semaphores[host]
+
+    def get_stats(self) -> dict:
+        """
+        RETURNS: dict of current gauges and counters since start
+        """
+        if self.admitted_count:
+            avg_queue_wait = self.total_queue_wait / self.admitted_count
+        else:
+            avg_queue_wait = None
+
+        return {
+            "in_flight": self.in_flight_count,
+            "queued": self.queued_count,
+            "admitted": self.admitted_count,
+            "dropped": self.dropped_count,
+            "avg_queue_wait": avg_queue_wait,
+            "max_queue_wait": self.max_queue_wait,
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from probe_governor import ProbeGovernor
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def run_probes(loop, governor, hosts, probe_seconds=1):
+    """
+    Starts one probe per host at once, each holding its
+    slot for probe_seconds.
+
+    RETURNS: list of True/False admissions and the max
+             number of probes in flight at any time
+    """
+    max_in_flight = 0
+
+    async def probe(host):
+        nonlocal max_in_flight
+
+        if not await governor.acquire(host):
+            return False
+
+        max_in_flight = max(max_in_flight, governor.in_flight_count)
+        await asyncio.sleep(probe_seconds)
+        governor.release(host)
+        return True
+
+    async def main():
+        return await asyncio.gather(*(probe(host) for host in hosts))
+
+    return loop.run_until_complete(main()), max_in_flight
+
+
+def test_global_in_flight_limit(virtual_loop):
+    governor = ProbeGovernor(max_in_flight=5, max_per_host=10)
+    hosts = [f"site-{i}.com" for i in range(20)]
+
+    admitted, max_in_flight = run_probes(virtual_loop, governor, hosts)
+
+    assert all(admitted)
+    assert max_in_flight == 5
+
+    # 4 batches of 5 probes, 1 second each
+    assert virtual_loop.time() == pytest.approx(4)
+
+
+def test_per_host_limit(virtual_loop):
+    governor = ProbeGovernor(max_in_flight=10, max_per_host=2)
+
+    _, max_in_flight = run_probes(virtual_loop, governor, ["same.com"] * 6)
+
+    assert max_in_flight == 2
+    assert governor.host_semaphores == {}
+
+
+def test_probes_dropped_when_queue_full(virtual_loop):
+    governor = ProbeGovernor(max_in_flight=1, max_queue=3)
+
+    admitted, _ = run_probes(virtual_loop, governor, [f"{i}.com" for i in range(6)])
+
+    # 1 in flight and 3 waiting
+    assert admitted.count(True) == 4
+    assert governor.get_stats()["dropped"] == 2
+
+
+def test_queue_wait_is_measured(virtual_loop):
+    governor = ProbeGovernor(max_in_flight=1)
+
+    run_probes(virtual_loop, governor, ["a.com", "b.com", "c.com"])
+    stats = governor.get_stats()
+
+    # Probes waited 0, 1 and 2 seconds
+    assert stats["admitted"] == 3
+    assert stats["avg_queue_wait"] == pytest.approx(1)
+    assert stats["max_queue_wait"] == pytest.approx(2)
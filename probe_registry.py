@@ -0,0 +1,78 @@
+import urllib.parse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class ProbeRegistry:
+    """
+    Groups websites probing the same url in the same probe
+    mode, so that only one of them probes. The prober is the
+    website with the shortest check_interval and its results
+    are recorded in the stats of every website of the group.
+    """
+
+    def __init__(self):
+        # (normalised url, probe_mode) -> list of websites
+        self.groups = {}
+
+        # website -> prober of its group
+        self.probers = {}
+
+    @staticmethod
+    def normalise_url(url: str) -> str:
+        """
+        RETURNS: url with scheme and host lower cased, default
+                 port and fragment dropped and an empty path as /.
+                 User info is kept as is.
+        """
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        netloc = parts.hostname or ""
+
+        # hostname strips the brackets of IPv6 addresses
+        if ":" in netloc:
+            netloc = f"[{netloc}]"
+
+        if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+            netloc += f":{parts.port}"
+
+        userinfo, at, _ = parts.netloc.rpartition("@")
+        if at:
+            netloc = f"{userinfo}@{netloc}"
+
+        return urllib.parse.urlunsplit(
+            (scheme, netloc, parts.path or "/", parts.query, "")
+        )
+
+    def subscribe(self, website):
+        """
+        Adds website to the group of its url, electing
+        a new prober if it checks more often.
+        """
+        key = (self.normalise_url(website.url), website.probe_mode)
+        group = self.groups.setdefault(key, [])
+        group.append(website)
+
+        prober = min(group, key=lambda w: w.check_interval)
+
+        for member in group:
+            member.subscribers = []
+            self.probers[member] = prober
+
+        prober.subscribers = [member for member in group if member is not prober]
+
+    def is_prober(self, website) -> bool:
+        return self.probers[website] is website
+
+    def get_stats(self) -> dict:
+        """
+        RETURNS: dict of the number of websites, of urls
+                 actually probed and of probes saved each round
+        """
+        website_count = len(self.probers)
+
+        return {
+            "websites": website_count,
+            "probed": len(self.groups),
+            "coalesced": website_count - len(self.groups),
+        }
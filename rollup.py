@@ -0,0 +1,196 @@
+from collections import deque
+from datapoint_store import PHASES
+from latency_histogram import LatencyHistogram
+
+# Response codes recorded for probes which got no HTTP response
+PROBE_TIMEOUT = -1
+PROBE_ERROR = -2
+
+# Response codes of a site up and serving content. 206 answers
+# the ranged GETs of "range" probes.
+AVAILABLE_CODES = frozenset((200, 206))
+
+
+class RollupBucket:
+    """
+    Summary of every datapoint received during one fixed
+    period, e.g. one minute. Buckets are mergeable so finer
+    ones can be folded into coarser ones. Counts are weighted
+    as in TimeframeAggregate.
+    """
+
+    def __init__(self, start_ns: int = 0):
+        self.start_ns = start_ns
+        self.datapoint_count = 0
+        self.available_count = 0
+        self.response_count = 0
+        self.timeout_count = 0
+        self.error_count = 0
+        self.response_time_sum = 0.0
+        self.min_response_time = None
+        self.max_response_time = None
+        self.histogram = LatencyHistogram()
+
+        # Only probes which went through a phase count towards it
+        self.phase_time_sums = dict.fromkeys(PHASES, 0.0)
+        self.phase_time_counts = dict.fromkeys(PHASES, 0)
+        self.max_phase_times = dict.fromkeys(PHASES)
+
+    def add(
+        self,
+        response_time: float,
+        response_code: int,
+        phase_times: dict = None,
+        weight: int = 1,
+    ):
+        self.datapoint_count += weight
+
+        if phase_times:
+            for phase, phase_time in phase_times.items():
+                self.add_phase_time(phase, weight, phase_time * weight, phase_time)
+
+        if response_code in AVAILABLE_CODES:
+            self.available_count += weight
+
+        # No response time to speak of
+        if response_code == PROBE_TIMEOUT:
+            self.timeout_count += 1
+            return
+        if response_code == PROBE_ERROR:
+            self.error_count += 1
+            return
+
+        self.response_count += weight
+        self.response_time_sum += response_time * weight
+        self.histogram.add(response_time, weight)
+
+        if self.min_response_time is None or response_time < self.min_response_time:
+            self.min_response_time = response_time
+
+        if self.max_response_time is None or response_time > self.max_response_time:
+            self.max_response_time = response_time
+
+    def merge(self, other: "RollupBucket"):
+        """
+        Adds the summary held in other to this bucket.
+        """
+        if not other.datapoint_count:
+            return
+
+        self.datapoint_count += other.datapoint_count
+        self.available_count += other.available_count
+        self.timeout_count += other.timeout_count
+        self.error_count += other.error_count
+
+        for phase, count in other.phase_time_counts.items():
+            if count:
+                self.add_phase_time(
+                    phase,
+                    count,
+                    other.phase_time_sums[phase],
+                    other.max_phase_times[phase],
+                )
+
+        if not other.response_count:
+            return
+
+        self.response_count += other.response_count
+        self.response_time_sum += other.response_time_sum
+        self.histogram.merge(other.histogram)
+
+        if (
+            self.min_response_time is None
+            or other.min_response_time < self.min_response_time
+        ):
+            self.min_response_time = other.min_response_time
+
+        if (
+            self.max_response_time is None
+            or other.max_response_time > self.max_response_time
+        ):
+            self.max_response_time = other.max_response_time
+
+    def add_phase_time(self, phase: str, count: int, total: float, max_time: float):
+        self.phase_time_counts[phase] += count
+        self.phase_time_sums[phase] += total
+
+        if (
+            self.max_phase_times[phase] is None
+            or max_time > self.max_phase_times[phase]
+        ):
+            self.max_phase_times[phase] = max_time
+
+    def get_max_response_time(self) -> float:
+        return self.max_response_time
+
+    def get_max_phase_time(self, phase: str) -> float:
+        return self.max_phase_times[phase]
+
+
+class RollupTier:
+    """
+    Time ordered RollupBuckets of a single width, e.g.
+    1 minute buckets kept for an hour. Buckets older than
+    the retention are popped so they can be folded into
+    a coarser tier.
+    """
+
+    def __init__(self, bucket_seconds: int, retention_seconds: int):
+        """
+        PARAMETERS: bucket_seconds: Positive integer, width of each bucket
+                    retention_seconds: Positive integer, how long
+                    buckets are kept
+        """
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.bucket_ns = bucket_seconds * 10**9
+        self.buckets = deque()
+
+    def get_bucket(self, received_at: int) -> RollupBucket:
+        """
+        Returns the bucket covering received_at, creating it
+        if necessary. Timestamps must arrive in time order.
+        """
+        start_ns = received_at - received_at % self.bucket_ns
+
+        if not self.buckets or self.buckets[-1].start_ns < start_ns:
+            self.buckets.append(RollupBucket(start_ns))
+
+        return self.buckets[-1]
+
+    def add(
+        self,
+        received_at: int,
+        response_time: float,
+        response_code: int,
+        phase_times: dict = None,
+        weight: int = 1,
+    ):
+        self.get_bucket(received_at).add(
+            response_time, response_code, phase_times, weight
+        )
+
+    def add_bucket(self, bucket: RollupBucket):
+        """
+        Folds a bucket from a finer tier into this one.
+        """
+        self.get_bucket(bucket.start_ns).merge(bucket)
+
+    def pop_older_than(self, threshold_ns: int):
+        """
+        Pops and yields buckets which ended before threshold_ns.
+        """
+        while (
+            self.buckets and self.buckets[0].start_ns + self.bucket_ns <= threshold_ns
+        ):
+            yield self.buckets.popleft()
+
+    def yield_buckets_since(self, threshold_ns: int):
+        """
+        Yields buckets which ended after threshold_ns, newest first.
+        A bucket straddling the threshold is included whole.
+        """
+        for bucket in reversed(self.buckets):
+            if bucket.start_ns + self.bucket_ns <= threshold_ns:
+                break
+            yield bucket
@@ -0,0 +1,60 @@
+import pytest
+from rollup import RollupBucket, RollupTier
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def test_rollup_tier_groups_datapoints_by_bucket(minute_rollup_tier):
+    assert [b.datapoint_count for b in minute_rollup_tier.buckets] == [3, 2]
+
+
+def test_rollup_tier_pops_buckets_which_ended(minute_rollup_tier):
+    popped = list(minute_rollup_tier.pop_older_than(60 * 10**9))
+
+    assert len(popped) == 1
+    assert popped[0].available_count == 2
+    assert len(minute_rollup_tier.buckets) == 1
+
+
+def test_rollup_tier_includes_straddling_bucket(minute_rollup_tier):
+    buckets = list(minute_rollup_tier.yield_buckets_since(59 * 10**9))
+    assert len(buckets) == 2
+
+
+def test_add_bucket_folds_into_coarser_tier(minute_rollup_tier):
+    hour_tier = RollupTier(3600, 7 * 24 * 3600)
+
+    for bucket in minute_rollup_tier.pop_older_than(3600 * 10**9):
+        hour_tier.add_bucket(bucket)
+
+    hour_bucket = hour_tier.buckets[0]
+
+    assert len(hour_tier.buckets) == 1
+    assert hour_bucket.datapoint_count == 5
+    assert hour_bucket.min_response_time == 0.1
+    assert hour_bucket.max_response_time == 2.0
+    assert hour_bucket.response_time_sum == pytest.approx(3.5)
+
+
+def test_merge_empty_bucket_changes_nothing():
+    bucket = RollupBucket()
+    bucket.add(0.5, 200)
+    bucket.merge(RollupBucket())
+
+    assert bucket.datapoint_count == 1
+    assert bucket.min_response_time == bucket.max_response_time == 0.5
+
+
+def test_merge_combines_phase_times():
+    bucket = RollupBucket()
+    bucket.add(0.5, 200, {"connect": 0.1, "ttfb": 0.4})
+
+    other = RollupBucket()
+    other.add(0.3, 200, {"ttfb": 0.3})
+    bucket.merge(other)
+
+    assert bucket.phase_time_counts["connect"] == 1
+    assert bucket.phase_time_sums["ttfb"] == pytest.approx(0.7)
+    assert bucket.get_max_phase_time("ttfb") == 0.4
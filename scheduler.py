@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import math
+import random
+import zlib
+
+
+class ScheduledJob:
+    """
+    A coroutine function run every {interval} seconds.
+    interval can be changed between runs.
+    """
+
+    __slots__ = ("callback", "interval", "deadline", "tick", "task", "cancelled")
+
+    def __init__(self, callback, interval: float, deadline: float):
+        self.callback = callback
+        self.interval = interval
+
+        # Absolute loop time of the next run, before jitter
+        self.deadline = deadline
+
+        # Wheel tick the job is due to run at
+        self.tick = None
+
+        # asyncio.Task of the latest run
+        self.task = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Hashed timing wheel running every periodic job of the
+    application from a single timer.
+
+    Jobs are placed in the wheel slot matching the tick
+    they are due at, so scheduling a job is O(1) however
+    many there are. Deadlines are absolute: each run is
+    scheduled one interval after the previous deadline rather
+    than after the previous run finished, so intervals don't
+    drift by the time the work takes.
+
+    First runs are staggered across the interval and every
+    run can be jittered to avoid thundering herds.
+    """
+
+    def __init__(self, tick: float = 0.1, slot_count: int = 512, jitter: float = 0):
+        """
+        PARAMETERS: tick: Resolution of the wheel in seconds
+                    slot_count: Number of slots in the wheel
+                    jitter: Max random delay in seconds added to
+                    each run. Does not move the following deadlines.
+        """
+        self.tick = tick
+        self.jitter = jitter
+        self.slots = [[] for _ in range(slot_count)]
+        self.job_count = 0
+
+        # Min-heap of the ticks jobs were placed at, so the next
+        # busy tick is found without scanning the slots. Entries
+        # left behind by moved jobs only cause an idle wake-up.
+        self.busy_ticks = []
+
+        # Runs skipped because the previous one was still going
+        self.overrun_count = 0
+
+        self.random = random.Random()
+        self.loop = None
+        self.current_tick = None
+        self.timer = None
+        self.timer_tick = None
+
+    def schedule(self, callback, interval: float, stagger_key: str = None):
+        """
+        Runs callback every interval seconds until cancelled.
+
+        PARAMETERS: callback: Coroutine function taking no arguments
+                    interval: Seconds between runs
+                    stagger_key: Optional string. The first run is
+                    delayed by a fraction of the interval derived from
+                    it, so jobs with the same interval don't all run
+                    together. Defaults to a full interval.
+        RETURNS: ScheduledJob instance
+        """
+        if stagger_key is None:
+            first_delay = interval
+        else:
+            first_delay = interval * (zlib.crc32(stagger_key.encode()) / 2**32)
+
+        job = ScheduledJob(callback, interval, self.get_time() + first_delay)
+        self.add_job(job)
+        self.job_count += 1
+
+        return job
+
+    def change_interval(self, job: ScheduledJob, interval: float):
+        """
+        Sets the interval of a scheduled job. A shorter interval
+        brings the next run forward rather than waiting out
+        the longer one.
+        """
+        job.interval = interval
+        deadline = self.get_time() + interval
+
+        if deadline < job.deadline and not job.cancelled:
+            self.slots[job.tick % len(self.slots)].remove(job)
+            job.deadline = deadline
+            self.add_job(job)
+
+    def get_time(self) -> float:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+
+        return self.loop.time()
+
+    def get_tick(self, when: float) -> int:
+        # Tolerates float noise, e.g. 10.0 / 0.1 > 100
+        return math.ceil(when / self.tick - 1e-9)
+
+    def add_job(self, job: ScheduledJob):
+        """
+        Places the job in the slot of the tick it is due at.
+        """
+        when = job.deadline
+
+        if self.jitter:
+            when += self.random.uniform(0, self.jitter)
+
+        job.tick = self.get_tick(when)
+
+        # Never schedule into a tick already processed
+        if self.current_tick is not None and job.tick <= self.current_tick:
+            job.tick = self.current_tick + 1
+
+        self.slots[job.tick % len(self.slots)].append(job)
+        heapq.heappush(self.busy_ticks, job.tick)
+
+        # Wake up earlier if needed. While ticks are being run
+        # there is no timer, it is armed once they are done.
+        if self.timer is not None and job.tick < self.timer_tick:
+            self.arm_timer(job.tick)
+
+    def arm_timer(self, tick: int):
+        if self.timer is not None:
+            self.timer.cancel()
+
+        self.timer_tick = tick
+        self.timer = self.loop.call_at(tick * self.tick, self.on_timer)
+
+    def get_next_busy_tick(self) -> int:
+        """
+        Returns the next tick a job is due at, or one revolution
+        of the wheel ahead if there are no jobs.
+        """
+        # Ticks already run
+        while self.busy_ticks and self.busy_ticks[0] <= self.current_tick:
+            heapq.heappop(self.busy_ticks)
+
+        if self.busy_ticks:
+            return self.busy_ticks[0]
+
+        return self.current_tick + len(self.slots)
+
+    def on_timer(self):
+        """
+        Runs the jobs of every tick up to now, catching up
+        on ticks missed if the loop was busy.
+        """
+        self.timer = self.timer_tick = None
+        now_tick = math.floor(self.loop.time() / self.tick + 1e-9)
+
+        while self.current_tick < now_tick:
+            self.current_tick += 1
+            self.run_tick(self.current_tick)
+
+        self.arm_timer(self.get_next_busy_tick())
+
+    def run_tick(self, tick: int):
+        slot_index = tick % len(self.slots)
+        due_jobs = []
+        later_jobs = []
+
+        # Jobs due on a later revolution of the wheel stay
+        for job in self.slots[slot_index]:
+            if job.tick <= tick:
+                due_jobs.append(job)
+            else:
+                later_jobs.append(job)
+
+        self.slots[slot_index] = later_jobs
+
+        for job in due_jobs:
+            if job.cancelled:
+                self.job_count -= 1
+            else:
+                self.run_job(job)
+
+    def run_job(self, job: ScheduledJob):
+        if job.task is not None and not job.task.done():
+            self.overrun_count += 1
+        else:
+            job.task = self.loop.create_task(job.callback())
+            job.task.add_done_callback(self.report_job_exception)
+
+        # Next deadline counts from this one, not from now.
+        # Periods missed entirely are skipped.
+        job.deadline += job.interval
+        now = self.loop.time()
+        if job.deadline <= now:
+            missed = math.floor((now - job.deadline) / job.interval) + 1
+            job.deadline += missed * job.interval
+
+        self.add_job(job)
+
+    def report_job_exception(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.loop.call_exception_handler(
+                {
+                    "message": "Scheduled job raised an exception",
+                    "exception": task.exception(),
+                    "task": task,
+                }
+            )
+
+    async def run(self):
+        """
+        Runs the scheduled jobs until cancelled.
+        """
+        self.get_time()
+        self.current_tick = math.floor(self.loop.time() / self.tick)
+
+        # Jobs added before now are already due. Left in their
+        # slot they would wait for the wheel to come round again.
+        overdue_jobs = []
+        for slot in self.slots:
+            overdue_jobs.extend(job for job in slot if job.tick <= self.current_tick)
+            slot[:] = [job for job in slot if job.tick > self.current_tick]
+
+        for job in overdue_jobs:
+            job.tick = self.current_tick + 1
+            self.slots[job.tick % len(self.slots)].append(job)
+            heapq.heappush(self.busy_ticks, job.tick)
+
+        self.arm_timer(self.get_next_busy_tick())
+
+        try:
+            await self.loop.create_future()
+        finally:
+            if self.timer is not None:
+                self.timer.cancel()
+
+            for slot in self.slots:
+                for job in slot:
+                    if job.task is not None:
+                        job.task.cancel()
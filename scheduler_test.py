@@ -0,0 +1,150 @@
+import asyncio
+import pytest
+from scheduler import Scheduler
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def run_scheduler_for(loop, scheduler, seconds, setup):
+    """
+    Calls setup(scheduler) inside the loop then runs
+    the scheduler for the given number of virtual seconds.
+    """
+
+    async def main():
+        setup(scheduler)
+        try:
+            await asyncio.wait_for(scheduler.run(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    loop.run_until_complete(main())
+
+
+def test_jobs_run_at_absolute_deadlines(virtual_loop):
+    run_times = []
+
+    async def slow_job():
+        run_times.append(virtual_loop.time())
+        await asyncio.sleep(3)
+
+    run_scheduler_for(virtual_loop, Scheduler(), 35, lambda s: s.schedule(slow_job, 10))
+
+    # Time spent in the job doesn't push back the next run
+    assert run_times == pytest.approx([10, 20, 30])
+
+
+def test_overrunning_jobs_are_skipped(virtual_loop):
+    scheduler = Scheduler()
+    run_count = 0
+
+    async def hung_job():
+        nonlocal run_count
+        run_count += 1
+        await asyncio.sleep(1000)
+
+    run_scheduler_for(virtual_loop, scheduler, 55, lambda s: s.schedule(hung_job, 10))
+
+    assert run_count == 1
+    assert scheduler.overrun_count == 4
+
+
+def test_stagger_key_spreads_first_runs(virtual_loop):
+    first_runs = {}
+
+    def setup(scheduler):
+        for i in range(20):
+
+            async def job(i=i):
+                first_runs.setdefault(i, virtual_loop.time())
+
+            scheduler.schedule(job, 10, stagger_key=f"http://site-{i}.com")
+
+    run_scheduler_for(virtual_loop, Scheduler(), 10, setup)
+
+    assert len(first_runs) == 20
+    assert len(set(first_runs.values())) > 10
+
+
+def test_cancelled_jobs_stop_running(virtual_loop):
+    scheduler = Scheduler()
+    run_count = 0
+
+    async def job():
+        nonlocal run_count
+        run_count += 1
+        if run_count == 2:
+            scheduled_job.cancel()
+
+    def setup(scheduler):
+        nonlocal scheduled_job
+        scheduled_job = scheduler.schedule(job, 1)
+
+    scheduled_job = None
+    run_scheduler_for(virtual_loop, scheduler, 10, setup)
+
+    assert run_count == 2
+    assert scheduler.job_count == 0
+
+
+def test_change_interval_brings_next_run_forward(virtual_loop):
+    scheduler = Scheduler()
+    run_times = []
+
+    async def job():
+        run_times.append(virtual_loop.time())
+        scheduler.change_interval(scheduler_job, 5)
+
+    def setup(s):
+        nonlocal scheduler_job
+        scheduler_job = s.schedule(job, 100)
+
+    scheduler_job = None
+    run_scheduler_for(virtual_loop, scheduler, 111, setup)
+
+    # Not waiting for 200
+    assert run_times == pytest.approx([100, 105, 110])
+
+
+def test_jobs_due_before_run_starts_run_first(virtual_loop):
+    scheduler = Scheduler()
+    run_times = []
+
+    async def job():
+        run_times.append(virtual_loop.time())
+
+    async def main():
+        scheduler.schedule(job, 10, stagger_key="http://site.com")
+        # e.g. the app still setting up other websites
+        await asyncio.sleep(20)
+        try:
+            await asyncio.wait_for(scheduler.run(), timeout=15)
+        except asyncio.TimeoutError:
+            pass
+
+    virtual_loop.run_until_complete(main())
+
+    # Not a revolution of the wheel later
+    assert run_times[0] == pytest.approx(20.1)
+
+
+def test_timer_sleeps_until_next_job(virtual_loop):
+    scheduler = Scheduler()
+    wake_ups = 0
+    on_timer = scheduler.on_timer
+
+    def counting_on_timer():
+        nonlocal wake_ups
+        wake_ups += 1
+        on_timer()
+
+    async def job():
+        pass
+
+    scheduler.on_timer = counting_on_timer
+    run_scheduler_for(virtual_loop, scheduler, 605, lambda s: s.schedule(job, 300))
+
+    # Two runs, no wake-up every revolution of the wheel
+    assert wake_ups == 2
@@ -0,0 +1,387 @@
+import argparse
+import asyncio
+import bisect
+import datetime
+import hashlib
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+from datapoint_store import PHASES
+from scheduler import Scheduler
+from simulation import NullConsoleWriter
+from website import Website
+from website_monitoring_app import App
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes. Each node
+    takes {replicas} points on the ring, so keys spread evenly
+    and changing the number of nodes only moves the keys of
+    the node added or removed.
+    """
+
+    def __init__(self, nodes, replicas: int = 100):
+        """
+        PARAMETERS: nodes: Iterable of node ids, e.g. shard indexes
+                    replicas: Number of points each node takes
+        """
+        points = sorted(
+            (self.hash(f"{node} {replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+
+        if not points:
+            raise Exception("A hash ring needs at least one node")
+
+        self.hashes = [point_hash for point_hash, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        # Stable across processes, unlike hash()
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def get_node(self, key: str):
+        """
+        RETURNS: Node owning the first point clockwise of key
+        """
+        index = bisect.bisect(self.hashes, self.hash(key))
+        return self.nodes[index % len(self.nodes)]
+
+
+class ShardWebsite(Website):
+    """
+    Website probed by a shard worker. Datapoints are queued
+    in outbox for the parent process rather than recorded
+    in local stats, unless the check interval is adaptive
+    and needs them.
+    """
+
+    def __init__(self, site_index: int, outbox: list, **kwargs):
+        """
+        PARAMETERS: site_index: Position of the website in the
+                    parent's websites_to_monitor
+                    outbox: List shared by the worker's websites
+                    kwargs: Passed on to Website
+        """
+        # Already validated by the parent
+        super().__init__(validate=False, **kwargs)
+        self.site_index = site_index
+        self.outbox = outbox
+
+        # Reports on long timeframes are left to the parent
+        self.stats.rollup_tiers = []
+
+    def record_datapoint(self, datapoint: dict):
+        response_time = datapoint["response_time"]
+
+        if isinstance(response_time, datetime.timedelta):
+            response_time = response_time.total_seconds()
+
+        # Phases as a tuple in PHASES order, NaN where not timed
+        phase_times = datapoint.get("phase_times") or {}
+        phase_times = tuple(phase_times.get(phase, math.nan) for phase in PHASES)
+
+        self.outbox.append(
+            (
+                self.site_index,
+                self.clock.monotonic_ns(),
+                response_time,
+                datapoint["response_code"],
+                phase_times,
+                datapoint.get("weight", 1),
+            )
+        )
+
+        # Read by adapt_check_interval and the alert state
+        if self.adaptive:
+            self.stats.update(datapoint)
+
+        for subscriber in self.subscribers:
+            subscriber.record_datapoint(datapoint)
+
+
+class ShardWorker(App):
+    """
+    App run in each worker process of a ShardedApp. Probes
+    its shard of the websites and sends the datapoints to
+    the parent every flush_interval seconds. Reporting and
+    alerting are left to the parent.
+    """
+
+    def __init__(
+        self,
+        shard_index: int,
+        delta_queue,
+        flush_interval: float,
+        outbox: list,
+        **kwargs,
+    ):
+        """
+        PARAMETERS: shard_index: Index of the worker
+                    delta_queue: multiprocessing.Queue read by the parent
+                    flush_interval: Seconds between sends to the parent
+                    outbox: List the ShardWebsites queue datapoints in
+                    kwargs: Passed on to App
+        """
+        self.shard_index = shard_index
+        self.delta_queue = delta_queue
+        self.flush_interval = flush_interval
+        self.outbox = outbox
+        super().__init__(console_writer=NullConsoleWriter(), **kwargs)
+
+    async def run_website_tasks(self):
+        self.scheduler = Scheduler()
+
+        # Probing only
+        self.schedule_websites([])
+
+        self.scheduler.schedule(self.flush, self.flush_interval)
+
+        await self.scheduler.run()
+
+    async def flush(self):
+        """
+        Sends the datapoints queued since the last flush,
+        along with the worker's probe stats.
+        """
+        batch = self.outbox.copy()
+        self.outbox.clear()
+
+        self.delta_queue.put((self.shard_index, batch, self.get_probe_stats()))
+
+
+def run_shard_worker(
+    shard_index: int, specs: list, delta_queue, flush_interval: float, app_kwargs
+):
+    """
+    Entry point of a worker process.
+
+    PARAMETERS: specs: list of (site_index, Website kwargs) tuples
+                app_kwargs: dict of App settings, as passed to App
+    """
+    # The parent handles Ctrl+C and terminates its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    outbox = []
+    websites = [ShardWebsite(site_index, outbox, **spec) for site_index, spec in specs]
+
+    worker = ShardWorker(
+        shard_index,
+        delta_queue,
+        flush_interval,
+        outbox,
+        websites=websites,
+        **app_kwargs,
+    )
+    asyncio.run(worker.monitor_websites())
+
+
+class ShardedApp(App):
+    """
+    App spreading the probing of its websites across worker
+    processes, one asyncio loop each, so probing isn't held to
+    a single core. Websites are consistently hashed to workers
+    by host, keeping per host limits, connection pools and DNS
+    lookups in one process.
+
+    Workers send their datapoints back in batches. The parent
+    adds them to the stats of its own Website instances and
+    owns the ConsoleWriter and alerting as usual.
+    """
+
+    def __init__(self, shard_count: int = None, flush_interval: float = 1.0, **kwargs):
+        """
+        PARAMETERS: shard_count: Number of worker processes.
+                    Defaults to the number of CPUs.
+                    flush_interval: Seconds between batches of
+                    datapoints sent by each worker
+                    kwargs: Passed on to App. Probing limits apply
+                    to each worker.
+        """
+        self.shard_count = shard_count or os.cpu_count()
+        self.flush_interval = flush_interval
+        self.ring = HashRing(range(self.shard_count))
+
+        self.delta_queue = None
+        self.workers = []
+
+        # shard index -> latest probe stats sent by the worker
+        self.shard_probe_stats = {}
+
+        super().__init__(**kwargs)
+
+    def get_shard_specs(self) -> dict:
+        """
+        RETURNS: dict of shard index -> list of (site_index, Website
+                 kwargs) tuples for the websites it probes
+        """
+        shard_specs = {}
+
+        for site_index, website in enumerate(self.websites_to_monitor):
+            spec = {
+                "url": website.url,
+                "check_interval": website.check_interval,
+                "probe_mode": website.probe_mode,
+                "connect_timeout": website.connect_timeout,
+                "read_timeout": website.read_timeout,
+                "total_timeout": website.total_timeout,
+                "adaptive": website.adaptive,
+                "max_check_interval": website.max_check_interval,
+                "fast_check_interval": website.fast_check_interval,
+            }
+
+            shard_index = self.ring.get_node(website.host)
+            shard_specs.setdefault(shard_index, []).append((site_index, spec))
+
+        return shard_specs
+
+    def get_worker_app_kwargs(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "http2": self.http2,
+            "max_in_flight": self.max_in_flight,
+            "max_per_host": self.max_per_host,
+            "max_probe_queue": self.max_probe_queue,
+            "dns_ttl": self.dns_cache.ttl_ns / 10**9,
+            "dns_cache_size": self.dns_cache.max_size,
+        }
+
+    async def monitor_websites(self):
+        """
+        Starts a worker process for each shard holding websites,
+        then reports on the datapoints they send until cancelled.
+        """
+        # Forking a process running an event loop is unsafe
+        context = multiprocessing.get_context("spawn")
+        self.delta_queue = context.Queue()
+
+        for shard_index, specs in self.get_shard_specs().items():
+            worker = context.Process(
+                target=run_shard_worker,
+                args=(
+                    shard_index,
+                    specs,
+                    self.delta_queue,
+                    self.flush_interval,
+                    self.get_worker_app_kwargs(),
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        self.attach_sinks()
+
+        try:
+            await self.run_website_tasks()
+        finally:
+            for worker in self.workers:
+                worker.terminate()
+
+            for worker in self.workers:
+                worker.join()
+
+            await self.close_sinks()
+
+    async def run_website_tasks(self):
+        self.scheduler = Scheduler()
+
+        # Reporting only, the workers probe
+        for website in self.websites_to_monitor:
+            website.schedule_tasks(
+                self.scheduler, self.schedules, self.console_writer, probe=False
+            )
+
+        coros = [
+            self.scheduler.run(),
+            self.receive_batches(),
+            self.console_writer.render_loop(),
+        ]
+
+        print(f"Beginning website monitoring in {len(self.workers)} processes...")
+
+        if "linux" in sys.platform:
+            coros.append(self.attach_shutdown_signals())
+
+        await asyncio.gather(*coros)
+
+    async def receive_batches(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            message = await loop.run_in_executor(None, self.get_message)
+
+            if message is not None:
+                shard_index, batch, probe_stats = message
+                self.shard_probe_stats[shard_index] = probe_stats
+                self.apply_batch(batch)
+
+    def get_message(self):
+        # Times out so the thread is free soon after cancelling
+        try:
+            return self.delta_queue.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    def apply_batch(self, batch: list):
+        """
+        Adds a batch of datapoints sent by a worker to the
+        stats of the websites they were probed for.
+        """
+        for (
+            site_index,
+            received_at,
+            response_time,
+            response_code,
+            phase_times,
+            weight,
+        ) in batch:
+            datapoint = {
+                "response_code": response_code,
+                "response_time": response_time,
+                "phase_times": {
+                    phase: phase_time
+                    for phase, phase_time in zip(PHASES, phase_times)
+                    if not math.isnan(phase_time)
+                },
+                "weight": weight,
+            }
+
+            website = self.websites_to_monitor[site_index]
+            website.stats.update(datapoint, received_at=received_at)
+
+            if website.datapoint_sink is not None:
+                website.datapoint_sink.write(website.get_datapoint_record(datapoint))
+
+    def get_probe_stats(self) -> dict:
+        """
+        RETURNS: dict of shard index -> probe stats of the worker,
+                 as returned by App.get_probe_stats
+        """
+        return dict(self.shard_probe_stats)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Monitors the websites listed in a file"
+        + " with probing spread across processes."
+    )
+    parser.add_argument("websites_file")
+    parser.add_argument("--shards", type=int, default=None)
+    args = parser.parse_args()
+
+    # Same schedules as website_monitoring_app.py
+    schedule1 = {"frequency": 10, "timeframe": -600}
+    schedule2 = {"frequency": 60, "timeframe": -60 * 60}
+    schedules = [schedule1, schedule2]
+
+    app = ShardedApp(shard_count=args.shards, websites_file=args.websites_file)
+    app.start_app(schedules=schedules)
@@ -0,0 +1,124 @@
+import asyncio
+import datetime
+import time
+from sharding import HashRing, ShardWebsite, ShardedApp
+from simulation import NullConsoleWriter
+from website import Website
+
+"""
+Fixtures in conftest.py
+"""
+
+KEYS = [f"site-{i}.example" for i in range(1000)]
+
+
+def test_hash_ring_spreads_keys():
+    ring = HashRing(range(4))
+    counts = [0] * 4
+
+    for key in KEYS:
+        counts[ring.get_node(key)] += 1
+
+    assert min(counts) > 150
+
+
+def test_hash_ring_only_moves_keys_to_new_node():
+    four = HashRing(range(4))
+    five = HashRing(range(5))
+
+    moved = [key for key in KEYS if four.get_node(key) != five.get_node(key)]
+
+    # Ideally a fifth of them
+    assert len(moved) < 300
+    assert {five.get_node(key) for key in moved} == {4}
+
+
+def test_websites_of_one_host_share_a_shard(virtual_clock):
+    websites = [
+        Website(url, 5, validate=False, clock=virtual_clock)
+        for url in [f"http://a.example/{i}" for i in range(10)]
+    ]
+    app = ShardedApp(
+        shard_count=4, websites=websites, console_writer=NullConsoleWriter()
+    )
+
+    (specs,) = app.get_shard_specs().values()
+
+    assert [site_index for site_index, _ in specs] == list(range(10))
+
+
+def test_worker_datapoints_reach_parent_stats(virtual_clock):
+    outbox = []
+    shard_website = ShardWebsite(
+        0, outbox, url="http://a.example", check_interval=5, clock=virtual_clock
+    )
+    shard_website.record_datapoint(
+        {
+            "response_code": 200,
+            "response_time": datetime.timedelta(milliseconds=250),
+            "phase_times": {"ttfb": 0.2},
+        }
+    )
+
+    website = Website("http://a.example", 5, validate=False, clock=virtual_clock)
+    app = ShardedApp(
+        shard_count=2, websites=[website], console_writer=NullConsoleWriter()
+    )
+    app.apply_batch(outbox)
+
+    stats = website.stats.get_updated_stats(-60)
+
+    assert stats["avg_response_time"] == 0.25
+    assert stats["avg_ttfb_time"] == 0.2
+    assert stats["avg_connect_time"] is None
+
+
+def test_spawned_workers_send_datapoints_to_parent(local_http_server):
+    website = Website(local_http_server, 1, validate=False)
+    app = ShardedApp(
+        shard_count=1,
+        flush_interval=0.2,
+        websites=[website],
+        console_writer=NullConsoleWriter(),
+    )
+    app.schedules = [{"frequency": 10, "timeframe": -60}]
+
+    async def run_until_datapoints():
+        monitoring = asyncio.ensure_future(app.monitor_websites())
+        deadline = time.monotonic() + 30
+
+        try:
+            while not len(website.stats.data_points) and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        finally:
+            monitoring.cancel()
+            await asyncio.gather(monitoring, return_exceptions=True)
+
+    asyncio.run(run_until_datapoints())
+
+    assert len(website.stats.data_points) > 0
+    assert website.stats.data_points.response_code_at(0) == 200
+    assert not any(worker.is_alive() for worker in app.workers)
+
+
+def test_adaptive_shard_websites_keep_local_state(virtual_clock):
+    outbox = []
+    shard_website = ShardWebsite(
+        0,
+        outbox,
+        url="http://a.example",
+        check_interval=5,
+        clock=virtual_clock,
+        adaptive=True,
+    )
+
+    for _ in range(3):
+        shard_website.record_datapoint(
+            {"response_code": 503, "response_time": 0.1, "weight": 5}
+        )
+    shard_website.update_local_alert_state()
+
+    # Read by adapt_check_interval
+    assert len(shard_website.stats.data_points) == 3
+    assert shard_website.stats.site_available is False
+    assert [row[-1] for row in outbox] == [5, 5, 5]
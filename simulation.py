@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import collections
+import datetime
+import random
+import selectors
+import time
+from clock import VirtualClock
+from console_writer import ConsoleWriter
+from website import Website
+from website_monitoring_app import App
+
+# Stands in for the httpx response returned by Website.ping_url
+SyntheticResponse = collections.namedtuple(
+    "SyntheticResponse", ["status_code", "elapsed"]
+)
+
+
+class VirtualTimeSelector(selectors.DefaultSelector):
+    """
+    Selector which, instead of blocking until the next timer
+    is due, advances a VirtualClock straight to it. Real file
+    descriptors are still polled so executor threads and
+    signals keep working.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        # Nothing scheduled, wait for real events only
+        if timeout is None:
+            return super().select(None)
+
+        events = super().select(0)
+
+        if not events and timeout > 0:
+            self.clock.advance(timeout)
+
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time is read from a VirtualClock.
+    asyncio.sleep and every other timer complete as soon as
+    nothing else is left to run, so hours of monitoring
+    take as long as the work done in them.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(selector=VirtualTimeSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.time()
+
+
+class SimulatedWebsite(Website):
+    """
+    Website whose probes return synthetic results after a
+    random response time, rather than making requests.
+    """
+
+    def __init__(
+        self,
+        url=None,
+        check_interval=None,
+        availability: float = 1.0,
+        mean_response_time: float = 0.1,
+        seed=None,
+        **kwargs,
+    ):
+        """
+        PARAMETERS: availability: Probability between 0 and 1
+                    of a probe returning a 200
+                    mean_response_time: In seconds. Response times
+                    are exponentially distributed around it
+                    seed: Optional seed making results repeatable
+        """
+        # Nothing to connect to
+        super().__init__(
+            url=url, check_interval=check_interval, validate=False, **kwargs
+        )
+        self.availability = availability
+        self.mean_response_time = mean_response_time
+        self.random = random.Random(seed)
+        self.probe_count = 0
+
+    async def ping_url(self, url, phase_times: dict = None) -> SyntheticResponse:
+        response_time = self.random.expovariate(1 / self.mean_response_time)
+        await asyncio.sleep(response_time)
+
+        # Connections are taken to be reused, the wait is all backend
+        if phase_times is not None:
+            phase_times["ttfb"] = response_time
+
+        self.probe_count += 1
+        status_code = 200 if self.random.random() < self.availability else 503
+
+        return SyntheticResponse(status_code, datetime.timedelta(seconds=response_time))
+
+
+class NullConsoleWriter(ConsoleWriter):
+    """
+    ConsoleWriter which formats every frame as usual
+    but writes nothing to the console.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.frames_rendered = 0
+
+    def clear_screen(self):
+        pass
+
+    def greet(self):
+        pass
+
+    def goodbye(self):
+        pass
+
+    def write_dashboards_to_console(self):
+        for _ in self.yield_frame_lines():
+            pass
+
+        self.frames_rendered += 1
+
+
+def run_simulation(app: App, schedules: list, duration: float, clock: VirtualClock):
+    """
+    Runs app.monitor_websites in virtual time until duration
+    seconds have passed on the clock, then cancels it.
+
+    PARAMETERS: app: App instance built with websites sharing clock
+                schedules: Reporting schedules as passed to App.start_app
+                duration: Virtual seconds to run for
+                clock: The VirtualClock the websites were built with
+    """
+    app.schedules = schedules
+    loop = VirtualTimeEventLoop(clock)
+    asyncio.set_event_loop(loop)
+
+    try:
+        loop.run_until_complete(
+            asyncio.wait_for(app.monitor_websites(), timeout=duration)
+        )
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        leftover_tasks = asyncio.all_tasks(loop)
+        for task in leftover_tasks:
+            task.cancel()
+
+        loop.run_until_complete(asyncio.gather(*leftover_tasks, return_exceptions=True))
+        loop.close()
+        asyncio.set_event_loop(None)
+
+
+def build_simulated_app(
+    site_count: int,
+    check_interval: int,
+    clock: VirtualClock,
+    availability: float = 1.0,
+    mean_response_time: float = 0.1,
+    adaptive: bool = False,
+) -> App:
+    """
+    RETURNS: App instance monitoring site_count SimulatedWebsites
+    """
+    websites = [
+        SimulatedWebsite(
+            url=f"http://site-{i}.simulated",
+            check_interval=check_interval,
+            availability=availability,
+            mean_response_time=mean_response_time,
+            seed=i,
+            clock=clock,
+            adaptive=adaptive,
+        )
+        for i in range(site_count)
+    ]
+
+    return App(websites=websites, console_writer=NullConsoleWriter())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Runs the monitoring pipeline against synthetic sites"
+        + " in virtual time and reports how long it took."
+    )
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--check-interval", type=int, default=10)
+    parser.add_argument("--availability", type=float, default=0.99)
+    parser.add_argument("--adaptive", action="store_true")
+    args = parser.parse_args()
+
+    # Same schedules as website_monitoring_app.py
+    schedule1 = {"frequency": 10, "timeframe": -600}
+    schedule2 = {"frequency": 60, "timeframe": -60 * 60}
+    schedules = [schedule1, schedule2]
+
+    clock = VirtualClock()
+    app = build_simulated_app(
+        args.sites,
+        args.check_interval,
+        clock,
+        availability=args.availability,
+        adaptive=args.adaptive,
+    )
+
+    started = time.perf_counter()
+    run_simulation(app, schedules, args.hours * 60 * 60, clock)
+    wall_time = time.perf_counter() - started
+
+    probes = sum(website.probe_count for website in app.websites_to_monitor)
+    print(
+        f"Simulated {args.hours}h of {args.sites} sites in {wall_time:.1f}s: "
+        + f"{probes} probes ({probes / wall_time:.0f}/s), "
+        + f"{app.console_writer.frames_rendered} frames"
+    )
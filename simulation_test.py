@@ -0,0 +1,108 @@
+import pytest
+from simulation import SimulatedWebsite, build_simulated_app, run_simulation
+
+"""
+Fixtures in conftest.py
+"""
+
+SCHEDULES = [
+    {"frequency": 10, "timeframe": -600},
+    {"frequency": 60, "timeframe": -3600},
+]
+
+
+def test_run_simulation_advances_virtual_time(simulated_app, virtual_clock):
+    run_simulation(simulated_app, SCHEDULES, 60 * 60, virtual_clock)
+
+    assert virtual_clock.time() == pytest.approx(60 * 60)
+
+
+def test_run_simulation_probes_every_site(simulated_app, virtual_clock):
+    run_simulation(simulated_app, SCHEDULES, 60 * 60, virtual_clock)
+
+    for website in simulated_app.websites_to_monitor:
+        # One probe every 10 seconds, without drift
+        assert 359 <= website.probe_count <= 360
+        assert website.dashboard.data["availability"] == 1.0
+
+
+def test_run_simulation_raises_alerts(simulated_app, virtual_clock):
+    down_website = SimulatedWebsite(
+        url="http://down.simulated",
+        check_interval=10,
+        availability=0.0,
+        clock=virtual_clock,
+    )
+    simulated_app.websites_to_monitor.append(down_website)
+
+    run_simulation(simulated_app, SCHEDULES, 10 * 60, virtual_clock)
+
+    assert len(down_website.dashboard.persisted_messages) == 1
+    assert down_website.dashboard.persisted_messages[0].startswith("Site is down")
+
+
+def test_run_simulation_closes_shared_http_client(simulated_app, virtual_clock):
+    run_simulation(simulated_app, SCHEDULES, 60, virtual_clock)
+
+    for website in simulated_app.websites_to_monitor:
+        assert website.client is simulated_app.http_client
+
+    assert simulated_app.http_client.is_closed
+
+
+def test_adaptive_intervals_cut_probes_of_stable_sites(virtual_clock):
+    app = build_simulated_app(3, 10, virtual_clock, adaptive=True)
+
+    run_simulation(app, SCHEDULES, 60 * 60, virtual_clock)
+
+    for website in app.websites_to_monitor:
+        # 360 at a fixed interval
+        assert website.probe_count < 120
+        assert website.update_job.interval > website.check_interval
+
+
+class FlappingWebsite(SimulatedWebsite):
+    """Down for the last 5 minutes of every hour"""
+
+    async def ping_url(self, url, phase_times=None):
+        response = await super().ping_url(url, phase_times)
+
+        if self.clock.time() % 3600 >= 3300:
+            response = response._replace(status_code=503)
+
+        return response
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_adaptive_intervals_dont_skew_availability(virtual_clock, adaptive):
+    website = FlappingWebsite(
+        url="http://flapping.simulated",
+        check_interval=10,
+        seed=1,
+        clock=virtual_clock,
+        adaptive=adaptive,
+    )
+    app = build_simulated_app(0, 10, virtual_clock)
+    app.websites_to_monitor.append(website)
+
+    run_simulation(app, SCHEDULES, 2 * 60 * 60, virtual_clock)
+
+    # Down 1/12th of the hour, however often it was probed
+    availability = website.stats.get_updated_stats(-3600)["availability"]
+    assert availability == pytest.approx(11 / 12, abs=0.02)
+
+
+def test_adaptive_intervals_dont_delay_alerts(simulated_app, virtual_clock):
+    down_website = SimulatedWebsite(
+        url="http://down.simulated",
+        check_interval=10,
+        availability=0.0,
+        clock=virtual_clock,
+        adaptive=True,
+    )
+    simulated_app.websites_to_monitor.append(down_website)
+
+    run_simulation(simulated_app, SCHEDULES, 10 * 60, virtual_clock)
+
+    assert len(down_website.dashboard.persisted_messages) == 1
+    assert down_website.update_job.interval == 2
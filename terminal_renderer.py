@@ -0,0 +1,94 @@
+import os
+import sys
+
+ESC = "\x1b["
+CLEAR_SCREEN = ESC + "2J"
+CLEAR_LINE_END = ESC + "K"
+HIDE_CURSOR = ESC + "?25l"
+SHOW_CURSOR = ESC + "?25h"
+
+
+def move_cursor(row: int, column: int) -> str:
+    # ANSI rows and columns count from 1
+    return f"{ESC}{row + 1};{column + 1}H"
+
+
+class TerminalRenderer:
+    """
+    Draws frames of text lines to a terminal. The last frame
+    is kept and only the characters that changed since are
+    written, after moving the cursor to them with ANSI escape
+    codes. Each frame is sent in a single write.
+    """
+
+    def __init__(self, stream=None):
+        """
+        PARAMETERS: stream: Text stream of the terminal.
+                    Defaults to sys.stdout.
+        """
+        self.stream = stream or sys.stdout
+
+        # None until the screen is cleared by the first frame
+        self.previous_lines = None
+
+    def clear(self):
+        """
+        Forgets the last frame, so the next one
+        redraws the whole screen.
+        """
+        self.previous_lines = None
+        self.stream.write(CLEAR_SCREEN + move_cursor(0, 0))
+        self.stream.flush()
+
+    def close(self):
+        """
+        Gives the cursor back below the last frame.
+        """
+        self.stream.write(SHOW_CURSOR)
+        self.stream.flush()
+
+    def render(self, lines: list) -> int:
+        """
+        Draws lines over the last frame.
+
+        RETURNS: Number of lines written to
+        """
+        buffer = []
+
+        if self.previous_lines is None:
+            buffer.append(HIDE_CURSOR + CLEAR_SCREEN)
+            previous_lines = []
+        else:
+            previous_lines = self.previous_lines
+
+        changed_count = 0
+
+        for row, line in enumerate(lines):
+            previous_line = previous_lines[row] if row < len(previous_lines) else ""
+
+            if line == previous_line:
+                continue
+
+            # Skip the start of the line if it's unchanged
+            column = len(os.path.commonprefix((line, previous_line)))
+            buffer.append(move_cursor(row, column))
+            buffer.append(line[column:])
+
+            if len(previous_line) > len(line):
+                buffer.append(CLEAR_LINE_END)
+
+            changed_count += 1
+
+        # Rows left over from a longer frame
+        for row in range(len(lines), len(previous_lines)):
+            buffer.append(move_cursor(row, 0) + CLEAR_LINE_END)
+            changed_count += 1
+
+        # Park the cursor below the frame
+        buffer.append(move_cursor(len(lines) + 1, 0))
+
+        self.stream.write("".join(buffer))
+        self.stream.flush()
+        self.previous_lines = list(lines)
+
+        return changed_count
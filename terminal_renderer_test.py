@@ -0,0 +1,63 @@
+from terminal_renderer import (
+    CLEAR_SCREEN,
+    CLEAR_LINE_END,
+    move_cursor,
+)
+
+"""
+Fixtures in conftest.py
+"""
+
+
+def take_output(renderer) -> str:
+    output = renderer.stream.getvalue()
+    renderer.stream.seek(0)
+    renderer.stream.truncate()
+    return output
+
+
+def test_first_frame_clears_screen_and_draws_every_line(renderer):
+    assert renderer.render(["abc", "def"]) == 2
+
+    output = take_output(renderer)
+    assert CLEAR_SCREEN in output
+    assert "abc" in output and "def" in output
+
+
+def test_unchanged_frame_writes_no_lines(renderer):
+    renderer.render(["abc", "def"])
+    take_output(renderer)
+
+    assert renderer.render(["abc", "def"]) == 0
+    assert take_output(renderer) == move_cursor(3, 0)
+
+
+def test_changed_line_writes_changed_characters_only(renderer):
+    renderer.render(["abc", "availability -> 100%"])
+    take_output(renderer)
+
+    assert renderer.render(["abc", "availability -> 90%"]) == 1
+
+    output = take_output(renderer)
+    assert output.startswith(move_cursor(1, 16) + "90%" + CLEAR_LINE_END)
+    assert "abc" not in output
+
+
+def test_shorter_frame_clears_leftover_lines(renderer):
+    renderer.render(["abc", "def", "ghi"])
+    take_output(renderer)
+
+    assert renderer.render(["abc"]) == 2
+
+    output = take_output(renderer)
+    assert move_cursor(1, 0) + CLEAR_LINE_END in output
+    assert move_cursor(2, 0) + CLEAR_LINE_END in output
+
+
+def test_clear_redraws_whole_frame(renderer):
+    renderer.render(["abc"])
+    renderer.clear()
+    take_output(renderer)
+
+    assert renderer.render(["abc"]) == 1
+    assert CLEAR_SCREEN in take_output(renderer)
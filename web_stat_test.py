@@ -3,6 +3,8 @@ import pytest
 from freezegun import freeze_time
 import asyncio
 from website import Website
+from web_stats import WebStat, PROBE_TIMEOUT, PROBE_ERROR
+from scheduler import Scheduler
 
 """
 Fixtures in conftest.py
@@ -61,17 +63,11 @@ datapoints_since_time_boundary_params = [
     "threshold_seconds_ago, expected", datapoints_since_time_boundary_params
 )
 def test_get_datapoints_since_time_boundary(
-    WebStat_2mins, datetimes_dict, threshold_seconds_ago, expected
+    WebStat_2mins, monotonic_ns_dict, threshold_seconds_ago, expected
 ):
 
     for i in ["now_minus_10", "now_minus_2", "now", "now_plus_2", "now_plus_10"]:
-        WebStat_2mins.data_points.append(
-            {
-                "response_code": 200,
-                "response_time": 0.05,
-                "received_at": datetimes_dict[i],
-            }
-        )
+        WebStat_2mins.data_points.append(monotonic_ns_dict[i], 0.05, 200)
 
     func_results = list(
         WebStat_2mins.get_datapoints_since_time_boundary(threshold_seconds_ago)
@@ -80,22 +76,22 @@ def test_get_datapoints_since_time_boundary(
     assert expected == actual
 
 
-def test_is_older_than_threshold_when_true(WebStat_2mins, datetimes_dict):
+def test_get_threshold_ns_is_relative_to_now(WebStat_2mins, monotonic_ns_dict):
 
-    expected = True
-    actual = WebStat_2mins.is_older_than_threshold(
-        datapoint_datetime=datetimes_dict["minus_2"], threshold_seconds_ago=125
+    expected = monotonic_ns_dict["now_minus_2"]
+    actual = WebStat_2mins.get_threshold_ns(
+        threshold_seconds_ago=-120, now_ns=monotonic_ns_dict["now"]
     )
 
     assert expected == actual
 
 
-def test_is_not_older_than_threshold_when_not(WebStat_2mins, datetimes_dict):
+def test_get_threshold_ns_defaults_to_max_observation_window(
+    WebStat_2mins, monotonic_ns_dict
+):
 
-    expected = False
-    actual = WebStat_2mins.is_older_than_threshold(
-        datapoint_datetime=datetimes_dict["now"], threshold_seconds_ago=-100
-    )
+    expected = monotonic_ns_dict["now_minus_2"]
+    actual = WebStat_2mins.get_threshold_ns(now_ns=monotonic_ns_dict["now"])
 
     assert expected == actual
 
@@ -244,3 +240,211 @@ def test_alert_generator_no_alert_expected(WebStat_2mins, gen_updates, expected)
             alert = WebStat_2mins.alert_coro.send(av)
 
     assert not alert
+
+
+"""
+Running aggregates
+"""
+
+
+def test_get_updated_stats_with_no_datapoints_returns_none_values(WebStat_2mins):
+    stats = WebStat_2mins.get_updated_stats(-60)
+    assert set(stats.values()) == {None}
+
+
+def test_get_updated_stats_matches_full_scan(WebStat_2mins_datapoints_25):
+    ws = WebStat_2mins_datapoints_25
+    ws.register_timeframe(-60)
+    ws.update({"response_code": 500, "response_time": 0.5})
+
+    stats = ws.get_updated_stats(-60)
+
+    assert stats["availability"] == ws.get_availability(-60)
+    assert stats["avg_response_time"] == pytest.approx(ws.get_avg_response_time(-60))
+    assert stats["max_response_time"] == ws.get_max_response_time(-60)
+
+
+def test_get_updated_stats_evicts_datapoints_outside_timeframe(WebStat_25mins):
+
+    with freeze_time(d["25_0"]):
+        WebStat_25mins.register_timeframe(-60)
+        WebStat_25mins.update({"response_code": 500, "response_time": 2.0})
+
+    with freeze_time(d["25_30"]):
+        WebStat_25mins.update({"response_code": 200, "response_time": 0.5})
+
+    with freeze_time(d["26_1"]):
+        stats = WebStat_25mins.get_updated_stats(-60)
+
+    assert stats["availability"] == 1.0
+    assert stats["avg_response_time"] == 0.5
+    assert stats["max_response_time"] == 0.5
+
+
+def test_get_updated_stats_includes_percentiles(WebStat_2mins_datapoints_25):
+    stats = WebStat_2mins_datapoints_25.get_updated_stats(-60)
+
+    # The single 1 second outlier only shows in the max
+    assert stats["p50_response_time"] == pytest.approx(0.05, rel=0.01)
+    assert stats["p99_response_time"] == pytest.approx(0.05, rel=0.01)
+    assert stats["max_response_time"] == 1
+
+
+def test_get_updated_stats_beyond_max_observation_window_uses_rollups(
+    WebStat_2mins,
+):
+
+    with freeze_time(d["25_0"]):
+        WebStat_2mins.update({"response_code": 500, "response_time": 2.0})
+
+    with freeze_time(d["29_0"]):
+        WebStat_2mins.update({"response_code": 200, "response_time": 0.5})
+        hourly_stats = WebStat_2mins.get_updated_stats(-3600)
+        two_minute_stats = WebStat_2mins.get_updated_stats(-120)
+
+    # Only the latest datapoint is still held raw
+    assert len(WebStat_2mins.data_points) == 1
+    assert two_minute_stats["availability"] == 1.0
+
+    assert hourly_stats["availability"] == 0.5
+    assert hourly_stats["avg_response_time"] == 1.25
+    assert hourly_stats["max_response_time"] == 2.0
+
+
+def test_alert_generator_reads_injected_clock(virtual_clock):
+    ws = WebStat(max_observation_window=-120, clock=virtual_clock)
+
+    ws.alert_coro.send(0.0)
+    virtual_clock.advance(150)
+    alert = ws.alert_coro.send(0.0)
+
+    assert alert == "Site is down 2020-01-22 12:27:30"
+    assert alert.kind == "down"
+    assert alert.timestamp == virtual_clock.now()
+    assert alert.availability == 0.0
+
+
+def test_timeouts_count_against_availability_only(WebStat_2mins):
+    WebStat_2mins.register_timeframe(-60)
+    WebStat_2mins.update({"response_code": 200, "response_time": 0.5})
+    WebStat_2mins.update({"response_code": PROBE_TIMEOUT, "response_time": 15.0})
+    WebStat_2mins.update({"response_code": PROBE_ERROR, "response_time": 0.1})
+
+    stats = WebStat_2mins.get_updated_stats(-60)
+
+    assert stats["availability"] == pytest.approx(1 / 3)
+    assert stats["avg_response_time"] == 0.5
+    assert stats["max_response_time"] == 0.5
+    assert stats["timeouts"] == 1
+    assert stats["errors"] == 1
+    assert WebStat_2mins.get_avg_response_time(-60) == 0.5
+
+
+def test_partial_content_counts_as_available(WebStat_2mins):
+    WebStat_2mins.register_timeframe(-60)
+    WebStat_2mins.update({"response_code": 206, "response_time": 0.1})
+    WebStat_2mins.update({"response_code": 404, "response_time": 0.1})
+
+    assert WebStat_2mins.get_updated_stats(-60)["availability"] == 0.5
+    assert WebStat_2mins.get_availability(-60) == 0.5
+
+
+def test_get_updated_stats_includes_phase_times(WebStat_2mins):
+    WebStat_2mins.register_timeframe(-60)
+    WebStat_2mins.update(
+        {
+            "response_code": 200,
+            "response_time": 0.5,
+            "phase_times": {"connect": 0.1, "ttfb": 0.3},
+        }
+    )
+    WebStat_2mins.update(
+        {"response_code": 200, "response_time": 0.2, "phase_times": {"ttfb": 0.2}}
+    )
+
+    stats = WebStat_2mins.get_updated_stats(-60)
+
+    # Connect was only timed once, the second probe reused the connection
+    assert stats["avg_connect_time"] == 0.1
+    assert stats["avg_ttfb_time"] == pytest.approx(0.25)
+    assert stats["max_ttfb_time"] == 0.3
+    assert stats["avg_tls_time"] is None
+
+
+def test_alert_state_is_exposed(virtual_clock):
+    ws = WebStat(max_observation_window=-120, clock=virtual_clock)
+    assert ws.site_available is None
+
+    ws.alert_coro.send(0.0)
+    virtual_clock.advance(150)
+    ws.alert_coro.send(0.0)
+
+    assert ws.site_available is False
+    assert ws.awaiting_recovery is True
+
+
+def test_plan_retention_keeps_what_reports_need(virtual_clock):
+    ws = WebStat(clock=virtual_clock)
+    ws.register_timeframe(-30)
+
+    ws.plan_retention([-60, -60, -3600])
+
+    assert ws.max_observation_window == -3600
+    assert ws.rollup_tiers == []
+    assert set(ws.timeframe_aggregates) == {-60, -3600}
+
+    for _ in range(400):
+        ws.update({"response_code": 200, "response_time": 0.1})
+        virtual_clock.advance(10)
+
+    # The hour is reported on from raw datapoints
+    assert ws.get_updated_stats(-3600)["availability"] == 1.0
+    assert 359 <= len(ws.data_points) <= 361
+
+
+def test_plan_retention_rolls_up_timeframes_over_max_window(virtual_clock):
+    ws = WebStat(clock=virtual_clock)
+
+    ws.plan_retention([-60, -24 * 3600], max_window=-600)
+
+    assert ws.max_observation_window == -600
+    assert ws.rollup_tiers
+    assert set(ws.timeframe_aggregates) == {-60}
+
+
+def test_plan_retention_sizes_rollups_to_timeframes(virtual_clock):
+    ws = WebStat(clock=virtual_clock)
+
+    ws.plan_retention([-600, -2 * 3600], max_window=-3600)
+
+    # Hour of raw datapoints, the hour before in 2 minute buckets
+    assert ws.max_observation_window == -3600
+    assert [(t.bucket_seconds, t.retention_seconds) for t in ws.rollup_tiers] == [
+        (120, 2 * 3600 + 120)
+    ]
+
+    # Down for the first 3 hours, then up
+    for i in range(4 * 360 + 7):
+        code = 200 if i >= 3 * 360 else 503
+        ws.update({"response_code": code, "response_time": 0.1})
+        virtual_clock.advance(10)
+
+    # Only part of a bucket straddles the start of the timeframe
+    stats = ws.get_updated_stats(-2 * 3600)
+    assert stats["availability"] == pytest.approx(0.5, abs=12 / 720)
+
+
+def test_schedules_size_website_retention(virtual_clock, virtual_loop, writer):
+    website = Website("http://site.com", 10, clock=virtual_clock, validate=False)
+    schedules = [
+        {"frequency": 10, "timeframe": -60},
+        {"frequency": 30, "timeframe": -60},
+    ]
+
+    async def schedule():
+        website.schedule_tasks(Scheduler(), schedules, writer)
+
+    virtual_loop.run_until_complete(schedule())
+
+    assert website.stats.max_observation_window == -60
+    assert list(website.stats.timeframe_aggregates) == [-60]
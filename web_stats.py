@@ -1,19 +1,311 @@
 from collections import deque
 import datetime
+import functools
+import math
+from alert_store import Alert
+from clock import Clock
+from datapoint_store import DatapointStore, PHASES
+from latency_histogram import LatencyHistogram
+from rollup import RollupBucket, RollupTier
+from rollup import AVAILABLE_CODES, PROBE_TIMEOUT, PROBE_ERROR
+
+# Response time percentiles included in every report
+REPORTED_PERCENTILES = {
+    "p50_response_time": 0.5,
+    "p95_response_time": 0.95,
+    "p99_response_time": 0.99,
+}
+
+# (bucket_seconds, retention_seconds) of each rollup tier, finest first.
+# Datapoints leaving the max_observation_window are folded into 1 minute
+# buckets kept for an hour, then into 1 hour buckets kept for a week.
+DEFAULT_ROLLUP_TIERS = ((60, 60 * 60), (60 * 60, 7 * 24 * 60 * 60))
+
+# Longest max_observation_window plan_retention sizes to.
+# Longer timeframes are reported on from the rollup tiers.
+MAX_PLANNED_WINDOW = -60 * 60
+
+# Buckets covering each timeframe planned over the window. A
+# bucket straddling its start is included whole, so reports
+# are off by at most 1/60th of the timeframe.
+ROLLUP_BUCKETS_PER_TIMEFRAME = 60
+
+
+@functools.lru_cache(maxsize=None)
+def plan_rollup_tiers(timeframes: tuple, max_window: int) -> tuple:
+    """
+    One rollup tier per timeframe longer than max_window,
+    shortest first. Bucket widths divide the timeframe and
+    the width of the finer tier, and each tier is kept for
+    its timeframe plus one bucket.
+
+    Cached, every website usually plans the same timeframes.
+
+    PARAMETERS: timeframes: Tuple of negative integers
+                max_window: Negative integer
+    RETURNS: tuple of (bucket_seconds, retention_seconds) tuples
+    """
+    tiers = []
+    bucket_seconds = None
+
+    for span in sorted({-t for t in timeframes if t < max_window}):
+        target = max(1, span // ROLLUP_BUCKETS_PER_TIMEFRAME)
+
+        for width in range(target, 0, -1):
+            if span % width == 0 and (
+                bucket_seconds is None or width % bucket_seconds == 0
+            ):
+                bucket_seconds = width
+                break
+
+        tiers.append((bucket_seconds, span + bucket_seconds))
+
+    return tuple(tiers)
+
+
+def build_updated_stats(summary) -> dict:
+    """
+    Builds the dict returned by WebStat.get_updated_stats from
+    a TimeframeAggregate or RollupBucket. Probes which got no
+    HTTP response count against availability but not in the
+    response times.
+    """
+    if summary.datapoint_count:
+        availability = summary.available_count / summary.datapoint_count
+    else:
+        availability = None
+
+    if summary.response_count:
+        avg_response_time = summary.response_time_sum / summary.response_count
+    else:
+        avg_response_time = None
+
+    updated_stats = {
+        "availability": availability,
+        "avg_response_time": avg_response_time,
+        "max_response_time": summary.get_max_response_time(),
+    }
+
+    for key, quantile in REPORTED_PERCENTILES.items():
+        updated_stats[key] = summary.histogram.get_quantile(quantile)
+
+    for phase in PHASES:
+        count = summary.phase_time_counts[phase]
+        total = summary.phase_time_sums[phase]
+
+        updated_stats[f"avg_{phase}_time"] = total / count if count else None
+        updated_stats[f"max_{phase}_time"] = summary.get_max_phase_time(phase)
+
+    # Nothing to count yet either
+    if summary.datapoint_count:
+        updated_stats["timeouts"] = summary.timeout_count
+        updated_stats["errors"] = summary.error_count
+    else:
+        updated_stats["timeouts"] = updated_stats["errors"] = None
+
+    return updated_stats
+
+
+class TimeframeAggregate:
+    """
+    Running aggregates over the datapoints received during
+    the last {timeframe} seconds.
+
+    The window is a range of positions in a DatapointStore.
+    Datapoints enter on the right as they are received and
+    leave on the left once they fall outside the timeframe,
+    so sum, count, available count, max and the percentile
+    histogram are all kept up to date without rescanning
+    the window.
+
+    Counts are weighted: each datapoint counts for the seconds
+    of probing it stands for, so a site probed faster while
+    failing isn't reported as down for longer than it was.
+    Timeouts and errors are plain counts of probes.
+    """
+
+    def __init__(self, timeframe: int, data_points: DatapointStore):
+        """
+        PARAMETERS: timeframe: Negative integer representing
+                    the number of seconds covered by the aggregate
+                    data_points: DatapointStore the window refers to
+        """
+        self.timeframe = timeframe
+        self.data_points = data_points
+
+        # Position of the oldest datapoint in the window
+        self.start = data_points.end
+
+        self.response_time_sum = 0.0
+        self.datapoint_count = 0
+        self.available_count = 0
+
+        # Probes which got an HTTP response, and those which didn't
+        self.response_count = 0
+        self.timeout_count = 0
+        self.error_count = 0
+
+        # Positions with decreasing response times.
+        # The leftmost one holds the window max.
+        self.max_candidates = deque()
+
+        self.histogram = LatencyHistogram()
+
+        # Same for each request phase, counting only
+        # the datapoints which went through it
+        self.phase_time_sums = dict.fromkeys(PHASES, 0.0)
+        self.phase_time_counts = dict.fromkeys(PHASES, 0)
+        self.phase_max_candidates = {phase: deque() for phase in PHASES}
+
+    def add(self, position: int):
+        """
+        Adds the datapoint at position to the right of the window.
+        """
+        response_time = self.data_points.response_time_at(position)
+        response_code = self.data_points.response_code_at(position)
+        weight = self.data_points.weight_at(position)
+
+        self.datapoint_count += weight
+        self.add_phase_times(position, weight)
+
+        if response_code in AVAILABLE_CODES:
+            self.available_count += weight
+
+        # No response time to speak of
+        if response_code == PROBE_TIMEOUT:
+            self.timeout_count += 1
+            return
+        if response_code == PROBE_ERROR:
+            self.error_count += 1
+            return
+
+        self.response_count += weight
+        self.response_time_sum += response_time * weight
+        self.histogram.add(response_time, weight)
+
+        # Smaller values can never be the max again
+        while (
+            self.max_candidates
+            and self.data_points.response_time_at(self.max_candidates[-1])
+            <= response_time
+        ):
+            self.max_candidates.pop()
+
+        self.max_candidates.append(position)
+
+    def evict_older_than(self, threshold_ns: int):
+        """
+        Moves the left of the window past datapoints received
+        before threshold_ns. The boundary is found by binary
+        search, then each evicted datapoint is subtracted once.
+        """
+        new_start = self.data_points.position_since(threshold_ns, lo=self.start)
+
+        for position in range(self.start, new_start):
+            response_time = self.data_points.response_time_at(position)
+            response_code = self.data_points.response_code_at(position)
+            weight = self.data_points.weight_at(position)
+
+            self.datapoint_count -= weight
+            self.remove_phase_times(position, weight)
+
+            if response_code in AVAILABLE_CODES:
+                self.available_count -= weight
+            elif response_code == PROBE_TIMEOUT:
+                self.timeout_count -= 1
+                continue
+            elif response_code == PROBE_ERROR:
+                self.error_count -= 1
+                continue
+
+            self.response_count -= weight
+            self.response_time_sum -= response_time * weight
+            self.histogram.remove(response_time, weight)
+
+        while self.max_candidates and self.max_candidates[0] < new_start:
+            self.max_candidates.popleft()
+
+        for candidates in self.phase_max_candidates.values():
+            while candidates and candidates[0] < new_start:
+                candidates.popleft()
+
+        # Avoid carrying rounding errors into the next window
+        if not self.response_count:
+            self.response_time_sum = 0.0
+
+        for phase, count in self.phase_time_counts.items():
+            if not count:
+                self.phase_time_sums[phase] = 0.0
+
+        self.start = max(new_start, self.start)
+
+    def add_phase_times(self, position: int, weight: int):
+        for phase, candidates in self.phase_max_candidates.items():
+            phase_time = self.data_points.phase_time_at(phase, position)
+
+            # Phase not timed for this datapoint
+            if math.isnan(phase_time):
+                continue
+
+            self.phase_time_sums[phase] += phase_time * weight
+            self.phase_time_counts[phase] += weight
+
+            while (
+                candidates
+                and self.data_points.phase_time_at(phase, candidates[-1]) <= phase_time
+            ):
+                candidates.pop()
+
+            candidates.append(position)
+
+    def remove_phase_times(self, position: int, weight: int):
+        for phase in PHASES:
+            phase_time = self.data_points.phase_time_at(phase, position)
+
+            if not math.isnan(phase_time):
+                self.phase_time_sums[phase] -= phase_time * weight
+                self.phase_time_counts[phase] -= weight
+
+    def get_max_response_time(self) -> float:
+        if not self.max_candidates:
+            return None
+
+        return self.data_points.response_time_at(self.max_candidates[0])
+
+    def get_max_phase_time(self, phase: str) -> float:
+        candidates = self.phase_max_candidates[phase]
+
+        if not candidates:
+            return None
+
+        return self.data_points.phase_time_at(phase, candidates[0])
+
+    def get_updated_stats(self) -> dict:
+        """
+        RETURNS: dict of the same format as WebStat.get_updated_stats
+        """
+        return build_updated_stats(self)
 
 
 class WebStat:
     """
     WebStat holds enough datapoints to report on
     the maximum observation window (default is -600 seconds
-    i.e. 10 minutes ago).
+    i.e. 10 minutes ago). Older datapoints are downsampled
+    into rollup tiers so longer timeframes can still be
+    reported on with a fixed amount of memory.
 
     Provides methods to generate statistics and a coroutine
     which acts as a state machine, returning warnings if
     certain conditions are met.
     """
 
-    def __init__(self, max_observation_window: int = -600):
+    def __init__(
+        self,
+        max_observation_window: int = -600,
+        rollup_tiers=DEFAULT_ROLLUP_TIERS,
+        clock: Clock = None,
+    ):
         """
         PARAMETERS:
         max_observation_window:
@@ -21,12 +313,139 @@ class WebStat:
             of historical datapoints should be kept in self.data_points.
 
             Defaults to 10 minutes.
+        rollup_tiers:
+            Iterable of (bucket_seconds, retention_seconds) tuples,
+            finest first. Empty to discard datapoints leaving
+            the max_observation_window.
+        clock:
+            Clock instance all times are read from.
+            Defaults to the real time.
         """
-        self.data_points = deque()
+        self.clock = clock or Clock()
+        self.data_points = DatapointStore()
         self.mandatory_datapoint_keys = {"response_time", "response_code"}
+        self.optional_datapoint_keys = {"phase_times", "weight", "probe_mode"}
         self.max_observation_window = max_observation_window
+
+        # Alert state, kept up to date by alert_generator so
+        # probing can be adapted to it
+        self.site_available = None
+        self.awaiting_recovery = False
+
         self.alert_coro = self.get_alert_coro()
 
+        # TimeframeAggregate instances keyed by timeframe
+        self.timeframe_aggregates = {}
+
+        self.rollup_tiers = [
+            RollupTier(bucket_seconds, retention_seconds)
+            for bucket_seconds, retention_seconds in rollup_tiers
+        ]
+
+    def plan_retention(self, timeframes, max_window: int = MAX_PLANNED_WINDOW):
+        """
+        Keeps exactly what reports on the timeframes need. Raw
+        datapoints are held for the longest timeframe, up to
+        max_window, and longer timeframes get rollup tiers
+        sized to them, see plan_rollup_tiers. Each distinct
+        timeframe gets one TimeframeAggregate, shared by
+        every report on it, and aggregates of other
+        timeframes are dropped.
+
+        Meant to be called before datapoints come in.
+
+        PARAMETERS: timeframes: Iterable of negative integers,
+                    as in the reporting schedules
+                    max_window: Negative integer, cap of the
+                    max_observation_window
+        """
+        timeframes = set(timeframes)
+        longest = min(timeframes)
+
+        self.max_observation_window = max(longest, max_window)
+        self.rollup_tiers = [
+            RollupTier(bucket_seconds, retention_seconds)
+            for bucket_seconds, retention_seconds in plan_rollup_tiers(
+                tuple(sorted(timeframes)), max_window
+            )
+        ]
+
+        for timeframe in list(self.timeframe_aggregates):
+            if timeframe not in timeframes:
+                del self.timeframe_aggregates[timeframe]
+
+        # Reported on from the rollup tiers, not an aggregate
+        for timeframe in timeframes:
+            if timeframe >= self.max_observation_window:
+                self.register_timeframe(timeframe)
+
+    def register_timeframe(self, timeframe: int) -> TimeframeAggregate:
+        """
+        Starts maintaining running aggregates for the timeframe
+        so reports on it no longer need to iterate over
+        self.data_points. Seeded from the datapoints already held.
+
+        PARAMETERS: timeframe: Negative integer representing
+                    the number of seconds to report on
+        RETURNS: TimeframeAggregate instance
+        """
+        aggregate = self.timeframe_aggregates.get(timeframe)
+
+        if aggregate is None:
+            aggregate = TimeframeAggregate(timeframe, self.data_points)
+            aggregate.start = self.data_points.position_since(
+                self.get_aggregate_threshold_ns(timeframe)
+            )
+
+            for position in range(aggregate.start, self.data_points.end):
+                aggregate.add(position)
+
+            self.timeframe_aggregates[timeframe] = aggregate
+
+        return aggregate
+
+    def get_threshold_ns(
+        self, threshold_seconds_ago: int = None, now_ns: int = None
+    ) -> int:
+        """
+        Converts a number of seconds relative to now into
+        a monotonic timestamp comparable with those held in
+        self.data_points. If threshold_seconds_ago is not passed,
+        the class instance's max_observation_window is used.
+
+        PARAMETERS: threshold_seconds_ago: Negative integer
+                    now_ns: Optional monotonic timestamp to use as now
+        RETURNS: int, nanoseconds
+        """
+        if not threshold_seconds_ago:
+            threshold_seconds_ago = self.max_observation_window
+
+        if now_ns is None:
+            now_ns = self.clock.monotonic_ns()
+
+        return now_ns + int(threshold_seconds_ago * 1e9)
+
+    def get_aggregate_threshold_ns(self, timeframe: int, now_ns: int = None) -> int:
+        """
+        Datapoints received before the returned timestamp are
+        outside the timeframe. Timeframes longer than the
+        max_observation_window are capped to it, as those
+        datapoints are no longer held.
+        """
+        return self.get_threshold_ns(
+            max(timeframe, self.max_observation_window), now_ns=now_ns
+        )
+
+    def evict_old_aggregate_datapoints(self, now_ns: int = None):
+        """
+        Removes datapoints which have fallen outside
+        their timeframe from every registered aggregate.
+        """
+        for timeframe, aggregate in self.timeframe_aggregates.items():
+            aggregate.evict_older_than(
+                self.get_aggregate_threshold_ns(timeframe, now_ns=now_ns)
+            )
+
     def get_alert_coro(self):
         """
         Returns a primed alert coroutine.
@@ -50,6 +469,9 @@ class WebStat:
         If a down website is at 80% or more availability
         for at least 2 minutes, send an alert that is is
         no longer down.
+
+        The state is mirrored in self.site_available and
+        self.awaiting_recovery.
         """
 
         # No alert exists yet
@@ -59,7 +481,7 @@ class WebStat:
         awaiting_recovery = False
 
         # Tracks time in a particular state
-        in_state_since = datetime.datetime.now()
+        in_state_since = self.clock.now()
 
         # Is availability higher than 80%
         site_available = None
@@ -81,11 +503,12 @@ class WebStat:
 
             # Reset each time state changes
             if availability_state_change:
-                in_state_since = datetime.datetime.now()
+                in_state_since = self.clock.now()
 
             site_available = is_available(latest_availability)
+            self.site_available = site_available
 
-            time_in_state = datetime.datetime.now() - in_state_since
+            time_in_state = self.clock.now() - in_state_since
 
             more_than_2_minutes_in_state = time_in_state.seconds > 120
 
@@ -95,13 +518,35 @@ class WebStat:
                 and more_than_2_minutes_in_state
                 and not awaiting_recovery
             ):
-                alert = f"Site is down {datetime.datetime.now()}"
+                now = self.clock.now()
+                alert = Alert(
+                    f"Site is down {now}",
+                    timestamp=now,
+                    kind="down",
+                    availability=latest_availability,
+                )
                 awaiting_recovery = True
+                self.awaiting_recovery = True
 
             # Condition 2
             if site_available and more_than_2_minutes_in_state and awaiting_recovery:
-                alert = f"Site is back {datetime.datetime.now()}"
+                now = self.clock.now()
+                alert = Alert(
+                    f"Site is back {now}",
+                    timestamp=now,
+                    kind="back",
+                    availability=latest_availability,
+                )
                 awaiting_recovery = False
+                self.awaiting_recovery = False
+
+    def get_window_start(self, threshold_seconds_ago: int) -> int:
+        """
+        Returns the physical index in the self.data_points columns
+        of the first datapoint within the threshold.
+        """
+        threshold_ns = self.get_threshold_ns(threshold_seconds_ago)
+        return self.data_points.position_since(threshold_ns) - self.data_points.offset
 
     def get_datapoints_since_time_boundary(self, threshold_seconds_ago: int):
         """
@@ -114,175 +559,282 @@ class WebStat:
         RETURNS: None
         YIELDS: datapoint dictionaries
         """
-        for datapoint in self.data_points:
+        store = self.data_points
+
+        for i in range(
+            self.get_window_start(threshold_seconds_ago), len(store.received_at)
+        ):
+            yield {
+                "response_code": store.response_codes[i],
+                "response_time": store.response_times[i],
+                "received_at": store.received_at[i],
+            }
+
+    def get_response_times_since(self, threshold_seconds_ago: int) -> list:
+        """
+        RETURNS: Response times of probes which got an HTTP
+                 response, no more than threshold_seconds_ago
+        """
+        start = self.get_window_start(threshold_seconds_ago)
+        store = self.data_points
 
-            datapoint_too_old = self.is_older_than_threshold(
-                datapoint["received_at"], threshold_seconds_ago=threshold_seconds_ago
+        return [
+            response_time
+            for response_time, response_code in zip(
+                store.response_times[start:], store.response_codes[start:]
             )
-
-            if not datapoint_too_old:
-                yield datapoint
+            if response_code >= 0
+        ]
 
     def get_max_response_time(self, threshold_seconds_ago: int):
         """
-        Iterates over datapoints finding and returning the max response time.
+        Finds and returns the max response time.
 
         PARAMETERS: threshold_seconds_ago: Include data since this number of seconds
         RETURNS: float
         """
-        timebound_datapoints = self.get_datapoints_since_time_boundary(
-            threshold_seconds_ago
-        )
-
-        max_response_time = None
-
-        for dp in timebound_datapoints:
+        response_times = self.get_response_times_since(threshold_seconds_ago)
 
-            if max_response_time:
-                max_response_time = max(dp["response_time"], max_response_time)
-            else:
-                max_response_time = dp["response_time"]
+        return max(response_times) if response_times else None
 
-        return max_response_time
-
-    def get_avg_response_time(self, threshold_seconds_ago: int) -> datetime.timedelta:
+    def get_avg_response_time(self, threshold_seconds_ago: int) -> float:
         """
-        Iterates over datapoints building average response time.
+        Calculates average response time.
 
         PARAMETERS: threshold_seconds_ago: Negative integer representing
                     to number of seconds ago from which to include data_points
 
-        RETURNS: datetime.timedelta
+        RETURNS: float, seconds
         """
-        timebound_datapoints = self.get_datapoints_since_time_boundary(
-            threshold_seconds_ago
-        )
-        response_time_sum = None
-        datapoint_count = 0
-        avg_response_time = None
-
-        for dp in timebound_datapoints:
-            datapoint_count += 1
-
-            if response_time_sum:
-                response_time_sum += dp["response_time"]
-            else:
-                response_time_sum = dp["response_time"]
+        start = self.get_window_start(threshold_seconds_ago)
+        store = self.data_points
+
+        # Weighted as in TimeframeAggregate
+        weighted = [
+            (response_time * weight, weight)
+            for response_time, response_code, weight in zip(
+                store.response_times[start:],
+                store.response_codes[start:],
+                store.weights[start:],
+            )
+            if response_code >= 0
+        ]
 
-        try:
-            avg_response_time = response_time_sum / datapoint_count
-        except (ZeroDivisionError, TypeError):
-            avg_response_time = None
+        if not weighted:
+            return None
 
-        return avg_response_time
+        return sum(total for total, _ in weighted) / sum(w for _, w in weighted)
 
     def get_availability(self, threshold_seconds_ago: int):
         """
-        Iterates over datapoints. Where response_codes are equal to 200
-        the website is considered to be available. In any other case 
+        Where response_codes are in AVAILABLE_CODES (200, or 206
+        for ranged probes) the website is considered to be available. In any other case 
         the website is considered that the website is down.
 
         PARAMETERS: threshold_seconds_ago: Include data since this number of seconds
         RETURNS: float
         """
-        timebound_datapoints = self.get_datapoints_since_time_boundary(
-            # datapoint_datetime=datetime.datetime.now(),
-            threshold_seconds_ago=threshold_seconds_ago
-        )
-        available_count = 0
-        datapoint_count = 0
+        start = self.get_window_start(threshold_seconds_ago)
+        response_codes = self.data_points.response_codes[start:]
+        weights = self.data_points.weights[start:]
 
-        for dp in timebound_datapoints:
-            if dp["response_code"] == 200:
-                available_count += 1
+        if not response_codes:
+            return None
 
-            datapoint_count += 1
-
-        try:
-            availability = available_count / datapoint_count
-        except ZeroDivisionError:
-            availability = None
+        available = sum(
+            weight
+            for code, weight in zip(response_codes, weights)
+            if code in AVAILABLE_CODES
+        )
 
-        return availability
+        return available / sum(weights)
 
-    def update(self, new_datapoint: dict):
+    def update(self, new_datapoint: dict, received_at: int = None):
         """
         Adds received datapoint and pops datapoints outside the 
         max_observed_time.
 
         PARAMETERS: new_datapoint
+                    received_at: Optional monotonic timestamp in
+                    nanoseconds, for datapoints received elsewhere
+                    e.g. by a shard worker. Defaults to now.
         RETURNS: None
         """
-        self.add_new_datapoint(new_datapoint)
+        now_ns = self.clock.monotonic_ns()
 
-        if self.data_points:
-            self.pop_old_datapoints()
+        if received_at is None:
+            received_at = now_ns
 
-    def add_new_datapoint(self, new_datapoint: dict):
+        position = self.add_new_datapoint(new_datapoint, received_at=received_at)
+
+        for aggregate in self.timeframe_aggregates.values():
+            aggregate.add(position)
+
+        self.expire_old_datapoints(now_ns)
+
+    def add_new_datapoint(self, new_datapoint: dict, received_at: int = None) -> int:
         """
         Checks passed datapoint for compilence with Stat class
-        mandatory_datapoint_keys. Adds a 'received_at' datetime object
-        and appends to datapoints if all correct, else raises exception.
+        mandatory_datapoint_keys and appends it to self.data_points
+        if correct, else raises exception.
 
         PARAMETERS:
             new_datapoint: dictionary like obj with 
-            'response_time' and 'response_code' keys
-        RETURNS: None
+            'response_time' and 'response_code' keys.
+            response_time can be a float in seconds or a timedelta.
+            An optional 'phase_times' dict holds seconds by phase
+            and an optional 'weight' the seconds of probing the
+            datapoint stands for, see TimeframeAggregate.
+            received_at: Optional monotonic timestamp in nanoseconds.
+            Defaults to now.
+        RETURNS: Position of the datapoint in self.data_points
         """
 
         # Only accepts complient datapoints
-        correct_structure = self.mandatory_datapoint_keys == set(new_datapoint)
-
-        if correct_structure:
-
-            new_datapoint["received_at"] = datetime.datetime.now()
-            self.data_points.append(new_datapoint)
+        datapoint_keys = set(new_datapoint)
+        correct_structure = self.mandatory_datapoint_keys <= datapoint_keys and (
+            datapoint_keys - self.mandatory_datapoint_keys
+            <= self.optional_datapoint_keys
+        )
 
-        else:
+        if not correct_structure:
             raise Exception(
                 "Datapoint does not compy with "
                 + "Stat classes mandatory_datapoint_keys"
             )
 
-    def is_older_than_threshold(
-        self, datapoint_datetime: datetime, threshold_seconds_ago: int = None
-    ):
-        """
-        Returns True if passed parameter falls outside time peridod
-        defined by the threshold_minutes_ago parameter. 
-        If the threshold_minutes_ago parameter is not passed,
-        the class instance's max_observed_time is used as the threshold.
+        response_time = new_datapoint["response_time"]
 
-        PARAMETERS: datapoint_datetime
-        RETURNS: bool
-        """
-        if not threshold_seconds_ago:
-            threshold_seconds_ago = self.max_observation_window
+        # httpx reports elapsed time as a timedelta
+        if isinstance(response_time, datetime.timedelta):
+            response_time = response_time.total_seconds()
 
-        now = datetime.datetime.now()
-        threshold = now + datetime.timedelta(seconds=threshold_seconds_ago)
-        out_of_time_bounds = datapoint_datetime < threshold
-        return out_of_time_bounds
+        if received_at is None:
+            received_at = self.clock.monotonic_ns()
+
+        position = self.data_points.end
+        self.data_points.append(
+            received_at,
+            response_time,
+            new_datapoint["response_code"],
+            new_datapoint.get("phase_times"),
+            new_datapoint.get("weight", 1),
+        )
 
-    def pop_old_datapoints(self):
+        return position
+
+    def expire_old_datapoints(self, now_ns: int):
+        """
+        Evicts datapoints from the aggregates, then from self.data_points.
+        Aggregates read the values they evict so must go first.
         """
-        Iterate over the self.data_points from
-        the left (i.e. oldest first), popping those whose 'received_at'
-        value is older than the calculated time boundary
+        self.evict_old_aggregate_datapoints(now_ns=now_ns)
+        self.pop_old_datapoints(now_ns=now_ns)
 
-        PARAMETERS: None
+    def pop_old_datapoints(self, now_ns: int = None):
+        """
+        Drops the datapoints from the left of self.data_points
+        (i.e. oldest first) received before the max_observation_window.
+        Dropped datapoints are folded into the rollup tiers.
+
+        PARAMETERS: now_ns: Optional monotonic timestamp to use as now
         RETURNS: None
         """
+        if now_ns is None:
+            now_ns = self.clock.monotonic_ns()
+
+        store = self.data_points
+        threshold_ns = self.get_threshold_ns(now_ns=now_ns)
+
+        if self.rollup_tiers:
+            finest_tier = self.rollup_tiers[0]
+            for position in range(store.start, store.position_since(threshold_ns)):
+                finest_tier.add(
+                    store.received_at_position(position),
+                    store.response_time_at(position),
+                    store.response_code_at(position),
+                    store.phase_times_at(position),
+                    store.weight_at(position),
+                )
+
+        store.pop_older_than(threshold_ns)
+
+        self.pop_old_rollup_buckets(now_ns)
+
+    def pop_old_rollup_buckets(self, now_ns: int):
+        """
+        Folds buckets past their tier's retention into the next
+        coarser tier. The coarsest tier just drops them.
+        """
+        for tier, coarser_tier in zip(
+            self.rollup_tiers, self.rollup_tiers[1:] + [None]
+        ):
+            threshold_ns = now_ns - tier.retention_seconds * 10**9
+
+            for bucket in tier.pop_older_than(threshold_ns):
+                if coarser_tier:
+                    coarser_tier.add_bucket(bucket)
 
-        while self.is_older_than_threshold(self.data_points[0]["received_at"]):
-            self.data_points.popleft()
+    def get_rollup_stats(self, timeframe: int) -> dict:
+        """
+        Reports on a timeframe longer than the max_observation_window
+        by combining the raw datapoints held with the rollup buckets
+        covering the rest of the timeframe. Buckets straddling the
+        start of the timeframe are included whole.
+
+        PARAMETERS: timeframe: Negative integer representing
+                    the number of seconds to report on
+        RETURNS: dict
+        """
+        now_ns = self.clock.monotonic_ns()
+        threshold_ns = self.get_threshold_ns(timeframe, now_ns=now_ns)
+
+        raw_aggregate = self.register_timeframe(self.max_observation_window)
+        self.expire_old_datapoints(now_ns)
+
+        combined = RollupBucket()
+        combined.datapoint_count = raw_aggregate.datapoint_count
+        combined.available_count = raw_aggregate.available_count
+        combined.response_count = raw_aggregate.response_count
+        combined.timeout_count = raw_aggregate.timeout_count
+        combined.error_count = raw_aggregate.error_count
+        combined.response_time_sum = raw_aggregate.response_time_sum
+        combined.max_response_time = raw_aggregate.get_max_response_time()
+        combined.histogram.merge(raw_aggregate.histogram)
+
+        for phase, count in raw_aggregate.phase_time_counts.items():
+            if count:
+                combined.add_phase_time(
+                    phase,
+                    count,
+                    raw_aggregate.phase_time_sums[phase],
+                    raw_aggregate.get_max_phase_time(phase),
+                )
+
+        for tier in self.rollup_tiers:
+            for bucket in tier.yield_buckets_since(threshold_ns):
+                combined.merge(bucket)
+
+        return build_updated_stats(combined)
 
     def get_updated_stats(self, timeframe):
+        """
+        Returns availability, average, max and percentile
+        response times over the timeframe. The timeframe is registered on first
+        use, after which each report costs the same however
+        many datapoints the timeframe holds.
+
+        Timeframes longer than the max_observation_window
+        are reported on from the rollup tiers.
+
+        PARAMETERS: timeframe: Negative integer representing
+                    the number of seconds to report on
+        RETURNS: dict
+        """
+        if timeframe < self.max_observation_window and self.rollup_tiers:
+            return self.get_rollup_stats(timeframe)
 
-        updated_stats = {
-            "availability": self.get_availability(timeframe),
-            "avg_response_time": self.get_avg_response_time(timeframe),
-            "max_response_time": self.get_max_response_time(timeframe),
-        }
+        aggregate = self.register_timeframe(timeframe)
+        aggregate.evict_older_than(self.get_aggregate_threshold_ns(timeframe))
 
-        return updated_stats
+        return aggregate.get_updated_stats()
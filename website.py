@@ -1,23 +1,122 @@
 import httpx
-import datetime
-from web_stats import WebStat
+from web_stats import WebStat, AVAILABLE_CODES, PROBE_TIMEOUT, PROBE_ERROR
 import asyncio
+import collections
+import datetime
+import functools
+import urllib.parse
+from alert_store import AlertStore
+from clock import Clock
+from datapoint_store import PHASES
+from dns_cache import probe_phase_times
 from console_writer import ConsoleWriter
 from console_writer import WebPerformanceDashboard
+from scheduler import Scheduler
+
+# What a probe requests from the site:
+#   get: the whole response, as a browser would
+#   head: headers only
+#   range: the first byte of the body, answered with a 206
+#   ttfb: a GET closed as soon as the first byte of the body arrives
+PROBE_MODES = ("get", "head", "range", "ttfb")
+
+# Returned by ping_url where no finished httpx response
+# holds the time measured
+ProbeResponse = collections.namedtuple("ProbeResponse", ["status_code", "elapsed"])
+
+# Adaptive check intervals double after this many
+# probes in a row without failure or latency jump
+STABLE_PROBES_BEFORE_STRETCH = 10
+
+# A response time this many times the p99 response time
+# of the max observation window is a latency jump
+LATENCY_JUMP_FACTOR = 3
+
+# Step of an httpcore trace completing each request phase,
+# mapped to (phase, step starting it)
+PHASE_TRACE_STEPS = {
+    "connect_tcp": ("connect", "connect_tcp"),
+    "start_tls": ("tls", "start_tls"),
+    "receive_response_headers": ("ttfb", "send_request_headers"),
+    "receive_response_body": ("transfer", "receive_response_body"),
+}
 
 
 class Website:
-    def __init__(self, url=None, check_interval=None, max_observation_window=-600):
+    def __init__(
+        self,
+        url=None,
+        check_interval=None,
+        max_observation_window=-600,
+        clock=None,
+        validate=True,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        total_timeout: float = 15.0,
+        probe_mode: str = "get",
+        adaptive: bool = False,
+        max_check_interval: int = None,
+        fast_check_interval: int = None,
+        alert_history_size: int = 100,
+        alert_spill_path: str = None,
+    ):
         """
         PARAMETERS: url: String. Must include protocol prefix e.g. http://
+                    clock: Clock instance. Defaults to the real time.
+                    validate: Set to False to skip the request checking
+                    url can be reached, e.g. when already done by bulk_create
+                    connect_timeout: Seconds to wait for a connection
+                    read_timeout: Seconds to wait for each read
+                    total_timeout: Seconds a whole probe may take before
+                    it is cancelled and recorded as a timeout
+                    probe_mode: One of PROBE_MODES. Lighter modes save
+                    downloading whole pages on every check.
+                    adaptive: Set to True to stretch the check interval
+                    of a stable site up to max_check_interval, and drop
+                    it on a failure or latency jump
+                    max_check_interval: Defaults to 10 check_intervals
+                    fast_check_interval: Defaults to a fifth of
+                    check_interval
+                    alert_history_size: Max alerts kept on the dashboard
+                    alert_spill_path: Optional file older alerts
+                    are appended to as JSON lines
         """
-        # Both raise exceptions if not compliant
-        self.validate_url(url)
+        # All raise exceptions if not compliant
+        if validate:
+            self.validate_url(url)
         self.validate_check_interval(check_interval)
+        self.validate_probe_mode(probe_mode)
         self.url = url
         self.check_interval = check_interval
-        self.stats = WebStat(max_observation_window)
-        self.dashboard = WebPerformanceDashboard()
+        self.clock = clock or Clock()
+        self.stats = WebStat(max_observation_window, clock=self.clock)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.probe_mode = probe_mode
+
+        self.adaptive = adaptive
+        self.max_check_interval = max_check_interval or check_interval * 10
+        self.fast_check_interval = fast_check_interval or max(1, check_interval // 5)
+        self.stable_probe_count = 0
+        self.dashboard = WebPerformanceDashboard(
+            AlertStore(alert_history_size, alert_spill_path, clock=self.clock)
+        )
+
+        self.host = urllib.parse.urlsplit(url).hostname
+
+        # Shared httpx.AsyncClient and ProbeGovernor, injected by the App
+        self.client = None
+        self.governor = None
+
+        # Optional OutputSinks streaming probe results
+        # and reports, injected by the App
+        self.datapoint_sink = None
+        self.report_sink = None
+
+        # Websites of the same url recording this one's
+        # probes rather than probing, see ProbeRegistry
+        self.subscribers = []
 
     def validate_url(self, url):
         try:
@@ -25,13 +124,84 @@ class Website:
         except Exception:
             raise Exception("URL error")
 
-    def validate_check_interval(self, check_interval: int):
+    @classmethod
+    async def bulk_create(
+        cls,
+        candidates,
+        client: httpx.AsyncClient = None,
+        max_concurrency: int = 100,
+        deadline: float = 10,
+        **kwargs,
+    ):
+        """
+        Validates many candidate websites concurrently and creates
+        a Website instance for each one which can be reached.
+
+        PARAMETERS: candidates: Iterable of (url, check_interval) or
+                    (url, check_interval, probe_mode) tuples
+                    client: Optional httpx.AsyncClient to validate with.
+                    A temporary one is opened if not passed.
+                    max_concurrency: Max number of urls validated at once
+                    deadline: Seconds each url has to respond within
+                    kwargs: Passed on to each Website instance
+        RETURNS: (accepted, rejected) where accepted is a list of
+                 Website instances and rejected a list of
+                 (url, reason) tuples, both in candidate order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def create(client, url, check_interval, probe_mode="get"):
+            try:
+                cls.validate_check_interval(check_interval)
+                cls.validate_probe_mode(probe_mode)
+
+                async with semaphore:
+                    await asyncio.wait_for(client.get(url), timeout=deadline)
+
+            except asyncio.TimeoutError:
+                return None, (url, f"No response within {deadline} seconds")
+            except Exception as e:
+                return None, (url, str(e) or type(e).__name__)
+
+            website = cls(
+                url, check_interval, validate=False, probe_mode=probe_mode, **kwargs
+            )
+
+            return website, None
+
+        async def create_all(client):
+            return await asyncio.gather(
+                *(create(client, *candidate) for candidate in candidates)
+            )
+
+        if client is None:
+            limits = httpx.Limits(max_connections=max_concurrency)
+            async with httpx.AsyncClient(limits=limits) as client:
+                results = await create_all(client)
+        else:
+            results = await create_all(client)
+
+        accepted = [website for website, _ in results if website]
+        rejected = [rejection for _, rejection in results if rejection]
+
+        return accepted, rejected
+
+    @staticmethod
+    def validate_check_interval(check_interval: int):
         """
         Check_interval must be a +ve integer
         """
         if check_interval < 1:
             raise Exception("check_interval must be a positive integer")
 
+    @staticmethod
+    def validate_probe_mode(probe_mode: str):
+        """
+        probe_mode must be one of PROBE_MODES
+        """
+        if probe_mode not in PROBE_MODES:
+            raise Exception(f"probe_mode must be one of {', '.join(PROBE_MODES)}")
+
     def update_alert_process(self, availability: float):
         """
         Takes as availability % and sends it to the self.stats Stat
@@ -45,7 +215,7 @@ class Website:
             alert = self.stats.alert_coro.send(availability)
             if alert:
                 # Alerts are saved to the dashboard
-                self.dashboard.persisted_messages.append(alert)
+                self.dashboard.add_persisted_message(alert)
 
     async def produce_report(self, timeframe: int, writer: ConsoleWriter):
         """
@@ -61,92 +231,331 @@ class Website:
 
         updated_stats = self.stats.get_updated_stats(timeframe=timeframe)
         updated_stats["url"] = self.url
-        timestamp = datetime.datetime.now().strftime("%c")  # Local time format
+        timestamp = self.clock.now().strftime("%c")  # Local time format
         updated_stats["timestamp"] = timestamp
         updated_stats["timeframe"] = timeframe
+        updated_stats["probe_mode"] = self.probe_mode
 
         self.dashboard.data = updated_stats
 
+        if self.report_sink is not None:
+            self.report_sink.write(dict(updated_stats))
+
         # Adds alert message if needed
         self.update_alert_process(updated_stats["availability"])
 
-        # Outputs all dashboards attached to the writer
-        writer.write_dashboards_to_console()
+        # Drawn with the writer's next frame
+        writer.mark_dirty(self.dashboard)
         await asyncio.sleep(0)
 
     async def update(self):
-        r = await self.ping_url(self.url)
-        datapoint = {"response_code": r.status_code, "response_time": r.elapsed}
+        # Wait for the App's go-ahead before probing.
+        # Dropped probes are counted by the governor.
+        if self.governor is not None:
+            if not await self.governor.acquire(self.host):
+                return
+
+            try:
+                datapoint = await self.probe()
+            finally:
+                self.governor.release(self.host)
+        else:
+            datapoint = await self.probe()
+
+        # Compares the datapoint to the stats before it
+        if self.adaptive:
+            # Stands for the time since the previous probe
+            datapoint["weight"] = max(1, round(self.update_job.interval))
+            self.adapt_check_interval(datapoint)
+
+        self.record_datapoint(datapoint)
+
+        # Probing only, e.g. in a shard worker or probe agent.
+        # Nothing else feeds the alert state adaptation reads.
+        if self.adaptive and not self.report_jobs:
+            self.update_local_alert_state()
+
+        if self.datapoint_sink is not None:
+            self.datapoint_sink.write(self.get_datapoint_record(datapoint))
+
+    def get_datapoint_record(self, datapoint: dict) -> dict:
+        """
+        RETURNS: Flat dict of the datapoint for an OutputSink,
+                 with a column for every phase
+        """
+        response_time = datapoint["response_time"]
+        if isinstance(response_time, datetime.timedelta):
+            response_time = response_time.total_seconds()
+
+        record = {
+            "timestamp": self.clock.now().isoformat(),
+            "url": self.url,
+            "response_code": datapoint["response_code"],
+            "response_time": response_time,
+            # Relayed datapoints were probed in the website's mode
+            "probe_mode": datapoint.get("probe_mode", self.probe_mode),
+        }
+
+        phase_times = datapoint.get("phase_times") or {}
+        for phase in PHASES:
+            record[f"{phase}_time"] = phase_times.get(phase)
+
+        return record
+
+    def adapt_check_interval(self, datapoint: dict):
+        """
+        Stretches or shortens the interval of the update job
+        depending on the latest probe. Failures drop it to
+        fast_check_interval and latency jumps back to
+        check_interval. The interval never goes
+        over check_interval while the alert process has the
+        site down, or possibly down, so alerts aren't delayed.
+        """
+        response_time = datapoint["response_time"]
+        if isinstance(response_time, datetime.timedelta):
+            response_time = response_time.total_seconds()
+
+        recent = self.stats.register_timeframe(self.stats.max_observation_window)
+        recent_p99 = recent.histogram.get_quantile(0.99)
+
+        failed = datapoint["response_code"] not in AVAILABLE_CODES
+        latency_jump = (
+            recent_p99 is not None
+            and response_time > recent_p99 * LATENCY_JUMP_FACTOR
+        )
+
+        interval = self.update_job.interval
+
+        if failed:
+            self.stable_probe_count = 0
+            interval = self.fast_check_interval
+        elif latency_jump:
+            # Slower but up, no need to go faster than usual
+            self.stable_probe_count = 0
+            interval = min(interval, self.check_interval)
+        else:
+            self.stable_probe_count += 1
+
+            if self.stable_probe_count >= STABLE_PROBES_BEFORE_STRETCH:
+                self.stable_probe_count = 0
+                interval *= 2
+
+        if self.stats.awaiting_recovery or self.stats.site_available is False:
+            interval = min(interval, self.check_interval)
+        else:
+            interval = min(interval, self.max_check_interval)
+
+        if interval != self.update_job.interval:
+            self.scheduler.change_interval(self.update_job, interval)
+
+    def update_local_alert_state(self):
+        """
+        Sends the availability over the max_observation_window
+        of the local stats to the alert process. Only its state
+        is kept, the alerts are reported where the datapoints
+        are sent to.
+        """
+        recent = self.stats.register_timeframe(self.stats.max_observation_window)
+
+        if recent.datapoint_count:
+            self.stats.alert_coro.send(recent.available_count / recent.datapoint_count)
+
+    def record_datapoint(self, datapoint: dict):
         # Only updating stats here.
         # No query until reports are generated.
         self.stats.update(datapoint)
 
-    async def periodic_data_update_process(self):
-        """
-        Simply updates stats every check interval period
-        """
-        while True:
-            await asyncio.sleep(self.check_interval)
-            await asyncio.create_task(self.update())
+        for subscriber in self.subscribers:
+            subscriber.record_datapoint(datapoint)
 
-    async def periodic_report_production_process(
-        self, frequency: int, timeframe: int, writer: ConsoleWriter
-    ):
+    async def probe(self) -> dict:
         """
-        Coroutine to schedule a report every {frequency} seconds
-        using data over the last {timeframe} minutes.
+        Pings self.url, giving up after self.total_timeout seconds.
+        A probe which gets no HTTP response still makes a datapoint,
+        with response_code PROBE_TIMEOUT or PROBE_ERROR and the time
+        spent waiting as response_time, so hung sites show as down
+        rather than as missing data.
 
-        PARAMETERS: frequency and timeframe fixed for challenge
-                    but can be changed in 
-                    website_monitoring_application instantiation
+        RETURNS: datapoint dict
         """
-        while True:
-            await asyncio.sleep(frequency)
-            await asyncio.create_task(self.produce_report(timeframe, writer))
+        started_ns = self.clock.monotonic_ns()
+        phase_times = {}
+
+        # For the DNS lookup, done out of sight of the trace
+        token = probe_phase_times.set(phase_times)
+
+        try:
+            r = await asyncio.wait_for(
+                self.ping_url(self.url, phase_times), timeout=self.total_timeout
+            )
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            response_code = PROBE_TIMEOUT
+        except httpx.HTTPError:
+            # Transport errors, too many redirects, undecodable bodies...
+            response_code = PROBE_ERROR
+        else:
+            return {
+                "response_code": r.status_code,
+                "response_time": r.elapsed,
+                "phase_times": phase_times,
+                "probe_mode": self.probe_mode,
+            }
+        finally:
+            probe_phase_times.reset(token)
 
-    async def all_async_tasks(self, schedules: dict, writer: ConsoleWriter):
+        response_time = (self.clock.monotonic_ns() - started_ns) / 1e9
+
+        # Phases completed before giving up are still worth keeping
+        return {
+            "response_code": response_code,
+            "response_time": response_time,
+            "phase_times": phase_times,
+            "probe_mode": self.probe_mode,
+        }
+
+    def schedule_tasks(
+        self,
+        scheduler: Scheduler,
+        schedules: list,
+        writer: ConsoleWriter,
+        probe: bool = True,
+    ):
         """
-        A coroutine pulling update and reporting tasks from the queues.
+        Registers the data update and reporting jobs of
+        this website with the application's scheduler.
+        The timeframes of the schedules also set how long
+        self.stats keeps datapoints, see WebStat.plan_retention.
 
         schedules are dicts with the following format:
 
             schedule1 = {"frequency": 10, "timeframe": -600}
             schedule2 = {"frequency": 60, "timeframe": -60 * 60}
 
-        Fixed for the challenge.
+        PARAMETERS: scheduler: Scheduler instance shared by all websites
+                    schedules: list of schedule dicts
+                    writer: ConsoleWriter instance shared by all websites
+                    probe: Set to False to only report, e.g. when
+                    datapoints are received from a shard worker
         """
         # Every Website instance shares the same writer instance
         self.writer = writer
+        self.scheduler = scheduler
 
-        # Data update process
-        coros = [self.periodic_data_update_process()]
+        # Data update process. First runs are staggered by url
+        # so websites with equal check intervals don't all
+        # probe in the same tick.
+        if probe:
+            self.update_job = scheduler.schedule(
+                self.update, self.check_interval, stagger_key=self.url
+            )
+        else:
+            self.update_job = None
+
+        # Datapoints are kept for as long as reports need them
+        if schedules:
+            self.stats.plan_retention(
+                schedule["timeframe"] for schedule in schedules
+            )
 
-        # Adds task for each scheduled report
+        # Adds a job for each scheduled report
+        self.report_jobs = []
         for schedule in schedules:
 
             freq = schedule["frequency"]
             timef = schedule["timeframe"]
 
-            coros.extend(
-                [
-                    # Reporting Process
-                    self.periodic_report_production_process(freq, timef, writer)
-                ]
+            self.report_jobs.append(
+                scheduler.schedule(
+                    functools.partial(self.produce_report, timef, writer),
+                    freq,
+                    stagger_key=f"{self.url} {timef}",
+                )
             )
 
-        await asyncio.gather(*coros)
-
-    async def ping_url(self, url) -> None:
+    async def ping_url(self, url, phase_times: dict = None):
         """
         Responsible for making a single request to
         self.url after the delay and returning
         the response
 
-        PARAMETERS: delay:int, how many seconds to 
-                    wait until execution
-                    client: httpx session object
-                    url: url to ping
-        RETURNS: httpx reauest response object
+        Requests go through self.client when the App has
+        injected one, reusing its pooled connections. Otherwise
+        a client is opened just for this request.
+
+        PARAMETERS: url: url to ping
+                    phase_times: Optional dict filled with the seconds
+                    spent in each phase of the request. Phases the
+                    request didn't go through are left out.
+        RETURNS: httpx response object or ProbeResponse, whose
+                 elapsed is the time taken by what self.probe_mode
+                 requested
         """
+        if self.client is not None:
+            return await self.request(self.client, url, phase_times)
+
         async with httpx.AsyncClient() as client:
-            return await client.get(url, timeout=None)
+            return await self.request(client, url, phase_times)
+
+    async def request(
+        self, client: httpx.AsyncClient, url: str, phase_times: dict = None
+    ):
+        kwargs = {
+            "timeout": httpx.Timeout(
+                None, connect=self.connect_timeout, read=self.read_timeout
+            )
+        }
+
+        if phase_times is not None:
+            kwargs["extensions"] = {"trace": self.get_trace(phase_times)}
+
+        if self.probe_mode == "head":
+            return await client.head(url, **kwargs)
+
+        if self.probe_mode == "range":
+            return await client.get(url, headers={"Range": "bytes=0-0"}, **kwargs)
+
+        if self.probe_mode == "ttfb":
+            started_ns = self.clock.monotonic_ns()
+
+            async with client.stream("GET", url, **kwargs) as r:
+                # Stop at the first chunk, the rest is never read
+                async for _ in r.aiter_raw():
+                    break
+
+                elapsed_ns = self.clock.monotonic_ns() - started_ns
+
+            return ProbeResponse(
+                r.status_code, datetime.timedelta(microseconds=elapsed_ns // 1000)
+            )
+
+        return await client.get(url, **kwargs)
+
+    def get_trace(self, phase_times: dict):
+        """
+        RETURNS: Callback for the httpx "trace" request extension,
+                 timing each phase of the request into phase_times.
+                 httpcore calls it as each step starts and completes.
+        """
+        started_ns = {}
+
+        async def trace(event_name: str, info: dict):
+            # e.g. "http11.receive_response_headers.complete"
+            step, _, stage = event_name.rpartition(".")
+            step = step.rpartition(".")[2]
+
+            if stage == "started":
+                started_ns[step] = self.clock.monotonic_ns()
+
+            elif stage == "complete" and step in PHASE_TRACE_STEPS:
+                phase, start_step = PHASE_TRACE_STEPS[step]
+
+                if start_step in started_ns:
+                    elapsed_ns = self.clock.monotonic_ns() - started_ns[start_step]
+                    phase_times[phase] = elapsed_ns / 1e9
+
+                # connect_tcp includes the DNS lookup when
+                # a CachingNetworkBackend timed it
+                if phase == "connect" and "dns" in phase_times:
+                    phase_times[phase] -= phase_times["dns"]
+
+        return trace
@@ -1,21 +1,104 @@
 import asyncio
+import httpx
 from website import Website
 from console_writer import ConsoleWriter
+from scheduler import Scheduler
+from probe_governor import ProbeGovernor
+from dns_cache import DNSCache, install_caching_backend
+from probe_registry import ProbeRegistry
+from metrics_server import MetricsServer
+from output_sink import OutputSink
+import argparse
 import sys
 import signal
 import functools
 
 
 class App:
-    def __init__(self):
+    def __init__(
+        self,
+        websites: list = None,
+        console_writer: ConsoleWriter = None,
+        websites_file: str = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        http2: bool = False,
+        max_in_flight: int = 100,
+        max_per_host: int = 6,
+        max_probe_queue: int = 1000,
+        dns_ttl: float = 300,
+        dns_cache_size: int = 10000,
+        metrics_port: int = None,
+        metrics_host: str = "127.0.0.1",
+        datapoint_sink: OutputSink = None,
+        report_sink: OutputSink = None,
+    ):
+        """
+        PARAMETERS: websites: Optional list of Website instances
+                    to monitor. The user is asked for websites
+                    if not passed.
+                    console_writer: Optional ConsoleWriter instance
+                    websites_file: Optional path to a file listing
+                    websites to monitor, one "<url> <check_interval>"
+                    per line. Validated concurrently rather than
+                    asking the user.
+                    max_connections, max_keepalive_connections:
+                    Pool limits of the HTTP client shared by all websites
+                    http2: Negotiate HTTP/2 where servers support it.
+                    Requires the h2 package.
+                    max_in_flight, max_per_host, max_probe_queue:
+                    Limits of the ProbeGovernor shared by all websites
+                    dns_ttl, dns_cache_size: Settings of the DNSCache
+                    the shared HTTP client resolves hostnames with
+                    metrics_port, metrics_host: Runs headless, serving
+                    reports at /metrics on this address rather than
+                    writing to the console
+                    datapoint_sink, report_sink: Optional OutputSinks
+                    every probe result and report is written to.
+                    Closed when monitoring stops.
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.http2 = http2
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.max_probe_queue = max_probe_queue
+
+        # Outlives HTTP clients, so lookups made while
+        # validating websites are reused by probes
+        self.dns_cache = DNSCache(ttl=dns_ttl, max_size=dns_cache_size)
+
+        self.datapoint_sink = datapoint_sink
+        self.report_sink = report_sink
+
+        # Created when monitoring starts, closed when it stops
+        self.http_client = None
+        self.probe_governor = None
+        self.scheduler = None
+        self.probe_registry = None
 
         # Single instance of ConsoleWriter for application.
         # Only object writing to the console
-        self.console_writer = ConsoleWriter()
+        if console_writer is None and metrics_port is not None:
+            console_writer = MetricsServer(
+                metrics_host, metrics_port, probe_stats=self.get_probe_stats
+            )
+
+        self.console_writer = console_writer or ConsoleWriter()
         self.console_writer.greet()
 
-        # User input
-        self.websites_to_monitor = self.get_websites_to_monitor()
+        if websites_file:
+            self.websites_to_monitor = []
+            candidates, rejected = self.read_websites_file(websites_file)
+            asyncio.run(self.register_websites(candidates, rejected=rejected))
+
+        elif websites is None:
+            # User input
+            self.websites_to_monitor = self.get_websites_to_monitor()
+        else:
+            self.websites_to_monitor = websites
+            for website in websites:
+                self.console_writer.add_dashboard(website.dashboard)
 
     async def attach_shutdown_signals(self):
         # Only functional in linux
@@ -35,17 +118,19 @@ class App:
         Shutdown function. Called automatically on 
         linux devices on console termination. API not implemented for Windows.
 
+        Cancelling the tasks lets monitor_websites close the
+        shared HTTP client before the loop stops.
+
         PARAMETERS: loop, the current event loop.
         """
 
-        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        tasks = [
+            t for t in asyncio.all_tasks(loop) if t is not asyncio.current_task(loop)
+        ]
 
         for task in tasks:
             task.cancel()
 
-        asyncio.gather(*tasks)
-        loop.stop()
-
     def start_app(self, schedules):
 
         # Reporting frequency and timeframe
@@ -55,6 +140,9 @@ class App:
         # highest level coroutine in the app
         try:
             asyncio.run(self.monitor_websites())
+        except asyncio.CancelledError:
+            # Cancelled by self.shutdown
+            pass
         except KeyboardInterrupt:
             # Only rough shutdown for Windows
             pass
@@ -85,6 +173,84 @@ class App:
 
         return websites
 
+    def read_websites_file(self, path: str) -> list:
+        """
+        Reads (url, check_interval) candidates from a file
+        with one "<url> <check_interval>" per line. A probe mode
+        can follow the interval, e.g. "<url> 5 head". Blank lines
+        and lines starting with # are skipped.
+
+        RETURNS: (candidates, rejected) where candidates is a list
+                 of (url, check_interval) or (url, check_interval,
+                 probe_mode) tuples and rejected a list of
+                 (url, reason) tuples of the malformed lines
+        """
+        candidates = []
+        rejected = []
+
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+
+                url, *fields = line.split()
+
+                if not fields:
+                    rejected.append((url, "No check_interval given"))
+                    continue
+
+                check_interval, *probe_mode = fields
+
+                try:
+                    check_interval = int(check_interval)
+                except ValueError:
+                    rejected.append((url, "check_interval must be a positive integer"))
+                    continue
+
+                candidates.append((url.lower(), check_interval, *probe_mode))
+
+        return candidates, rejected
+
+    async def register_websites(
+        self, candidates, max_concurrency=100, deadline=10, rejected=()
+    ):
+        """
+        Validates all candidate websites concurrently, adding the
+        accepted ones to the monitoring list.
+
+        PARAMETERS: candidates: Iterable of candidate tuples as
+                    returned by read_websites_file
+                    max_concurrency: Max number of urls validated at once
+                    deadline: Seconds each url has to respond within
+                    rejected: (url, reason) tuples rejected already,
+                    e.g. by read_websites_file
+        RETURNS: (accepted, rejected) as returned by Website.bulk_create,
+                 rejected starting with those passed in
+        """
+        rejected = list(rejected)
+
+        async with self.create_http_client() as client:
+            accepted, bulk_rejected = await Website.bulk_create(
+                candidates,
+                client=client,
+                max_concurrency=max_concurrency,
+                deadline=deadline,
+            )
+
+        rejected.extend(bulk_rejected)
+
+        for website in accepted:
+            self.websites_to_monitor.append(website)
+            self.console_writer.add_dashboard(website.dashboard)
+
+        for url, reason in rejected:
+            print(f"I wasn't able to add {url}: {reason}")
+
+        print(f"{len(accepted)} websites added to the monitoring list")
+
+        return accepted, rejected
+
     def create_website(self):
         """
         Creates an instance of the Website class based on
@@ -170,22 +336,111 @@ class App:
                 continue
         return check_interval
 
+    def create_http_client(self) -> httpx.AsyncClient:
+        """
+        Returns the keep-alive, pooled client shared by every
+        Website, so probes reuse connections rather than paying
+        for DNS, TCP and TLS handshakes on each request. New
+        connections resolve hostnames through self.dns_cache.
+        """
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+        )
+        transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        install_caching_backend(transport, self.dns_cache)
+
+        return httpx.AsyncClient(transport=transport)
+
     async def monitor_websites(self):
         """
         Collects all coroutines in to a 
         list and creates tasks to run them
         in the existing event loop.
         """
+        self.http_client = self.create_http_client()
+        self.probe_governor = ProbeGovernor(
+            self.max_in_flight, self.max_per_host, self.max_probe_queue
+        )
+
+        for website in self.websites_to_monitor:
+            website.client = self.http_client
+            website.governor = self.probe_governor
+
+        self.attach_sinks()
+
+        try:
+            await self.run_website_tasks()
+        finally:
+            await self.http_client.aclose()
+            await self.close_sinks()
+
+    def attach_sinks(self):
+        for website in self.websites_to_monitor:
+            website.datapoint_sink = self.datapoint_sink
+            website.report_sink = self.report_sink
 
-        # website.all_async_tasks kicks off all
-        # async processes necessary to monitor
-        # and report on that website instance
-        coros = [
-            asyncio.create_task(
-                website.all_async_tasks(self.schedules, self.console_writer)
+    async def close_sinks(self):
+        """
+        Waits for the sinks and the alert stores to write
+        what they hold, off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        for sink in (self.datapoint_sink, self.report_sink):
+            if sink is not None:
+                await loop.run_in_executor(None, sink.close)
+
+        for website in self.websites_to_monitor:
+            alert_store = website.dashboard.persisted_messages
+            if alert_store.spill_buffer:
+                await loop.run_in_executor(None, alert_store.flush)
+
+    def get_probe_stats(self) -> dict:
+        """
+        Counters to size the process for a given number of sites.
+
+        RETURNS: dict of ProbeGovernor stats plus the number
+                 of scheduled runs skipped because the previous
+                 one was still going, the DNSCache stats and
+                 the ProbeRegistry stats
+        """
+        probe_stats = self.probe_governor.get_stats()
+        probe_stats["skipped"] = self.scheduler.overrun_count
+        probe_stats["dns"] = self.dns_cache.get_stats()
+        probe_stats["coalescing"] = self.probe_registry.get_stats()
+        return probe_stats
+
+    def schedule_websites(self, schedules: list):
+        """
+        Registers the jobs of every website with self.scheduler.
+        Websites of the same url share one website's probes.
+        """
+        self.probe_registry = ProbeRegistry()
+
+        for website in self.websites_to_monitor:
+            self.probe_registry.subscribe(website)
+
+        # website.schedule_tasks registers all
+        # jobs necessary to monitor and report
+        # on that website instance
+        for website in self.websites_to_monitor:
+            website.schedule_tasks(
+                self.scheduler,
+                schedules,
+                self.console_writer,
+                probe=self.probe_registry.is_prober(website),
             )
-            for website in self.websites_to_monitor
-        ]
+
+    async def run_website_tasks(self):
+        """
+        Runs the monitoring and reporting jobs
+        of every website until cancelled.
+        """
+        self.scheduler = Scheduler()
+        self.schedule_websites(self.schedules)
+
+        coros = [self.scheduler.run(), self.console_writer.render_loop()]
 
         print(f"Beginning website monitoring...")
 
@@ -198,12 +453,49 @@ class App:
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Monitors websites.")
+    parser.add_argument("websites_file", nargs="?", default=None)
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve reports at /metrics on this port instead of the console",
+    )
+    parser.add_argument(
+        "--datapoints",
+        default=None,
+        help="Stream probe results to this file, as CSV if it ends in .csv"
+        + " else JSON lines. - for stdout, with --metrics-port only.",
+    )
+    parser.add_argument(
+        "--reports",
+        default=None,
+        help="Stream reports to this file, formatted as --datapoints",
+    )
+    args = parser.parse_args()
+
+    def get_sink(path):
+        if path is None:
+            return None
+
+        # The console redraws stdout in place
+        if path == "-" and args.metrics_port is None:
+            parser.error("Streaming to stdout needs --metrics-port")
+
+        return OutputSink(None if path == "-" else path)
+
     # Define reporting schedules (in seconds))
     schedule1 = {"frequency": 10, "timeframe": -600}
     schedule2 = {"frequency": 60, "timeframe": -60 * 60}
     schedules = [schedule1, schedule2]
 
-    # Instantiate app
-    app = App()
+    # Instantiate app. Websites are read from a file
+    # if its path is given, else the user is asked.
+    app = App(
+        websites_file=args.websites_file,
+        metrics_port=args.metrics_port,
+        datapoint_sink=get_sink(args.datapoints),
+        report_sink=get_sink(args.reports),
+    )
     app.start_app(schedules=schedules)
 
@@ -1,8 +1,207 @@
+import asyncio
+import httpx
 import pytest
 from website import Website
+from web_stats import PROBE_TIMEOUT, PROBE_ERROR
 
 
 def test_bad_url_on_init_raises_exception():
 
     with pytest.raises(Exception):
         website = Website()
+
+
+def test_ping_url_uses_injected_client(offline_website):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200)
+
+    offline_website.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    response = asyncio.run(offline_website.ping_url(offline_website.url))
+
+    assert response.status_code == 200
+    assert [str(r.url) for r in requests] == ["http://example.com"]
+
+
+def test_bulk_create_accepts_and_rejects_candidates(mock_client):
+    candidates = [
+        ("http://up.example", 5),
+        ("http://down.example", 5),
+        ("http://slow.example", 5),
+        ("http://up.example", 0),
+    ]
+
+    accepted, rejected = asyncio.run(
+        Website.bulk_create(candidates, client=mock_client, deadline=0.1)
+    )
+
+    assert [w.url for w in accepted] == ["http://up.example"]
+    assert [url for url, _ in rejected] == [
+        "http://down.example",
+        "http://slow.example",
+        "http://up.example",
+    ]
+    assert rejected[1][1] == "No response within 0.1 seconds"
+
+
+def test_malformed_lines_of_websites_file_are_rejected(
+    simulated_app, mock_client, tmp_path
+):
+    path = tmp_path / "websites.txt"
+    path.write_text(
+        "# url interval\n"
+        "http://up.example 5\n"
+        "http://missing.example\n"
+        "http://typo.example 5s head\n"
+        "http://head.example 5 head\n"
+    )
+
+    candidates, rejected = simulated_app.read_websites_file(str(path))
+
+    assert candidates == [("http://up.example", 5), ("http://head.example", 5, "head")]
+    assert [url for url, _ in rejected] == [
+        "http://missing.example",
+        "http://typo.example",
+    ]
+
+    # Reported along with the urls which can't be reached
+    simulated_app.create_http_client = lambda: mock_client
+    accepted, rejected = asyncio.run(
+        simulated_app.register_websites(candidates, rejected=rejected)
+    )
+
+    assert len(accepted) == 2
+    assert [url for url, _ in rejected] == [
+        "http://missing.example",
+        "http://typo.example",
+    ]
+
+
+def test_bulk_create_validates_concurrently(mock_client):
+    candidates = [("http://slow.example", 5)] * 20
+
+    # 20 slow urls in parallel fit in a single deadline
+    accepted, rejected = asyncio.run(
+        Website.bulk_create(
+            candidates, client=mock_client, max_concurrency=20, deadline=2
+        )
+    )
+
+    assert len(accepted) == 20
+
+
+def test_probe_records_timeout(offline_website, mock_client):
+    offline_website.url = "http://slow.example"
+    offline_website.client = mock_client
+    offline_website.total_timeout = 0.1
+
+    datapoint = asyncio.run(offline_website.probe())
+
+    assert datapoint["response_code"] == PROBE_TIMEOUT
+    assert datapoint["response_time"] >= 0.1
+
+
+def test_probe_records_transport_error(offline_website, mock_client):
+    offline_website.url = "http://down.example"
+    offline_website.client = mock_client
+
+    datapoint = asyncio.run(offline_website.probe())
+
+    assert datapoint["response_code"] == PROBE_ERROR
+
+
+def test_probe_records_other_http_errors(offline_website):
+    def handler(request):
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects")
+
+    offline_website.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    datapoint = asyncio.run(offline_website.probe())
+
+    assert datapoint["response_code"] == PROBE_ERROR
+
+
+@pytest.mark.parametrize(
+    "probe_mode, method, range_header",
+    [
+        ("get", "GET", None),
+        ("head", "HEAD", None),
+        ("range", "GET", "bytes=0-0"),
+        ("ttfb", "GET", None),
+    ],
+)
+def test_ping_url_requests_what_probe_mode_needs(
+    offline_website, probe_mode, method, range_header
+):
+    requests = []
+
+    async def body():
+        for _ in range(10):
+            yield b"x" * 10000
+
+    def handler(request):
+        requests.append(request)
+        status_code = 206 if "range" in request.headers else 200
+        # Streamed like a real response, not preloaded
+        return httpx.Response(status_code, content=body())
+
+    offline_website.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    offline_website.probe_mode = probe_mode
+
+    response = asyncio.run(offline_website.ping_url(offline_website.url))
+
+    assert requests[0].method == method
+    assert requests[0].headers.get("range") == range_header
+    assert response.status_code == (206 if range_header else 200)
+    assert response.elapsed is not None
+
+    datapoint = asyncio.run(offline_website.probe())
+
+    assert datapoint["probe_mode"] == probe_mode
+    assert offline_website.get_datapoint_record(datapoint)["probe_mode"] == probe_mode
+
+
+def test_bad_probe_mode_raises_exception(offline_website):
+
+    with pytest.raises(Exception):
+        Website.validate_probe_mode("post")
+
+
+def test_probe_times_request_phases(offline_website):
+
+    async def body():
+        yield b"x"
+
+    async def handler(request):
+        # Stands in for httpcore, calling the trace extension
+        trace = request.extensions["trace"]
+        for step in ["connect_tcp", "send_request_headers", "receive_response_headers"]:
+            await trace(f"http11.{step}.started", {})
+            await trace(f"http11.{step}.complete", {})
+
+        return httpx.Response(200, content=body())
+
+    offline_website.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    datapoint = asyncio.run(offline_website.probe())
+
+    assert set(datapoint["phase_times"]) == {"connect", "ttfb"}
+    assert datapoint["phase_times"]["ttfb"] >= 0
+
+
+def test_alert_history_settings_reach_dashboard(virtual_clock, tmp_path):
+    spill_path = str(tmp_path / "alerts.jsonl")
+    website = Website(
+        "http://example.com",
+        5,
+        clock=virtual_clock,
+        validate=False,
+        alert_history_size=3,
+        alert_spill_path=spill_path,
+    )
+    store = website.dashboard.persisted_messages
+
+    assert store.max_size == 3
+    assert store.spill_path == spill_path
+    assert store.clock is virtual_clock